@@ -0,0 +1,289 @@
+from __future__ import annotations
+import asyncio
+import math
+from functools import partial
+from typing import Optional
+import aiohttp
+from utils.diff_utils import build_compact_diff
+from utils.blob_fetcher import BlobFetcher
+from utils.github_http import GithubHttpClient
+from utils.request_scheduler import PRIORITY_NORMAL
+from utils.telemetry import span, traced
+from models import Repository,PullRequest,ChangeStatus,CompactChangeFile,CompactDiff
+from models.change_file import GITHUB_STATUS_MAPPING
+from cache import DiffCache
+
+
+class AsyncGithubRetriever():
+    """Github retriever fetching the pull request and all file pages concurrently.
+
+    Builds the same models as GithubRetriever, with the raw REST json dicts
+    kept in `raw` instead of PyGithub objects. Use `create` to construct.
+    """
+
+    MAX_FILES = 3000
+    """Github stops listing pull request files after this many."""
+
+    MAX_COMPARE_FILES = 300
+    """Github stops listing compared files after this many."""
+
+    def __init__(
+        self,
+        repository: Repository,
+        pull_request: PullRequest,
+        source_repository: Repository,
+        client: Optional[GithubHttpClient] = None,
+        diff_cache: Optional[DiffCache] = None,
+        truncated_paths: Optional[set[str]] = None,
+    ):
+        self._repository = repository
+        self._pull_request = pull_request
+        self._source_repository = source_repository
+        self._client = client
+        self._diff_cache = diff_cache
+        self._truncated_paths = truncated_paths or set()
+        """Changed files whose patch Github left out, diffed from blobs when prefetched."""
+
+    @classmethod
+    @traced("retrieve", retriever="rest")
+    async def create(
+        cls,
+        client: GithubHttpClient,
+        repository_full_name: str,
+        pull_request_number: int,
+        diff_cache: Optional[DiffCache] = None,
+        priority: int = PRIORITY_NORMAL,
+    ) -> AsyncGithubRetriever:
+        """Fetch repository, pull request and changed files, then build the retriever.
+
+        When `diff_cache` is given, files whose blob was already parsed
+        against the same base commit are loaded from it instead. `priority`
+        is the request scheduler priority of the fetches.
+        """
+        repo_path = f"/repos/{repository_full_name}"
+        files_path = f"{repo_path}/pulls/{pull_request_number}/files"
+
+        # The first file page does not depend on the pull request, so it is
+        # fetched together with it; the remaining pages are sized from
+        # `changed_files` and fetched all at once.
+        git_repo, git_pr, first_page = await asyncio.gather(
+            client.get_json(repo_path, priority=priority),
+            client.get_json(f"{repo_path}/pulls/{pull_request_number}", priority=priority),
+            client.get_page(files_path, 1, priority=priority),
+        )
+        file_count = min(git_pr.get("changed_files", 0), cls.MAX_FILES)
+        page_count = math.ceil(file_count / client.PER_PAGE)
+        git_files = first_page + await client.get_pages(
+            files_path, range(2, page_count + 1), priority=priority
+        )
+
+        repository = cls._build_repository(git_repo)
+        head_repo = git_pr["head"].get("repo")
+        if head_repo is not None and head_repo["id"] != git_repo["id"]:
+            source_repository = cls._build_repository(head_repo)
+        else:
+            source_repository = repository
+
+        pull_request = cls._build_pull_request(
+            git_pr, git_files, repository, source_repository, diff_cache
+        )
+        # Github leaves out the patch of binary and large files.
+        truncated_paths = {
+            git_file["filename"]
+            for git_file in git_files
+            if not git_file.get("patch") and git_file.get("changes", 0) > 0
+        }
+        return cls(
+            repository, pull_request, source_repository, client, diff_cache, truncated_paths
+        )
+
+    @property
+    def repository(self) -> Repository:
+        return self._repository
+
+    @property
+    def pull_request(self) -> PullRequest:
+        return self._pull_request
+
+    @property
+    def source_repository(self) -> Repository:
+        """Get the source repository (fork) if different from base repository."""
+        return self._source_repository
+
+    @traced("retrieve.compare", retriever="rest")
+    async def get_changed_paths_since(self, commit_sha: str) -> Optional[set[str]]:
+        """Get paths changed between `commit_sha` and the pull request head.
+
+        Returns None when the change set cannot be trusted: the head is not a
+        fast-forward of `commit_sha` (e.g. after a force push), the commit is
+        gone, or the comparison is too large to be listed completely.
+        """
+        head_sha = self._pull_request.raw["head"]["sha"]
+        try:
+            comparison = await self._client.get_json(
+                f"/repos/{self._repository.repository_full_name}"
+                f"/compare/{commit_sha}...{head_sha}"
+            )
+        except aiohttp.ClientResponseError:
+            return None
+
+        files = comparison.get("files", [])
+        if comparison["status"] not in ("ahead", "identical"):
+            return None
+        if len(files) >= self.MAX_COMPARE_FILES:
+            return None
+
+        changed_paths = set()
+        for git_file in files:
+            changed_paths.add(git_file["filename"])
+            if git_file.get("previous_filename"):
+                changed_paths.add(git_file["previous_filename"])
+        return changed_paths
+
+    def blob_source(self) -> BlobFetcher:
+        """Reads the repository's trees and blobs, e.g. for a ContextIndex."""
+        return BlobFetcher(self._client, self._repository.repository_full_name)
+
+    @traced("retrieve.prefetch", retriever="rest")
+    async def prefetch_diff_contents(
+        self, change_files: Optional[list[CompactChangeFile]] = None
+    ) -> None:
+        """Load the diffs of `change_files` (default all) that are not loaded yet.
+
+        Diffs are otherwise loaded on first access; prefetching loads the
+        ones about to be used in one batch, off the event loop. Files whose
+        patch Github left out are diffed from their base and head blobs,
+        which only happens here.
+        """
+        if change_files is None:
+            change_files = self._pull_request.change_files
+        pending = [cf for cf in change_files if not cf.diff_loaded]
+        truncated = [cf for cf in pending if cf.full_name in self._truncated_paths]
+        if truncated and self._client is not None:
+            await self._fetch_truncated_diffs(truncated)
+        pending = [cf for cf in pending if not cf.diff_loaded]
+        if pending:
+            await asyncio.to_thread(lambda: [cf.diff_content for cf in pending])
+
+    async def _fetch_truncated_diffs(self, change_files: list[CompactChangeFile]) -> None:
+        base_sha = self._pull_request.raw["base"]["sha"]
+        missing = []
+        for change_file in change_files:
+            cached = None
+            if self._diff_cache is not None:
+                cached = self._diff_cache.get_diff_content(
+                    base_sha, change_file.sha, change_file.full_name
+                )
+            if cached is not None:
+                change_file.diff_content = cached
+            else:
+                missing.append(change_file)
+
+        fetcher = BlobFetcher(self._client, self._repository.repository_full_name)
+        async for change_file, diff_content in fetcher.iter_diffs(missing, base_sha):
+            change_file.diff_content = diff_content
+            self._truncated_paths.discard(change_file.full_name)
+            if self._diff_cache is not None:
+                self._diff_cache.put_diff_content(
+                    base_sha, change_file.sha, change_file.full_name, diff_content
+                )
+
+    @staticmethod
+    def _build_repository(git_repo: dict) -> Repository:
+        """Build a Repository object from a REST repository dict."""
+        return Repository(
+            repository_id=git_repo["id"],
+            repository_name=git_repo["name"],
+            repository_full_name=git_repo["full_name"],
+            repository_url=git_repo["html_url"],
+            raw=git_repo,
+        )
+
+    @classmethod
+    def _build_pull_request(
+        cls,
+        git_pr: dict,
+        git_files: list[dict],
+        repository: Repository,
+        source_repository: Repository,
+        diff_cache: Optional[DiffCache] = None,
+    ) -> PullRequest:
+        # Shared by all change files.
+        start_commit_sha = bytes.fromhex(git_pr["base"]["sha"])
+        end_commit_sha = bytes.fromhex(git_pr["head"]["sha"])
+        change_files = [
+            cls._build_change_file(
+                git_file, git_pr, start_commit_sha, end_commit_sha, diff_cache
+            )
+            for git_file in git_files
+        ]
+
+        return PullRequest(
+            pull_request_id=git_pr["id"],
+            repository_id=source_repository.repository_id,
+            pull_request_number=git_pr["number"],
+            title=git_pr["title"],
+            body=git_pr["body"] if git_pr["body"] is not None else "",
+            url=git_pr["html_url"],
+            repository_name=source_repository.repository_full_name,
+            change_files=change_files,
+            repository=repository,
+            source_repository=source_repository,
+            raw=git_pr,
+        )
+
+    @classmethod
+    def _build_change_file(
+        cls,
+        git_file: dict,
+        git_pr: dict,
+        start_commit_sha: bytes,
+        end_commit_sha: bytes,
+        diff_cache: Optional[DiffCache] = None,
+    ) -> CompactChangeFile:
+        full_name = git_file["filename"]
+
+        return CompactChangeFile(
+            blob_sha=bytes.fromhex(git_file["sha"]),
+            full_name=full_name,
+            source_full_name=git_file.get("previous_filename") or full_name,
+            status=cls._convert_status(git_file["status"]),
+            pull_request_id=git_pr["id"],
+            start_commit_sha=start_commit_sha,
+            end_commit_sha=end_commit_sha,
+            diff_url=f"{git_pr['html_url']}/files#diff-{git_file['sha']}",
+            blob_url=git_file.get("blob_url") or "",
+            diff_loader=partial(
+                cls._parse_and_build_diff_content,
+                git_file.get("patch"),
+                git_pr["base"]["sha"],
+                git_file["sha"],
+                full_name,
+                diff_cache,
+            ),
+        )
+
+    @staticmethod
+    def _convert_status(git_status: str) -> ChangeStatus:
+        return ChangeStatus(GITHUB_STATUS_MAPPING.get(git_status, "X"))
+
+    @staticmethod
+    def _parse_and_build_diff_content(
+        patch: Optional[str],
+        base_sha: str,
+        blob_sha: str,
+        path: str,
+        diff_cache: Optional[DiffCache] = None,
+    ) -> CompactDiff:
+        if diff_cache is not None:
+            cached = diff_cache.get_diff_content(base_sha, blob_sha, path)
+            if cached is not None:
+                return cached
+
+        with span("parse", path=path, patch_bytes=len(patch) if patch else 0):
+            diff_content = build_compact_diff(patch)
+
+        # A missing patch is not cached, so a diff built from blobs can be.
+        if diff_cache is not None and patch:
+            diff_cache.put_diff_content(base_sha, blob_sha, path, diff_content)
+        return diff_content
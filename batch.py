@@ -0,0 +1,266 @@
+"""Review many pull requests across repositories in one process.
+
+Usage:
+    python batch.py owner/repo#12 owner/other#34
+    python batch.py --query "org:acme is:open updated:>2024-01-01"
+    python batch.py --file targets.txt --report report.json
+
+All reviews share one HTTP session, one LLM client and the diff, response
+and comment caches. Retrieval and analysis are separate pipeline stages with
+their own concurrency limits, so the next pull requests are fetched while
+earlier ones are being analyzed.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+from dotenv import load_dotenv
+from github import Github
+from cache import CommentIndex, ContextCache, DiffCache, LLMCache, ResponseCache
+from main import build_llm, retrieve_review_job, run_review_job
+from pr_summary.code_summary import DEFAULT_MAX_CONCURRENCY
+from processors import PromptPacker
+from processors.prompt_packer import DEFAULT_TOKEN_BUDGET, DEFAULT_FILE_TOKEN_BUDGET
+from utils.github_http import GithubHttpClient
+from utils.telemetry import TELEMETRY_ENV, telemetry
+from utils.request_scheduler import PRIORITY_LOW
+
+TARGET_PATTERN = re.compile(r"^(?P<repo>[\w.-]+/[\w.-]+)#(?P<number>\d+)$")
+
+
+@dataclass(frozen=True)
+class ReviewTarget:
+    repo_full_name: str
+    pr_number: int
+
+    def __str__(self) -> str:
+        return f"{self.repo_full_name}#{self.pr_number}"
+
+    @classmethod
+    def parse(cls, text: str) -> ReviewTarget:
+        """Parse an `owner/repo#number` target."""
+        match = TARGET_PATTERN.match(text.strip())
+        # Names are used as paths, e.g. of the repository's git mirror.
+        if match is None or any(
+            part in (".", "..") for part in match.group("repo").split("/")
+        ):
+            raise ValueError(f"Invalid target {text!r}, expected owner/repo#number.")
+        return cls(match.group("repo"), int(match.group("number")))
+
+
+@dataclass
+class ReviewResult:
+    target: str
+    status: str
+    """One of "reviewed", "skipped" (head already reviewed) or "failed"."""
+    seconds: float
+    error: Optional[str] = None
+
+
+def search_targets(gh: Github, query: str) -> list[ReviewTarget]:
+    """Find pull requests matching a Github issue search query."""
+    if "is:pr" not in query:
+        query = f"{query} is:pr"
+    return [
+        ReviewTarget(issue.repository.full_name, issue.number)
+        for issue in gh.search_issues(query)
+    ]
+
+
+async def review_targets(
+    http_client: GithubHttpClient,
+    targets: list[ReviewTarget],
+    retrieve_concurrency: int = 8,
+    analyze_concurrency: int = 4,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    packer: Optional[PromptPacker] = None,
+    diff_cache: Optional[DiffCache] = None,
+    bot_username: Optional[str] = None,
+    incremental: bool = True,
+    comment_index: Optional[CommentIndex] = None,
+    mirror_root: Optional[Path] = None,
+    llm_cache: Optional[LLMCache] = None,
+    routing: bool = True,
+    progress_interval: Optional[float] = None,
+    inline_comments: bool = True,
+    context_cache: Optional[ContextCache] = None,
+) -> list[ReviewResult]:
+    """Review all targets, returning one result per target in target order.
+
+    A failure is recorded in its result and does not stop the other reviews.
+    Reads are scheduled at low priority, so comment writes go first.
+    Retrieval runs at most `analyze_concurrency` jobs ahead of analysis,
+    so retrieved pull requests are not held in memory, going stale, while
+    they wait.
+    """
+    llm = build_llm(llm_cache)
+    retrieve_semaphore = asyncio.Semaphore(retrieve_concurrency)
+    analyze_semaphore = asyncio.Semaphore(analyze_concurrency)
+    # Held from retrieval to the end of analysis.
+    pipeline_semaphore = asyncio.Semaphore(2 * analyze_concurrency)
+
+    async def review(target: ReviewTarget) -> ReviewResult:
+        start = time.monotonic()
+        try:
+            async with pipeline_semaphore:
+                return await retrieve_and_analyze(target, start)
+        except Exception as e:
+            return ReviewResult(
+                str(target), "failed", time.monotonic() - start, f"{type(e).__name__}: {e}"
+            )
+
+    async def retrieve_and_analyze(target: ReviewTarget, start: float) -> ReviewResult:
+        async with retrieve_semaphore:
+            job = await retrieve_review_job(
+                http_client,
+                target.repo_full_name,
+                target.pr_number,
+                bot_username,
+                diff_cache,
+                incremental,
+                PRIORITY_LOW,
+                comment_index,
+                mirror_root,
+                routing,
+            )
+        if job is None:
+            return ReviewResult(str(target), "skipped", time.monotonic() - start)
+
+        async with analyze_semaphore:
+            await run_review_job(
+                job,
+                llm,
+                http_client,
+                diff_cache,
+                packer,
+                max_concurrency,
+                comment_index,
+                progress_interval,
+                inline_comments,
+                context_cache,
+            )
+        return ReviewResult(str(target), "reviewed", time.monotonic() - start)
+
+    return list(await asyncio.gather(*(review(target) for target in targets)))
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("targets", nargs="*", help="pull requests as owner/repo#number")
+    parser.add_argument("--file", help="file with one owner/repo#number target per line")
+    parser.add_argument("--query", help="Github search query selecting pull requests")
+    parser.add_argument("--retrieve-concurrency", type=int, default=8)
+    parser.add_argument("--analyze-concurrency", type=int, default=4)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help="per pull request concurrent file summaries")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET)
+    parser.add_argument("--file-token-budget", type=int, default=DEFAULT_FILE_TOKEN_BUDGET)
+    parser.add_argument("--full", action="store_true",
+                        help="review every file even if the head was reviewed before")
+    parser.add_argument("--report", help="write per pull request results to this json file")
+    parser.add_argument("--mirror-dir", type=Path,
+                        help="read change files from local git mirrors kept in this directory")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="always ask the LLM instead of reusing cached responses")
+    parser.add_argument("--no-routing", action="store_true",
+                        help="send every file to the main model, ignoring repository routing settings")
+    parser.add_argument("--progress-interval", type=float,
+                        help="post file summaries to the comment as they complete, "
+                             "at most once per this many seconds")
+    parser.add_argument("--no-inline-comments", action="store_true",
+                        help="list findings in the review comment instead of on the diff lines")
+    parser.add_argument("--context-index", action="store_true",
+                        help="give summaries the definitions around each change and their callers, "
+                             "from an index of the repository kept in the cache")
+    parser.add_argument("--bot-username",
+                        help="login the review comments are written as, "
+                             "when it cannot be read from the token")
+    parser.add_argument("--telemetry", default=os.getenv(TELEMETRY_ENV, ""),
+                        help="comma separated span exporters: jsonl=PATH, otel")
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[list[str]] = None) -> list[ReviewResult]:
+    load_dotenv(override=True)
+    args = parse_args(argv)
+    github_token = os.getenv("INPUT_GITHUB_TOKEN") or os.getenv("GITHUB_TOKEN")
+
+    if not github_token:
+        raise ValueError("GITHUB_TOKEN not found.")
+
+    gh = Github(github_token)
+    diff_cache = DiffCache()
+    response_cache = ResponseCache()
+    comment_index = CommentIndex()
+    llm_cache = None if args.no_llm_cache else LLMCache()
+    context_cache = ContextCache() if args.context_index else None
+    telemetry.configure(args.telemetry)
+
+    try:
+        targets = [ReviewTarget.parse(target) for target in args.targets]
+        if args.file:
+            with open(args.file) as f:
+                targets += [ReviewTarget.parse(line) for line in f if line.strip()]
+        if args.query:
+            targets += await asyncio.to_thread(search_targets, gh, args.query)
+        # Drop duplicates, keeping the first occurrence.
+        targets = list(dict.fromkeys(targets))
+
+        async with GithubHttpClient(
+            github_token, response_cache=response_cache
+        ) as http_client:
+            results = await review_targets(
+                http_client,
+                targets,
+                retrieve_concurrency=args.retrieve_concurrency,
+                analyze_concurrency=args.analyze_concurrency,
+                max_concurrency=args.max_concurrency,
+                packer=PromptPacker(args.token_budget, args.file_token_budget),
+                diff_cache=diff_cache,
+                bot_username=args.bot_username or await http_client.login(),
+                incremental=not args.full,
+                comment_index=comment_index,
+                mirror_root=args.mirror_dir,
+                llm_cache=llm_cache,
+                routing=not args.no_routing,
+                progress_interval=args.progress_interval,
+                inline_comments=not args.no_inline_comments,
+                context_cache=context_cache,
+            )
+    finally:
+        if llm_cache is not None:
+            print(f"LLM cache: {llm_cache.stats}")
+            llm_cache.close()
+        if context_cache is not None:
+            context_cache.close()
+        comment_index.close()
+        response_cache.close()
+        diff_cache.close()
+        gh.close()
+        telemetry.close()
+
+    for result in results:
+        line = f"{result.status:<8} {result.seconds:7.1f}s  {result.target}"
+        print(f"{line}  {result.error}" if result.error else line)
+    counts = {status: sum(r.status == status for r in results)
+              for status in ("reviewed", "skipped", "failed")}
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump([asdict(result) for result in results], f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    results = asyncio.run(main())
+    if any(result.status == "failed" for result in results):
+        raise SystemExit(1)
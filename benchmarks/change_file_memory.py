@@ -0,0 +1,122 @@
+"""Memory held by a pull request's change files, pydantic models vs compact.
+
+Usage:
+    python -m benchmarks.change_file_memory --files 300 --hunks 20
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import hashlib
+import tracemalloc
+from typing import Callable, Optional
+
+from models import ChangeFile, ChangeStatus, CompactChangeFile
+from utils.diff_utils import build_compact_diff, build_diff_content
+
+PR_URL = "https://github.com/owner/repo/pull/1"
+BASE_SHA = hashlib.sha1(b"base").hexdigest()
+HEAD_SHA = hashlib.sha1(b"head").hexdigest()
+
+
+def make_git_files(file_count: int, hunk_count: int) -> list[dict]:
+    """Synthetic REST pull request file dicts with `hunk_count` hunks each."""
+    git_files = []
+    for index in range(file_count):
+        hunks = []
+        for hunk in range(hunk_count):
+            start = hunk * 40 + 1
+            body = [f" context {line}" for line in range(3)]
+            body += [f"-    removed = {index} + {line}" for line in range(4)]
+            body += [f"+    added = {index} * {line}" for line in range(6)]
+            body += [f" context {line}" for line in range(3)]
+            hunks.append(f"@@ -{start},10 +{start},12 @@ def function_{hunk}():\n" + "\n".join(body))
+        git_files.append({
+            "filename": f"src/package_{index % 10}/module_{index}.py",
+            "sha": hashlib.sha1(str(index).encode()).hexdigest(),
+            "status": "modified",
+            "patch": "\n".join(hunks),
+            "blob_url": f"https://github.com/owner/repo/blob/{HEAD_SHA}/src/module_{index}.py",
+        })
+    return git_files
+
+
+def build_models(git_files: list[dict]) -> list[ChangeFile]:
+    """Change files as validated pydantic models, as built before the compact form."""
+    return [
+        ChangeFile(
+            blob_id=int(git_file["sha"], 16),
+            sha=git_file["sha"],
+            full_name=git_file["filename"],
+            source_full_name=git_file["filename"],
+            name=git_file["filename"].split("/")[-1],
+            suffix="py",
+            status=ChangeStatus.modified,
+            pull_request_id=1,
+            start_commit_id=int(BASE_SHA, 16),
+            end_commit_id=int(HEAD_SHA, 16),
+            diff_url=f"{PR_URL}/files#diff-{git_file['sha']}",
+            blob_url=git_file["blob_url"],
+            diff_content=build_diff_content(
+                git_file["patch"], git_file["filename"], git_file["filename"]
+            ),
+            raw=dict(git_file),
+        )
+        for git_file in git_files
+    ]
+
+
+def build_compact(git_files: list[dict]) -> list[CompactChangeFile]:
+    start_commit_sha = bytes.fromhex(BASE_SHA)
+    end_commit_sha = bytes.fromhex(HEAD_SHA)
+    return [
+        CompactChangeFile(
+            blob_sha=bytes.fromhex(git_file["sha"]),
+            full_name=git_file["filename"],
+            source_full_name=git_file["filename"],
+            status=ChangeStatus.modified,
+            pull_request_id=1,
+            start_commit_sha=start_commit_sha,
+            end_commit_sha=end_commit_sha,
+            diff_url=f"{PR_URL}/files#diff-{git_file['sha']}",
+            blob_url=git_file["blob_url"],
+            diff_content=build_compact_diff(git_file["patch"]),
+        )
+        for git_file in git_files
+    ]
+
+
+def retained_bytes(build: Callable[[list[dict]], list], git_files: list[dict]) -> int:
+    """Bytes allocated by building and still held by the result.
+
+    The patch strings are allocated beforehand, so the one copy of each that
+    both forms keep is not counted.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build(git_files)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained
+
+
+def main(argv: Optional[list[str]] = None) -> dict[str, int]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--hunks", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    git_files = make_git_files(args.files, args.hunks)
+    results = {
+        "pydantic": retained_bytes(build_models, git_files),
+        "compact": retained_bytes(build_compact, git_files),
+    }
+    for name, retained in results.items():
+        print(f"{name:<9} {retained / 1024 / 1024:8.2f} MiB")
+    print(f"saving    {1 - results['compact'] / results['pydantic']:8.1%}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Recorded pull requests replayed by the benchmarks.
+
+A recording holds the REST responses a review reads: the repository, the
+pull request, its file listing and its issue comments. Synthetic
+recordings of several shapes are generated deterministically, and real
+pull requests can be recorded from Github:
+
+    python -m benchmarks.fixtures owner/repo#123
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable, Optional
+
+from utils.github_http import GithubHttpClient
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+
+REPO_FULL_NAME = "owner/repo"
+PR_NUMBER = 1
+BASE_SHA = hashlib.sha1(b"base").hexdigest()
+HEAD_SHA = hashlib.sha1(b"head").hexdigest()
+
+
+def _sha(*parts: object) -> str:
+    return hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def _hunk(index: int, hunk: int, added: int = 6, removed: int = 4) -> str:
+    start = hunk * 40 + 1
+    body = [f" context {line}" for line in range(3)]
+    body += [f"-    removed = {index} + {line}" for line in range(removed)]
+    body += [f"+    added = {index} * {line}" for line in range(added)]
+    body += [f" context {line}" for line in range(3)]
+    return (
+        f"@@ -{start},{removed + 6} +{start},{added + 6} @@ def function_{hunk}():\n"
+        + "\n".join(body)
+    )
+
+
+def _git_file(
+    filename: str,
+    status: str,
+    patch: Optional[str],
+    previous_filename: Optional[str] = None,
+) -> dict:
+    additions = patch.count("\n+") if patch else 0
+    deletions = patch.count("\n-") if patch else 0
+    git_file = {
+        "sha": _sha(filename, status),
+        "filename": filename,
+        "status": status,
+        "additions": additions,
+        "deletions": deletions,
+        "changes": additions + deletions,
+        "blob_url": f"https://github.com/{REPO_FULL_NAME}/blob/{HEAD_SHA}/{filename}",
+    }
+    if patch is not None:
+        git_file["patch"] = patch
+    if previous_filename is not None:
+        git_file["previous_filename"] = previous_filename
+    return git_file
+
+
+def mixed_files(file_count: int, hunk_count: int = 4) -> list[dict]:
+    """Files of a typical pull request: mostly modified code, with additions,
+    docs, config, lockfiles and renames mixed in."""
+    git_files = []
+    for index in range(file_count):
+        kind = index % 20
+        directory = f"src/package_{index % 10}"
+        if kind < 12:
+            patch = "\n".join(_hunk(index, hunk) for hunk in range(hunk_count))
+            git_files.append(_git_file(f"{directory}/module_{index}.py", "modified", patch))
+        elif kind < 14:
+            patch = "@@ -0,0 +1,40 @@\n" + "\n".join(f"+line {line}" for line in range(40))
+            git_files.append(_git_file(f"{directory}/new_{index}.ts", "added", patch))
+        elif kind < 16:
+            patch = _hunk(index, 0, added=3, removed=1)
+            git_files.append(_git_file(f"docs/page_{index}.md", "modified", patch))
+        elif kind == 16:
+            patch = _hunk(index, 0, added=2, removed=2)
+            git_files.append(_git_file(f"config/settings_{index}.yaml", "modified", patch))
+        elif kind == 17:
+            # Github leaves out the patch of large lockfile diffs.
+            git_files.append(_git_file(f"{directory}/package-lock.json", "modified", None))
+        elif kind == 18:
+            git_files.append(_git_file(
+                f"{directory}/renamed_{index}.py", "renamed", None, f"{directory}/old_{index}.py"
+            ))
+        else:
+            git_files.append(_git_file(
+                f"{directory}/moved_{index}.go", "renamed", _hunk(index, 0, 1, 1),
+                f"legacy/moved_{index}.go",
+            ))
+    return git_files
+
+
+def huge_file(hunk_count: int = 2000) -> list[dict]:
+    """One file with a very large patch."""
+    patch = "\n".join(_hunk(0, hunk, added=10, removed=5) for hunk in range(hunk_count))
+    return [_git_file("src/generated_tables.py", "modified", patch)]
+
+
+def renames(file_count: int = 1000) -> list[dict]:
+    """A directory move: renames without content changes."""
+    return [
+        _git_file(f"lib/module_{index}.py", "renamed", None, f"src/module_{index}.py")
+        for index in range(file_count)
+    ]
+
+
+SHAPES: dict[str, Callable[[], list[dict]]] = {
+    "files-10": lambda: mixed_files(10),
+    "files-100": lambda: mixed_files(100),
+    "files-1000": lambda: mixed_files(1000),
+    "files-5000": lambda: mixed_files(5000),
+    "huge-file": huge_file,
+    "renames": renames,
+}
+
+
+def build_recording(git_files: list[dict], title: str = "Synthetic pull request") -> dict:
+    owner, name = REPO_FULL_NAME.split("/")
+    repo = {
+        "id": 1,
+        "name": name,
+        "full_name": REPO_FULL_NAME,
+        "html_url": f"https://github.com/{REPO_FULL_NAME}",
+        "clone_url": f"https://github.com/{REPO_FULL_NAME}.git",
+        "owner": {"login": owner},
+    }
+    pull_request = {
+        "id": 100,
+        "number": PR_NUMBER,
+        "title": title,
+        "body": "Benchmark fixture.",
+        "html_url": f"https://github.com/{REPO_FULL_NAME}/pull/{PR_NUMBER}",
+        "changed_files": len(git_files),
+        "comments": 0,
+        "base": {"sha": BASE_SHA, "ref": "main", "repo": repo},
+        "head": {"sha": HEAD_SHA, "ref": "feature", "repo": repo},
+    }
+    return {"repository": repo, "pull_request": pull_request, "files": git_files, "comments": []}
+
+
+def load_recording(name: str) -> dict:
+    """Load a recording saved under FIXTURE_DIR, or generate the synthetic shape `name`."""
+    path = FIXTURE_DIR / f"{name}.json.gz"
+    if path.exists():
+        with gzip.open(path, "rt") as f:
+            return json.load(f)
+    if name not in SHAPES:
+        raise ValueError(f"Unknown fixture {name}; shapes are {', '.join(SHAPES)}.")
+    return build_recording(SHAPES[name](), title=name)
+
+
+def save_recording(name: str, recording: dict) -> Path:
+    FIXTURE_DIR.mkdir(exist_ok=True)
+    path = FIXTURE_DIR / f"{name}.json.gz"
+    with gzip.open(path, "wt") as f:
+        json.dump(recording, f)
+    return path
+
+
+async def record_pull_request(
+    client: GithubHttpClient, repo_full_name: str, pr_number: int
+) -> dict:
+    """Record the responses a review of a real pull request reads."""
+    repo_path = f"/repos/{repo_full_name}"
+    repo, pull_request = await asyncio.gather(
+        client.get_json(repo_path), client.get_json(f"{repo_path}/pulls/{pr_number}")
+    )
+    pages = range(1, -(-pull_request["changed_files"] // client.PER_PAGE) + 1)
+    comment_pages = range(1, -(-pull_request.get("comments", 0) // client.PER_PAGE) + 1)
+    git_files, comments = await asyncio.gather(
+        client.get_pages(f"{repo_path}/pulls/{pr_number}/files", pages),
+        client.get_pages(f"{repo_path}/issues/{pr_number}/comments", comment_pages),
+    )
+    return {
+        "repository": repo,
+        "pull_request": pull_request,
+        "files": git_files,
+        "comments": comments,
+    }
+
+
+async def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Record a pull request as a benchmark fixture.")
+    parser.add_argument("target", help="pull request as owner/repo#number")
+    parser.add_argument("--name", help="fixture name, by default owner-repo-number")
+    args = parser.parse_args(argv)
+
+    repo_full_name, pr_number = args.target.split("#")
+    name = args.name or f"{repo_full_name.replace('/', '-')}-{pr_number}"
+    async with GithubHttpClient(os.environ["GITHUB_TOKEN"]) as client:
+        recording = await record_pull_request(client, repo_full_name, int(pr_number))
+    print(f"Recorded {len(recording['files'])} files to {save_recording(name, recording)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,347 @@
+"""Offline benchmark of the review pipeline, stage by stage.
+
+Each fixture from benchmarks.fixtures is served by a local ReplayServer,
+and the model is a StubChatModel, so no network or API key is needed.
+For each stage this reports its best wall time over `--repeat` runs, its
+throughput in files per second, and, from a separate traced run, its peak
+traced memory and the memory blocks it left allocated. Results are
+compared with a stored baseline, and the exit status is 1 on a
+regression. Baseline times are scaled by how fast a fixed calibration
+workload ran when the baseline was saved and runs now, so a baseline
+saved on another machine still applies.
+
+Usage:
+    python -m benchmarks.pipeline --shapes files-100 huge-file
+    python -m benchmarks.pipeline --save-baseline
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from github import Auth, Github
+
+from async_github_retriever import AsyncGithubRetriever
+from benchmarks.fixtures import SHAPES, load_recording
+from benchmarks.replay import ReplayServer
+from github_retriever import GithubRetriever
+from main import analyze_pr, render_review_comment
+from models import ChangeSummary, ReviewState
+from pr_summary.code_summary import asummarize_change_files
+from processors import PromptPacker, PullRequestProcessor
+from utils.diff_utils import build_compact_diff, parse_patch_file
+from utils.github_http import GithubHttpClient
+from utils.output_struc import Comment
+from utils.request_scheduler import RequestScheduler
+from utils.stub_llm import StubChatModel
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+MIN_SECONDS_DELTA = 0.01
+"""Slowdowns smaller than this are timer noise, whatever their ratio."""
+MIN_BYTES_DELTA = 64 * 1024
+
+CALIBRATION_KEY = "_calibration"
+"""Baseline entry holding the calibration time of the machine that saved it."""
+
+
+def calibrate(repeat: int = 5) -> float:
+    """Best time of a fixed workload of string, dict and json operations,
+    like those of the stages, as a measure of this machine's speed."""
+    text = "\n".join(f"+line {line} of the calibration patch" for line in range(20000))
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        words: dict[str, int] = {}
+        for line in text.split("\n"):
+            for word in line.split(" "):
+                words[word] = words.get(word, 0) + 1
+        json.dumps(sorted(words.items()))
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds
+
+
+@dataclass
+class BenchContext:
+    """Inputs shared by the stages of one fixture, prepared once."""
+
+    recording: dict
+    server: ReplayServer
+    llm: StubChatModel
+    packer: PromptPacker
+    retriever: Optional[AsyncGithubRetriever] = None
+    summaries: Optional[list[ChangeSummary]] = None
+    comment: Optional[Comment] = None
+
+    @property
+    def repo_full_name(self) -> str:
+        return self.recording["repository"]["full_name"]
+
+    @property
+    def pr_number(self) -> int:
+        return self.recording["pull_request"]["number"]
+
+    @property
+    def change_files(self) -> list:
+        return self.retriever.pull_request.change_files
+
+
+@dataclass
+class StageResult:
+    seconds: float
+    files: int
+    peak_bytes: int
+    blocks: int
+
+    @property
+    def throughput(self) -> float:
+        return self.files / self.seconds if self.seconds else float("inf")
+
+
+async def _retrieve(context: BenchContext) -> AsyncGithubRetriever:
+    # An unthrottled scheduler, so the client rather than pacing is measured.
+    scheduler = RequestScheduler(rate=1e9, burst=10**9)
+    async with GithubHttpClient(
+        "token", base_url=context.server.base_url, scheduler=scheduler
+    ) as client:
+        return await AsyncGithubRetriever.create(client, context.repo_full_name, context.pr_number)
+
+
+def stage_retrieve(context: BenchContext) -> int:
+    """AsyncGithubRetriever.create: metadata and file pages, change files with lazy diffs."""
+    return len(asyncio.run(_retrieve(context)).pull_request.change_files)
+
+
+def stage_retrieve_sync(context: BenchContext) -> int:
+    """GithubRetriever construction through PyGithub."""
+    gh = Github(
+        auth=Auth.Token("token"),
+        base_url=context.server.base_url,
+        per_page=100,
+        seconds_between_requests=None,
+    )
+    try:
+        retriever = GithubRetriever(gh, context.repo_full_name, context.pr_number)
+        return len(retriever.pull_request.change_files)
+    finally:
+        gh.close()
+
+
+def stage_parse_unidiff(context: BenchContext) -> int:
+    """parse_patch_file over every patch."""
+    git_files = [git_file for git_file in context.recording["files"] if git_file.get("patch")]
+    for git_file in git_files:
+        parse_patch_file(
+            git_file["patch"],
+            git_file.get("previous_filename", git_file["filename"]),
+            git_file["filename"],
+        )
+    return len(git_files)
+
+
+def stage_parse(context: BenchContext) -> int:
+    """build_compact_diff, the parser the retrievers use, over every patch."""
+    git_files = [git_file for git_file in context.recording["files"] if git_file.get("patch")]
+    for git_file in git_files:
+        build_compact_diff(git_file["patch"])
+    return len(git_files)
+
+
+def stage_material(context: BenchContext) -> int:
+    """File listing, packed diff and code summary material of the prompts."""
+    PullRequestProcessor.gen_material_change_files(context.change_files)
+    context.packer.pack(context.change_files)
+    PullRequestProcessor.gen_material_code_summaries(context.summaries)
+    return len(context.change_files)
+
+
+def stage_summarize(context: BenchContext) -> int:
+    """Map stage with the stub model: per-file packing, prompt formatting and orchestration."""
+    asyncio.run(asummarize_change_files(context.llm, context.change_files, packer=context.packer))
+    return len(context.change_files)
+
+
+def stage_analyze(context: BenchContext) -> int:
+    """Final prompt formatting and structured output parsing with the stub model."""
+    asyncio.run(analyze_pr(context.retriever, context.summaries, context.llm, context.packer))
+    return len(context.change_files)
+
+
+def stage_render(context: BenchContext) -> int:
+    """Comment rendering, as posted by run_review_job, with the state marker."""
+    review_state = ReviewState(
+        head_sha=context.recording["pull_request"]["head"]["sha"],
+        file_summaries={summary.full_name: summary.summary for summary in context.summaries},
+    )
+    render_review_comment(context.comment, context.retriever, review_state)
+    return len(context.change_files)
+
+
+STAGES: dict[str, Callable[[BenchContext], int]] = {
+    "retrieve": stage_retrieve,
+    "retrieve_sync": stage_retrieve_sync,
+    "parse_unidiff": stage_parse_unidiff,
+    "parse": stage_parse,
+    "material": stage_material,
+    "summarize": stage_summarize,
+    "analyze": stage_analyze,
+    "render": stage_render,
+}
+
+
+def prepare(context: BenchContext) -> None:
+    """Run the pipeline once to give every stage its inputs."""
+    context.retriever = asyncio.run(_retrieve(context))
+    for change_file in context.change_files:
+        change_file.diff_content
+    context.summaries = asyncio.run(
+        asummarize_change_files(context.llm, context.change_files, packer=context.packer)
+    )
+    context.comment = asyncio.run(
+        analyze_pr(context.retriever, context.summaries, context.llm, context.packer)
+    )
+    # Name some files as important, so rendering links them.
+    context.comment.important_changes = [
+        summary.full_name for summary in context.summaries[::max(len(context.summaries) // 10, 1)]
+    ]
+
+
+def measure(stage: Callable[[BenchContext], int], context: BenchContext, repeat: int) -> StageResult:
+    seconds = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        files = stage(context)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    stage(context)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    # Negative when the stage released memory held from earlier runs.
+    blocks = sys.getallocatedblocks() - blocks
+    return StageResult(seconds, files, peak_bytes, blocks)
+
+
+def run_shape(shape: str, stages: list[str], repeat: int) -> dict[str, StageResult]:
+    recording = load_recording(shape)
+    with ReplayServer(recording) as server:
+        context = BenchContext(recording, server, StubChatModel(), PromptPacker())
+        prepare(context)
+        return {name: measure(STAGES[name], context, repeat) for name in stages}
+
+
+def compare(
+    results: dict[str, dict[str, StageResult]],
+    baseline: dict[str, dict[str, dict[str, Any]]],
+    time_tolerance: float,
+    memory_tolerance: float,
+    speed_ratio: float = 1.0,
+) -> list[str]:
+    """Describe every stage slower or more memory hungry than the baseline allows.
+
+    Baseline times are multiplied by `speed_ratio`, this machine's
+    calibration time over the baseline's.
+    """
+    regressions = []
+    for shape, stages in results.items():
+        for name, result in stages.items():
+            base = baseline.get(shape, {}).get(name)
+            if base is None:
+                continue
+            base_seconds = base["seconds"] * speed_ratio
+            seconds_limit = base_seconds * (1 + time_tolerance)
+            if result.seconds > seconds_limit and result.seconds - base_seconds > MIN_SECONDS_DELTA:
+                regressions.append(
+                    f"{shape} {name}: {result.seconds:.4f}s vs baseline {base_seconds:.4f}s"
+                )
+            bytes_limit = base["peak_bytes"] * (1 + memory_tolerance)
+            if result.peak_bytes > bytes_limit and result.peak_bytes - base["peak_bytes"] > MIN_BYTES_DELTA:
+                regressions.append(
+                    f"{shape} {name}: peak {result.peak_bytes / 2**20:.2f} MiB"
+                    f" vs baseline {base['peak_bytes'] / 2**20:.2f} MiB"
+                )
+    return regressions
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", nargs="+", default=list(SHAPES),
+                        help="synthetic shapes or names of recorded fixtures")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the baseline instead of comparing")
+    parser.add_argument("--time-tolerance", type=float, default=0.5,
+                        help="allowed slowdown over the baseline, as a fraction")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2,
+                        help="allowed peak memory growth over the baseline, as a fraction")
+    parser.add_argument("--output", type=Path, help="also write the results to this json file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    calibration = calibrate()
+    print(f"Calibration: {calibration:.4f}s")
+    results = {}
+    print(f"{'shape':<12} {'stage':<14} {'seconds':>9} {'files/s':>11} {'peak MiB':>9} {'blocks':>9}")
+    for shape in args.shapes:
+        results[shape] = run_shape(shape, args.stages, args.repeat)
+        for name, result in results[shape].items():
+            print(
+                f"{shape:<12} {name:<14} {result.seconds:9.4f} {result.throughput:11.0f}"
+                f" {result.peak_bytes / 2**20:9.2f} {result.blocks:9d}"
+            )
+
+    data = {
+        shape: {name: asdict(result) for name, result in stages.items()}
+        for shape, stages in results.items()
+    }
+    if args.output:
+        args.output.write_text(json.dumps(data, indent=2))
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        # Keep the entries not measured now, converted to this machine's speed.
+        calibration_entry = baseline.pop(CALIBRATION_KEY, {"seconds": calibration})
+        speed_ratio = calibration / calibration_entry["seconds"]
+        for stages in baseline.values():
+            for result in stages.values():
+                result["seconds"] *= speed_ratio
+        baseline.update(data)
+        baseline[CALIBRATION_KEY] = {"seconds": calibration}
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    # Baselines saved before calibration are compared as they are.
+    baseline_calibration = baseline.get(CALIBRATION_KEY, {}).get("seconds", calibration)
+    regressions = compare(
+        results,
+        baseline,
+        args.time_tolerance,
+        args.memory_tolerance,
+        calibration / baseline_calibration,
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
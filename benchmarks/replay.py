@@ -0,0 +1,132 @@
+"""Local server answering Github REST requests from a recording."""
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from typing import Optional
+
+from aiohttp import web
+
+
+class ReplayServer:
+    """Serves a recording from benchmarks.fixtures on localhost.
+
+    The server runs its own event loop on a background thread, so both the
+    async client and the synchronous PyGithub client can call it. Response
+    bodies are encoded once and reused, so repeated runs measure the client
+    rather than the server. Comment writes are accepted and counted.
+    """
+
+    def __init__(self, recording: dict, host: str = "127.0.0.1", port: int = 0):
+        self._recording = recording
+        self._host = host
+        self._port = port
+        self._bodies: dict[str, bytes] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._runner: Optional[web.AppRunner] = None
+        self.stats = {"requests": 0, "writes": 0}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self._host}:{self._port}"
+
+    def __enter__(self) -> ReplayServer:
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        async def serve() -> None:
+            self._runner = web.AppRunner(self._build_app(), access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, self._host, self._port)
+            await site.start()
+            self._port = site._server.sockets[0].getsockname()[1]
+            started.set()
+
+        def run() -> None:
+            self._loop.run_until_complete(serve())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _with_urls(self) -> tuple[dict, dict]:
+        repo_full_name = self._recording["repository"]["full_name"]
+        repo_url = f"{self.base_url}/repos/{repo_full_name}"
+        repository = {**self._recording["repository"], "url": repo_url}
+        pull_request = {
+            **self._recording["pull_request"],
+            "url": f"{repo_url}/pulls/{self._recording['pull_request']['number']}",
+        }
+        return repository, pull_request
+
+    def _json(self, request: web.Request, build) -> web.Response:
+        key = str(request.rel_url)
+        body = self._bodies.get(key)
+        if body is None:
+            body = self._bodies[key] = json.dumps(build()).encode()
+        return web.Response(body=body, content_type="application/json")
+
+    def _page(self, request: web.Request, items: list) -> web.Response:
+        per_page = int(request.query.get("per_page", 30))
+        page = int(request.query.get("page", 1))
+        response = self._json(request, lambda: items[(page - 1) * per_page:page * per_page])
+        if page * per_page < len(items):
+            next_url = request.url.update_query({"page": page + 1, "per_page": per_page})
+            response.headers["Link"] = f'<{next_url}>; rel="next"'
+        return response
+
+    def _build_app(self) -> web.Application:
+        repo_path = f"/repos/{self._recording['repository']['full_name']}"
+        pr_number = self._recording["pull_request"]["number"]
+
+        @web.middleware
+        async def count(request: web.Request, handler) -> web.StreamResponse:
+            self.stats["requests"] += 1
+            return await handler(request)
+
+        async def repository(request: web.Request) -> web.Response:
+            return self._json(request, lambda: self._with_urls()[0])
+
+        async def pull_request(request: web.Request) -> web.Response:
+            return self._json(request, lambda: self._with_urls()[1])
+
+        async def files(request: web.Request) -> web.Response:
+            return self._page(request, self._recording["files"])
+
+        async def comments(request: web.Request) -> web.Response:
+            return self._page(request, self._recording["comments"])
+
+        async def write_comment(request: web.Request) -> web.Response:
+            self.stats["writes"] += 1
+            body = await request.json()
+            comment_id = int(request.match_info.get("comment_id", 1))
+            return web.json_response({"id": comment_id, "body": body.get("body")})
+
+        async def not_found(request: web.Request) -> web.Response:
+            return web.json_response({"message": "Not Found"}, status=404)
+
+        app = web.Application(middlewares=[count])
+        app.router.add_get(repo_path, repository)
+        app.router.add_get(f"{repo_path}/pulls/{pr_number}", pull_request)
+        app.router.add_get(f"{repo_path}/pulls/{pr_number}/files", files)
+        app.router.add_get(f"{repo_path}/issues/{pr_number}/comments", comments)
+        app.router.add_post(f"{repo_path}/issues/{pr_number}/comments", write_comment)
+        app.router.add_patch(f"{repo_path}/issues/comments/{{comment_id}}", write_comment)
+        app.router.add_get(f"{repo_path}/contents/{{path:.*}}", not_found)
+        return app
@@ -0,0 +1,96 @@
+"""Cold start of the action entry point: time and import profile of `import main`.
+
+Each run imports main in a fresh interpreter, as the action container
+does. This reports the best wall time over `--repeat` runs and, from
+`python -X importtime`, the modules with the largest cumulative import
+time. `--save` records the profile next to the pipeline baseline.
+
+Usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --module server --top 30
+    python -m benchmarks.startup --save
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Optional
+
+PROFILE_PATH = Path(__file__).parent / "import_profile.json"
+ROOT = Path(__file__).parent.parent
+
+_TIMED_IMPORT = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def time_import(module: str) -> float:
+    """Seconds to import `module` in a fresh interpreter."""
+    output = subprocess.run(
+        [sys.executable, "-c", _TIMED_IMPORT.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def import_profile(module: str) -> list[tuple[str, int, int]]:
+    """`(module, self µs, cumulative µs)` of every import made by `import module`."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stderr
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            # The header line.
+            continue
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main", help="module to import")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20,
+                        help="modules listed by cumulative import time")
+    parser.add_argument("--save", action="store_true",
+                        help=f"write the timing and profile to {PROFILE_PATH.name}")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    seconds = min(time_import(args.module) for _ in range(args.repeat))
+    profile = import_profile(args.module)
+    top = sorted(profile, key=lambda entry: entry[2], reverse=True)[:args.top]
+
+    print(f"import {args.module}: {seconds:.3f}s best of {args.repeat}, {len(profile)} modules")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us in top:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+    if args.save:
+        profiles = json.loads(PROFILE_PATH.read_text()) if PROFILE_PATH.exists() else {}
+        profiles[args.module] = {
+            "seconds": seconds,
+            "modules": len(profile),
+            "top": [
+                {"module": name, "self_us": self_us, "cumulative_us": cumulative_us}
+                for name, self_us, cumulative_us in top
+            ],
+        }
+        PROFILE_PATH.write_text(json.dumps(profiles, indent=2, sort_keys=True) + "\n")
+        print(f"Saved profile to {PROFILE_PATH}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
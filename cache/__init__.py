@@ -0,0 +1,8 @@
+from .base import default_cache_dir
+from .comment_index import CommentIndex
+from .context_cache import ContextCache
+from .diff_cache import DiffCache
+from .llm_cache import LLMCache
+from .response_cache import ResponseCache
+
+__all__ = ["default_cache_dir", "CommentIndex", "ContextCache", "DiffCache", "LLMCache", "ResponseCache"]
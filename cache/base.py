@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+CACHE_DIR_ENV = "PR_AGENT_CACHE_DIR"
+
+
+def default_cache_dir() -> Path:
+    """Cache directory, `$PR_AGENT_CACHE_DIR` or `~/.cache/pr-review-agent`."""
+    cache_dir = os.getenv(CACHE_DIR_ENV)
+    if cache_dir:
+        return Path(cache_dir)
+    return Path.home() / ".cache" / "pr-review-agent"
+
+
+class SQLiteStore:
+    """A persistent key-value store in one SQLite file with LRU size eviction.
+
+    Values are bytes. Reads refresh the entry's access time, and writes
+    evict least recently used entries once the total value size grows past
+    `max_bytes`. The total is kept as a running count rather than summed
+    on each write, and access times are written in batches of `TOUCH_BATCH`
+    together with the next write, so neither reads nor writes cost a scan
+    of the table.
+    """
+
+    EVICT_RATIO = 0.8
+    """Fraction of `max_bytes` to shrink down to when evicting."""
+
+    TOUCH_BATCH = 256
+    """Access times held in memory before they are written."""
+
+    def __init__(self, path: str | Path, max_bytes: int = 256 * 1024 * 1024):
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+        )
+        self._conn.commit()
+        self._total = self._sum_sizes()
+        self._touched: dict[str, float] = {}
+        """Access times of keys read since the last write, by key."""
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[bytes]:
+        """Get a value, treating entries older than `max_age` seconds as missing."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created, size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if max_age is not None and row[1] < time.time() - max_age:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total -= row[2]
+                self._touched.pop(key, None)
+                self._conn.commit()
+                return None
+            self._touch([key])
+            return row[0]
+
+    def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        """Get the values of those `keys` that are present, in one query per 500 keys."""
+        values: dict[str, bytes] = {}
+        with self._lock:
+            # Stay below SQLite's limit on bound parameters.
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                values.update(self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+            self._touch(list(values))
+        return values
+
+    def put(self, key: str, value: bytes) -> None:
+        self.put_many([(key, value)])
+
+    def put_many(self, items: list[tuple[str, bytes]]) -> None:
+        """Put several values in one transaction."""
+        now = time.time()
+        with self._lock:
+            for key, value in items:
+                old = self._conn.execute(
+                    "SELECT size FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created, accessed)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value), now, now),
+                )
+                self._total += len(value) - (old[0] if old else 0)
+                self._touched.pop(key, None)
+            self._flush_touched()
+            if self._total > self._max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._total -= row[0]
+            self._touched.pop(key, None)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._total = 0
+            self._touched.clear()
+            self._conn.commit()
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._total
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+    def _sum_sizes(self) -> int:
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def _touch(self, keys: list[str]) -> None:
+        now = time.time()
+        for key in keys:
+            self._touched[key] = now
+        if len(self._touched) >= self.TOUCH_BATCH:
+            self._flush_touched()
+            self._conn.commit()
+
+    def _flush_touched(self) -> None:
+        """Write the held access times, leaving the commit to the caller."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE entries SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self) -> None:
+        # Other processes may share the file, so count again before evicting.
+        total = self._sum_sizes()
+        if total <= self._max_bytes:
+            self._total = total
+            return
+
+        target = self._max_bytes * self.EVICT_RATIO
+        rows = self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed ASC"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self._total = total
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+
+from .base import SQLiteStore, default_cache_dir
+
+
+class CommentIndex:
+    """Local index from pull request to the id of the bot's review comment.
+
+    With the id known, the comment is fetched and edited directly instead of
+    being searched for among all comments of the pull request.
+    """
+
+    FILE_NAME = "comments.sqlite3"
+
+    def __init__(self, path: Optional[str | Path] = None, max_bytes: int = 8 * 1024 * 1024):
+        self._store = SQLiteStore(path or default_cache_dir() / self.FILE_NAME, max_bytes)
+
+    @staticmethod
+    def _key(repo_full_name: str, pr_number: int) -> str:
+        return f"{repo_full_name}#{pr_number}"
+
+    def get(self, repo_full_name: str, pr_number: int) -> Optional[int]:
+        value = self._store.get(self._key(repo_full_name, pr_number))
+        return int(value) if value is not None else None
+
+    def put(self, repo_full_name: str, pr_number: int, comment_id: int) -> None:
+        self._store.put(self._key(repo_full_name, pr_number), str(comment_id).encode())
+
+    def delete(self, repo_full_name: str, pr_number: int) -> None:
+        self._store.delete(self._key(repo_full_name, pr_number))
+
+    def close(self) -> None:
+        self._store.close()
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import json
+import zlib
+from pathlib import Path
+from typing import Optional
+
+from utils.telemetry import count
+
+from .base import SQLiteStore, default_cache_dir
+
+SYMBOLS_VERSION = 2
+"""Bump when the extraction in processors.symbols changes, to reparse every blob."""
+
+
+class ContextCache:
+    """Persistent symbols of source blobs for the context index, keyed by blob sha
+    and the language the blob is parsed as.
+
+    A blob is parsed once whatever the repository, branch or path it is
+    found at, so keeping an index current costs one parse per new blob.
+    """
+
+    FILE_NAME = "context.sqlite3"
+
+    def __init__(
+        self,
+        path: Optional[str | Path] = None,
+        max_bytes: int = 512 * 1024 * 1024,
+    ):
+        self._store = SQLiteStore(path or default_cache_dir() / self.FILE_NAME, max_bytes)
+
+    @staticmethod
+    def _key(blob_sha: str, language: str) -> str:
+        return f"symbols:{SYMBOLS_VERSION}:{language}:{blob_sha}"
+
+    def get_symbols(self, languages: dict[str, str]) -> dict[str, dict]:
+        """Symbols of those blobs that are cached, given and returned by blob sha."""
+        keys = {self._key(sha, language): sha for sha, language in languages.items()}
+        values = self._store.get_many(list(keys))
+        count("cache_hits", len(values), cache="context")
+        count("cache_misses", len(keys) - len(values), cache="context")
+        return {keys[key]: json.loads(zlib.decompress(value)) for key, value in values.items()}
+
+    def put_symbols(self, symbols: dict[str, dict], languages: dict[str, str]) -> None:
+        """Store the symbols of several blobs, by blob sha, in one transaction.
+
+        `languages` holds the language each blob was parsed as.
+        """
+        self._store.put_many([
+            (self._key(sha, languages[sha]), zlib.compress(json.dumps(data).encode()))
+            for sha, data in symbols.items()
+        ])
+
+    def close(self) -> None:
+        self._store.close()
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import json
+import zlib
+from array import array
+from pathlib import Path
+from typing import Optional
+
+from models import CompactDiff
+from utils.telemetry import count
+
+from .base import SQLiteStore, default_cache_dir
+
+
+class DiffCache:
+    """Content addressed cache of parsed diffs and per-file summaries.
+
+    Entries are keyed by `(base sha, head blob sha, path)`, so a file whose
+    blob did not change between two runs of the same pull request is neither
+    parsed nor summarized again. Summaries are also keyed by a fingerprint of
+    the models and prompt that wrote them, so changing either summarizes anew.
+    """
+
+    FILE_NAME = "diffs.sqlite3"
+
+    def __init__(
+        self,
+        path: Optional[str | Path] = None,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self._store = SQLiteStore(path or default_cache_dir() / self.FILE_NAME, max_bytes)
+
+    @staticmethod
+    def _key(kind: str, base_sha: str, blob_sha: str, path: str) -> str:
+        return f"{kind}:{base_sha}:{blob_sha}:{path}"
+
+    def get_diff_content(
+        self, base_sha: str, blob_sha: str, path: str
+    ) -> Optional[CompactDiff]:
+        value = self._store.get(self._key("hunks", base_sha, blob_sha, path))
+        if value is None:
+            count("cache_misses", cache="diff")
+            return None
+        count("cache_hits", cache="diff")
+        data = json.loads(zlib.decompress(value))
+        return CompactDiff(
+            data["content"], data["add_count"], data["remove_count"], array("i", data["hunks"])
+        )
+
+    def put_diff_content(
+        self, base_sha: str, blob_sha: str, path: str, diff_content: CompactDiff
+    ) -> None:
+        data = {
+            "content": diff_content.content,
+            "add_count": diff_content.add_count,
+            "remove_count": diff_content.remove_count,
+            "hunks": diff_content.hunks.tolist(),
+        }
+        self._store.put(
+            self._key("hunks", base_sha, blob_sha, path),
+            zlib.compress(json.dumps(data).encode()),
+        )
+
+    def get_summary(
+        self, base_sha: str, blob_sha: str, path: str, fingerprint: str = ""
+    ) -> Optional[str]:
+        value = self._store.get(self._key(f"summary:{fingerprint}", base_sha, blob_sha, path))
+        if value is None:
+            count("cache_misses", cache="summary")
+            return None
+        count("cache_hits", cache="summary")
+        return value.decode()
+
+    def put_summary(
+        self, base_sha: str, blob_sha: str, path: str, summary: str, fingerprint: str = ""
+    ) -> None:
+        self._store.put(
+            self._key(f"summary:{fingerprint}", base_sha, blob_sha, path), summary.encode()
+        )
+
+    def close(self) -> None:
+        self._store.close()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import warnings
+import zlib
+from pathlib import Path
+from typing import Any, Optional
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+from utils.telemetry import count
+
+from .base import SQLiteStore, default_cache_dir
+
+DEFAULT_TTL = 7 * 24 * 3600
+"""Seconds a cached response stays valid."""
+
+_TRAILING_SPACE = re.compile(r"[ \t]+(?=\n|$)")
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return _TRAILING_SPACE.sub("", value.replace("\r\n", "\n"))
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    return value
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize line endings and trailing whitespace in a prompt.
+
+    Chat models pass their messages serialized as JSON, whose strings are
+    normalized one by one; any other prompt is normalized as text.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return _normalize(prompt)
+    return json.dumps(_normalize(messages), sort_keys=True)
+
+
+class LLMCache(BaseCache):
+    """Persistent cache of chat model responses, keyed by a request fingerprint.
+
+    Pass it as `ChatOpenAI(cache=...)`. The fingerprint hashes the llm
+    string, which carries the model name, its parameters and any bound tool
+    schemas such as a structured output schema, together with the rendered
+    prompt, which carries the prompt template and the inputs. Changing the
+    model, template or schema therefore misses the cache by itself. Line
+    endings and trailing whitespace are normalized before hashing.
+    """
+
+    FILE_NAME = "llm.sqlite3"
+
+    def __init__(
+        self,
+        path: Optional[str | Path] = None,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: Optional[float] = DEFAULT_TTL,
+    ):
+        self._store = SQLiteStore(path or default_cache_dir() / self.FILE_NAME, max_bytes)
+        self._ttl = ttl
+        self.stats = {"hits": 0, "misses": 0, "updates": 0}
+
+    @staticmethod
+    def fingerprint(prompt: str, llm_string: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(llm_string.encode())
+        digest.update(b"\0")
+        digest.update(normalize_prompt(prompt).encode())
+        return digest.hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        value = self._store.get(self.fingerprint(prompt, llm_string), self._ttl)
+        if value is None:
+            self.stats["misses"] += 1
+            count("cache_misses", cache="llm")
+            return None
+        self.stats["hits"] += 1
+        count("cache_hits", cache="llm")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", LangChainBetaWarning)
+            return [loads(generation) for generation in json.loads(zlib.decompress(value))]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.stats["updates"] += 1
+        value = json.dumps([dumps(generation) for generation in return_val])
+        self._store.put(self.fingerprint(prompt, llm_string), zlib.compress(value.encode()))
+
+    def clear(self, **kwargs: Any) -> None:
+        self._store.clear()
+
+    def close(self) -> None:
+        self._store.close()
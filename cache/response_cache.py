@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import json
+import zlib
+from pathlib import Path
+from typing import Any, Optional
+
+from .base import SQLiteStore, default_cache_dir
+
+
+class ResponseCache:
+    """Cache of Github REST responses with their ETags, for conditional requests.
+
+    A request sent with the cached ETag in `If-None-Match` is answered with
+    `304 Not Modified` when nothing changed, which Github does not count
+    against the rate limit; the cached body is used instead.
+    """
+
+    FILE_NAME = "responses.sqlite3"
+
+    def __init__(
+        self,
+        path: Optional[str | Path] = None,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self._store = SQLiteStore(path or default_cache_dir() / self.FILE_NAME, max_bytes)
+
+    def get(self, key: str) -> Optional[tuple[str, Any]]:
+        """Get the `(etag, json body)` cached for a request key."""
+        value = self._store.get(key)
+        if value is None:
+            return None
+        data = json.loads(zlib.decompress(value))
+        return data["etag"], data["body"]
+
+    def put(self, key: str, etag: str, body: Any) -> None:
+        self._store.put(
+            key, zlib.compress(json.dumps({"etag": etag, "body": body}).encode())
+        )
+
+    def close(self) -> None:
+        self._store.close()
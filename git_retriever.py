@@ -0,0 +1,372 @@
+from __future__ import annotations
+import asyncio
+import base64
+import os
+from pathlib import Path
+from typing import Optional
+from async_github_retriever import AsyncGithubRetriever
+from cache import default_cache_dir
+from utils.blob_fetcher import MAX_BLOB_BYTES, decode_blob
+from utils.diff_utils import build_compact_diff
+from utils.github_http import GithubHttpClient
+from utils.request_scheduler import PRIORITY_NORMAL
+from utils.telemetry import count, span, traced
+from models import Repository,PullRequest,ChangeStatus,CompactChangeFile
+
+NULL_SHA = "0" * 40
+
+MIRROR_DIR_ENV = "PR_AGENT_MIRROR_DIR"
+
+
+def default_mirror_dir() -> Path:
+    """Mirror directory, `$PR_AGENT_MIRROR_DIR` or `mirrors` in the cache directory."""
+    mirror_dir = os.getenv(MIRROR_DIR_ENV)
+    if mirror_dir:
+        return Path(mirror_dir)
+    return default_cache_dir() / "mirrors"
+
+
+def mirror_path(mirror_root: Path, repository_full_name: str) -> Path:
+    """Path of a repository's mirror, which must lie inside `mirror_root`."""
+    path = mirror_root / f"{repository_full_name}.git"
+    if not path.resolve().is_relative_to(mirror_root.resolve()):
+        raise ValueError(f"Mirror of {repository_full_name!r} would be outside {mirror_root}.")
+    return path
+
+
+class GitCommandError(RuntimeError):
+    pass
+
+
+class GitMirror:
+    """A persistent bare mirror of one repository, fetched incrementally."""
+
+    _locks: dict[Path, asyncio.Lock] = {}
+
+    def __init__(self, path: Path, remote_url: str, token: Optional[str] = None):
+        self.path = path
+        self.remote_url = remote_url
+        self._token = token
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """Serializes fetches into this mirror within the process."""
+        return self._locks.setdefault(self.path, asyncio.Lock())
+
+    def _env(self) -> Optional[dict[str, str]]:
+        """Environment passing the token to git as configuration.
+
+        Unlike `-c` options on the command line, the environment of a
+        process cannot be read by other users.
+        """
+        if not self._token:
+            return None
+        credentials = base64.b64encode(f"x-access-token:{self._token}".encode()).decode()
+        return {
+            **os.environ,
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "http.extraHeader",
+            "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}",
+        }
+
+    async def git(self, *args: str, input: Optional[bytes] = None) -> bytes:
+        with span("git", command=args[0]) as git_span:
+            process = await asyncio.create_subprocess_exec(
+                "git", "--git-dir", str(self.path), *args,
+                stdin=asyncio.subprocess.PIPE if input is not None else None,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=self._env(),
+            )
+            stdout, stderr = await process.communicate(input)
+            if process.returncode != 0:
+                raise GitCommandError(f"git {args[0]} failed: {stderr.decode().strip()}")
+            git_span.set("bytes", len(stdout))
+            count("git_bytes_read", len(stdout))
+            return stdout
+
+    async def has_commit(self, sha: str) -> bool:
+        if not self.path.exists():
+            return False
+        process = await asyncio.create_subprocess_exec(
+            "git", "--git-dir", str(self.path), "cat-file", "-e", f"{sha}^{{commit}}",
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        return await process.wait() == 0
+
+    async def tree(self, commit_sha: str) -> tuple[dict[str, str], bool]:
+        """Map every file path at a mirrored commit to its blob sha, like BlobFetcher.tree."""
+        output = await self.git("ls-tree", "-r", "-z", "--full-tree", commit_sha)
+        paths = {}
+        for entry in output.decode("utf-8", "surrogateescape").split("\0"):
+            info, _, path = entry.partition("\t")
+            if info.split(" ")[1:2] == ["blob"]:
+                paths[path] = info.split(" ")[2]
+        return paths, False
+
+    async def blobs(
+        self, shas: list[str], max_blob_bytes: int = MAX_BLOB_BYTES
+    ) -> dict[str, Optional[str]]:
+        """Read mirrored blobs as text in one `git cat-file --batch`.
+
+        Blobs that are binary, missing or larger than `max_blob_bytes` are None.
+        """
+        if not shas:
+            return {}
+        output = await self.git("cat-file", "--batch", input="\n".join(shas).encode() + b"\n")
+        texts: dict[str, Optional[str]] = {}
+        position = 0
+        while position < len(output):
+            header_end = output.index(b"\n", position)
+            header = output[position:header_end].decode().split(" ")
+            position = header_end + 1
+            if len(header) < 3:
+                # `<sha> missing`
+                texts[header[0]] = None
+                continue
+            size = int(header[2])
+            data = output[position:position + size]
+            position += size + 1
+            texts[header[0]] = decode_blob(data) if size <= max_blob_bytes else None
+        return texts
+
+    async def ensure_commits(self, shas: list[str], refspecs: list[str]) -> None:
+        """Fetch `refspecs` unless every commit in `shas` is already mirrored."""
+        async with self.lock:
+            missing = [sha for sha in shas if not await self.has_commit(sha)]
+            if not missing:
+                return
+            if not self.path.exists():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                await self.git("init", "--bare", "--quiet")
+            await self.git("fetch", "--quiet", "--no-tags", self.remote_url, *refspecs)
+            for sha in missing:
+                if not await self.has_commit(sha):
+                    raise GitCommandError(f"Commit {sha} not found in {self.remote_url}.")
+
+
+class GitMirrorRetriever(AsyncGithubRetriever):
+    """Retriever computing change files from a local bare mirror instead of the REST API.
+
+    Only the repository and pull request metadata come from the API; the
+    pull request refs are fetched incrementally into a persistent mirror,
+    and change files and diffs are read from one local `git diff`. Once the
+    mirror holds both commits, retrieval makes no git network requests.
+    """
+
+    def __init__(
+        self,
+        repository: Repository,
+        pull_request: PullRequest,
+        source_repository: Repository,
+        client: Optional[GithubHttpClient] = None,
+        mirror: Optional[GitMirror] = None,
+    ):
+        super().__init__(repository, pull_request, source_repository, client)
+        self._mirror = mirror
+
+    @classmethod
+    @traced("retrieve", retriever="git")
+    async def create(
+        cls,
+        client: GithubHttpClient,
+        repository_full_name: str,
+        pull_request_number: int,
+        mirror_root: Optional[Path] = None,
+        priority: int = PRIORITY_NORMAL,
+    ) -> GitMirrorRetriever:
+        """Fetch repository and pull request metadata, update the mirror and diff locally."""
+        path = mirror_path(mirror_root or default_mirror_dir(), repository_full_name)
+        repo_path = f"/repos/{repository_full_name}"
+        git_repo, git_pr = await asyncio.gather(
+            client.get_json(repo_path, priority=priority),
+            client.get_json(f"{repo_path}/pulls/{pull_request_number}", priority=priority),
+        )
+        mirror = GitMirror(
+            path,
+            git_repo["clone_url"],
+            client.token,
+        )
+        base_sha, head_sha = git_pr["base"]["sha"], git_pr["head"]["sha"]
+        await mirror.ensure_commits(
+            [base_sha, head_sha],
+            [
+                f"+refs/heads/{git_pr['base']['ref']}:refs/heads/{git_pr['base']['ref']}",
+                f"+refs/pull/{pull_request_number}/head:refs/pull/{pull_request_number}/head",
+            ],
+        )
+
+        repository = cls._build_repository(git_repo)
+        head_repo = git_pr["head"].get("repo")
+        if head_repo is not None and head_repo["id"] != git_repo["id"]:
+            source_repository = cls._build_repository(head_repo)
+        else:
+            source_repository = repository
+
+        change_files = await cls._build_change_files_from_git(mirror, git_pr)
+        pull_request = PullRequest(
+            pull_request_id=git_pr["id"],
+            repository_id=source_repository.repository_id,
+            pull_request_number=git_pr["number"],
+            title=git_pr["title"],
+            body=git_pr["body"] if git_pr["body"] is not None else "",
+            url=git_pr["html_url"],
+            repository_name=source_repository.repository_full_name,
+            change_files=change_files,
+            raw=git_pr,
+        )
+        return cls(repository, pull_request, source_repository, client, mirror)
+
+    @traced("retrieve.compare", retriever="git")
+    async def get_changed_paths_since(self, commit_sha: str) -> Optional[set[str]]:
+        """Get paths changed between `commit_sha` and the pull request head, from the mirror.
+
+        Returns None when the commit is not mirrored or the head is not a
+        fast-forward of it (e.g. after a force push).
+        """
+        head_sha = self._pull_request.raw["head"]["sha"]
+        if not await self._mirror.has_commit(commit_sha):
+            return None
+        try:
+            await self._mirror.git("merge-base", "--is-ancestor", commit_sha, head_sha)
+        except GitCommandError:
+            return None
+
+        output = await self._mirror.git(
+            "diff", "--name-status", "-z", "-M", commit_sha, head_sha
+        )
+        changed_paths = set()
+        for _, old_path, new_path in self._parse_raw_entries(output, raw=False):
+            changed_paths.add(new_path)
+            if old_path:
+                changed_paths.add(old_path)
+        return changed_paths
+
+    def blob_source(self) -> GitMirror:
+        """Reads trees and blobs from the mirror, without network requests."""
+        return self._mirror
+
+    async def prefetch_diff_contents(
+        self, change_files: Optional[list[CompactChangeFile]] = None
+    ) -> None:
+        """Diffs are read from git along with the change files, so there is nothing to fetch."""
+
+    @staticmethod
+    def _parse_raw_entries(output: bytes, raw: bool = True) -> list[tuple]:
+        """Parse `git diff --raw -z` (or `--name-status -z`) output.
+
+        Entries are `(src sha, dst sha, status letter, old path, new path)`
+        for raw output and `(status letter, old path, new path)` otherwise;
+        old path is None unless the file was renamed or copied.
+        """
+        fields = output.decode("utf-8", "surrogateescape").split("\0")
+        entries = []
+        index = 0
+        while index < len(fields) - 1:
+            header = fields[index]
+            if raw:
+                _, _, src_sha, dst_sha, status = header[1:].split(" ")
+            else:
+                status = header
+            letter = status[0]
+            if letter in "RC":
+                old_path, new_path = fields[index + 1], fields[index + 2]
+                index += 3
+            else:
+                old_path, new_path = None, fields[index + 1]
+                index += 2
+            entries.append(
+                (src_sha, dst_sha, letter, old_path, new_path) if raw else (letter, old_path, new_path)
+            )
+        return entries
+
+    @staticmethod
+    def _unquote(path: str) -> str:
+        """Undo the C-style quoting git applies to unusual paths."""
+        if not path.startswith('"'):
+            return path
+        data = path[1:-1].encode("utf-8", "surrogateescape")
+        return data.decode("unicode_escape").encode("latin-1").decode("utf-8", "surrogateescape")
+
+    @classmethod
+    def _section_path(cls, section: str) -> str:
+        """New path of one `git diff` section, the text after `diff --git `."""
+        header, *extended = section.split("\n", 8)[:8]
+        for line in extended:
+            if line.startswith(("@@", "--- ", "Binary files ")):
+                break
+            for prefix in ("rename to ", "copy to "):
+                if line.startswith(prefix):
+                    return cls._unquote(line[len(prefix):])
+        # Otherwise both sides name the same path: `a/<path> b/<path>`.
+        if header.startswith('"'):
+            end = header.index('" ', 1)
+            return cls._unquote(header[:end + 1]).removeprefix("a/")
+        return header[2:2 + (len(header) - 5) // 2]
+
+    @classmethod
+    def _split_patches(cls, output: str) -> dict[str, str]:
+        """Split `git diff` output into each file's hunks, by new path.
+
+        A type change, e.g. a file replaced by a symlink, is shown as a
+        deletion and an addition of the same path, whose hunks are joined.
+        """
+        patches: dict[str, str] = {}
+        if not output:
+            return patches
+        for section in output.removeprefix("diff --git ").split("\ndiff --git "):
+            # Binary, mode only and pure rename changes have no hunks.
+            hunks = section.find("\n@@")
+            patch = section[hunks + 1:].rstrip("\n") if hunks != -1 else ""
+            # Contents that are not UTF-8 only needed their bytes kept to find the path.
+            patch = patch.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+            path = cls._section_path(section)
+            patches[path] = "\n".join(filter(None, (patches.get(path), patch)))
+        return patches
+
+    @classmethod
+    async def _build_change_files_from_git(
+        cls, mirror: GitMirror, git_pr: dict
+    ) -> list[CompactChangeFile]:
+        # Three dots diff from the merge base, as Github shows pull requests.
+        revisions = f"{git_pr['base']['sha']}...{git_pr['head']['sha']}"
+        raw_output, patch_output = await asyncio.gather(
+            mirror.git("diff", "--raw", "-z", "-M", "--no-abbrev", revisions),
+            mirror.git(
+                "diff", "-M", "--no-color", "--no-ext-diff", "-U3",
+                "--src-prefix=a/", "--dst-prefix=b/", revisions,
+            ),
+        )
+        entries = cls._parse_raw_entries(raw_output)
+        patches = cls._split_patches(patch_output.decode("utf-8", "surrogateescape"))
+
+        start_commit_sha = bytes.fromhex(git_pr["base"]["sha"])
+        end_commit_sha = bytes.fromhex(git_pr["head"]["sha"])
+        head_repo = git_pr["head"].get("repo") or git_pr["base"]["repo"]
+        blob_url_prefix = f"{head_repo['html_url']}/blob/{git_pr['head']['sha']}"
+        change_files = []
+        parse_span = span("parse", files=len(entries), patch_bytes=len(patch_output))
+        with parse_span:
+            diff_contents = [build_compact_diff(patches.get(entry[4], "")) for entry in entries]
+        for (src_sha, dst_sha, letter, old_path, new_path), diff_content in zip(entries, diff_contents):
+            try:
+                status = ChangeStatus(letter)
+            except ValueError:
+                status = ChangeStatus.unknown
+            blob_sha = src_sha if dst_sha == NULL_SHA else dst_sha
+            change_files.append(
+                CompactChangeFile(
+                    blob_sha=bytes.fromhex(blob_sha),
+                    full_name=new_path,
+                    source_full_name=old_path or new_path,
+                    status=status,
+                    pull_request_id=git_pr["id"],
+                    start_commit_sha=start_commit_sha,
+                    end_commit_sha=end_commit_sha,
+                    diff_url=f"{git_pr['html_url']}/files#diff-{blob_sha}",
+                    blob_url="" if status == ChangeStatus.deletion else f"{blob_url_prefix}/{new_path}",
+                    diff_content=diff_content,
+                )
+            )
+        return change_files
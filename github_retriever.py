@@ -1,33 +1,41 @@
 from __future__ import annotations
-from github import Github
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+from github import Github, GithubException
 from github.PullRequest import PullRequest as GHPullRequest
 from github.Repository import Repository as GHRepo
 from github.File import File as GithubFile
-from utils.diff_utils import parse_patch_file
-from models import Repository,PullRequest,ChangeFile,DiffContent,DiffSegment,ChangeStatus
+from utils.blob_fetcher import MAX_BLOB_BYTES, decode_blob
+from utils.diff_utils import build_compact_diff, build_patch
+from utils.telemetry import span, traced
+from models import Repository,PullRequest,ChangeStatus,CompactChangeFile,CompactDiff
+from models.change_file import GITHUB_STATUS_MAPPING
+from cache import DiffCache
 
 
 
 class GithubRetriever():
     """Github retriever."""
 
-    GITHUB_STATUS_MAPPING = {
-        "added": "A",
-        "copied": "C",
-        "removed": "D",
-        "modified": "M",
-        "renamed": "R",
-        "type_change": "T",
-    }
+    GITHUB_STATUS_MAPPING = GITHUB_STATUS_MAPPING
 
     ISSUE_PATTERN = r"#\d+"
 
+    MAX_COMPARE_FILES = 300
+
+    @traced("retrieve", retriever="pygithub")
     def __init__(
         self,
         client: Github,
         repository_name_or_id: str | int,
         pull_request_number: int,
+        diff_cache: Optional[DiffCache] = None,
     ):
+        self._diff_cache = diff_cache
+        self._truncated_paths: set[str] = set()
+        """Changed files whose patch Github left out, diffed from blobs when prefetched."""
         if isinstance(repository_name_or_id, Repository):
             repository_name_or_id = repository_name_or_id.full_name  
 
@@ -55,6 +63,33 @@ class GithubRetriever():
             return self._build_repository(self._git_pull_request.head.repo)
         return self.repository
 
+    @traced("retrieve.compare", retriever="pygithub")
+    def get_changed_paths_since(self, commit_sha: str) -> Optional[set[str]]:
+        """Get paths changed between `commit_sha` and the pull request head.
+
+        Returns None when the head is not a fast-forward of `commit_sha`, the
+        commit is gone, or the comparison is too large to be listed completely.
+        """
+        try:
+            comparison = self._git_repository.compare(
+                commit_sha, self._git_pull_request.head.sha
+            )
+        except GithubException:
+            return None
+
+        if comparison.status not in ("ahead", "identical"):
+            return None
+        files = list(comparison.files)
+        if len(files) >= GithubRetriever.MAX_COMPARE_FILES:
+            return None
+
+        changed_paths = set()
+        for git_file in files:
+            changed_paths.add(git_file.filename)
+            if git_file.previous_filename:
+                changed_paths.add(git_file.previous_filename)
+        return changed_paths
+
     def _build_repository(self, git_repo: GHRepo) -> Repository:
         """Build a Repository object from a GHRepo instance."""
         return Repository(
@@ -82,38 +117,50 @@ class GithubRetriever():
             raw=git_pr,
         )
     
-    def _build_change_file_list(self, git_pr: GHPullRequest) -> list[ChangeFile]:
+    def _build_change_file_list(self, git_pr: GHPullRequest) -> list[CompactChangeFile]:
+        # Shared by all change files.
+        start_commit_sha = bytes.fromhex(git_pr.base.sha)
+        end_commit_sha = bytes.fromhex(git_pr.head.sha)
         change_files = []
         for file in git_pr.get_files():
-            change_file = self._build_change_file(file, git_pr)
+            change_file = self._build_change_file(
+                file, git_pr, start_commit_sha, end_commit_sha
+            )
             change_files.append(change_file)
+            # Github leaves out the patch of binary and large files.
+            if not file.patch and file.changes > 0:
+                self._truncated_paths.add(file.filename)
         return change_files
     
     def _build_change_file(
-        self, git_file: GithubFile, git_pr: GHPullRequest
-    ) -> ChangeFile:
+        self,
+        git_file: GithubFile,
+        git_pr: GHPullRequest,
+        start_commit_sha: bytes,
+        end_commit_sha: bytes,
+    ) -> CompactChangeFile:
         full_name = git_file.filename
-        name = full_name.split("/")[-1]
-        suffix = name.split(".")[-1]
         source_full_name = (
             git_file.previous_filename if git_file.previous_filename else full_name
         )
 
-        return ChangeFile(
-            blob_id=int(git_file.sha, 16),
-            sha=git_file.sha,
+        return CompactChangeFile(
+            blob_sha=bytes.fromhex(git_file.sha),
             full_name=full_name,
             source_full_name=source_full_name,
-            name=name,
-            suffix=suffix,
             status=self._convert_status(git_file.status),
             pull_request_id=git_pr.id,
-            start_commit_id=int(git_pr.base.sha, 16),
-            end_commit_id=int(git_pr.head.sha, 16),
+            start_commit_sha=start_commit_sha,
+            end_commit_sha=end_commit_sha,
             diff_url=self._build_change_file_diff_url(git_file, git_pr),
-            blob_url=git_file.blob_url,
-            diff_content=self._parse_and_build_diff_content(git_file),
-            raw=git_file,
+            blob_url=git_file.blob_url or "",
+            diff_loader=partial(
+                self._parse_and_build_diff_content,
+                git_file.patch,
+                git_pr.base.sha,
+                git_file.sha,
+                full_name,
+            ),
         )
     
     def _convert_status(self, git_status: str) -> ChangeStatus:
@@ -125,80 +172,99 @@ class GithubRetriever():
         return f"{git_pr.html_url}/files#diff-{git_file.sha}"
     
 
-    def _parse_and_build_diff_content(self, git_file: GithubFile) -> DiffContent:
-        patched_file = self._build_patched_file(git_file)
-        patched_segs: list[DiffSegment] = self._build_patched_file_segs(patched_file)
+    def _parse_and_build_diff_content(
+        self, patch: Optional[str], base_sha: str, blob_sha: str, path: str
+    ) -> CompactDiff:
+        if self._diff_cache is not None:
+            cached = self._diff_cache.get_diff_content(base_sha, blob_sha, path)
+            if cached is not None:
+                return cached
 
-        # TODO: retrive long content from blob.
-        return DiffContent(
-            add_count=patched_file.added,
-            remove_count=patched_file.removed,
-            content=git_file.patch if git_file.patch else "",
-            diff_segments=patched_segs,
-        )
-    
-    def _build_patched_file(self, git_file: GithubFile):
-        prev_name = (
-            git_file.previous_filename
-            if git_file.previous_filename
-            else git_file.filename
-        )
-        return parse_patch_file(git_file.patch, prev_name, git_file.filename)
-    
-    def _build_patched_file_segs(self, patched_file) -> list[DiffSegment]:
-        patched_segs = []
-        for patched_hunk in patched_file:
-            patched_segs.append(self._build_patch_segment(patched_hunk))
-        return patched_segs
-    
-    def _build_patch_segment(self, patched_hunk) -> DiffSegment:
-        return DiffSegment(
-            add_count=patched_hunk.added or 0,
-            remove_count=patched_hunk.removed or 0,
-            content=str(patched_hunk),
-            source_start_line_number=patched_hunk.source_start,
-            source_length=patched_hunk.source_length,
-            target_start_line_number=patched_hunk.target_start,
-            target_length=patched_hunk.target_length,
-        )
-    
-
-    def get_repository(self) -> Repository:
-        """Get the repository details."""
-        return self._build_repository(self._git_repository)
-
-    
+        with span("parse", path=path, patch_bytes=len(patch) if patch else 0):
+            diff_content = build_compact_diff(patch)
 
+        # A missing patch is not cached, so a diff built from blobs can be.
+        if self._diff_cache is not None and patch:
+            self._diff_cache.put_diff_content(base_sha, blob_sha, path, diff_content)
+        return diff_content
 
+    @traced("retrieve.prefetch", retriever="pygithub")
+    def prefetch_diff_contents(
+        self,
+        change_files: Optional[list[CompactChangeFile]] = None,
+        max_workers: int = 8,
+    ) -> None:
+        """Load the diffs of `change_files` (default all) that are not loaded yet.
 
+        Files whose patch Github left out are diffed from their base and head
+        blobs: one tree request for the base commit, then the blobs with
+        `max_workers` threads.
+        """
+        if change_files is None:
+            change_files = self.pull_request.change_files
+        truncated = [
+            cf for cf in change_files
+            if not cf.diff_loaded and cf.full_name in self._truncated_paths
+        ]
+        if truncated:
+            self._fetch_truncated_diffs(truncated, max_workers)
+        for change_file in change_files:
+            if not change_file.diff_loaded:
+                change_file.diff_content
 
+    def _fetch_truncated_diffs(
+        self, change_files: list[CompactChangeFile], max_workers: int
+    ) -> None:
+        base_sha = self._git_pull_request.base.sha
+        if self._diff_cache is not None:
+            missing = []
+            for change_file in change_files:
+                cached = self._diff_cache.get_diff_content(
+                    base_sha, change_file.sha, change_file.full_name
+                )
+                if cached is not None:
+                    change_file.diff_content = cached
+                else:
+                    missing.append(change_file)
+            change_files = missing
+        if not change_files:
+            return
 
-# def get_pull_request_files(self) -> list[dict]:
-#         """Get the list of files changed in the pull request with their statuses and contents."""
-#         files = self._git_pull_request.get_files()
-#         pull_request_head_sha = self._git_pull_request.head.sha
+        base_tree = self._git_repository.get_git_tree(base_sha, recursive=True)
+        base_paths = {
+            element.path: element.sha for element in base_tree.tree if element.type == "blob"
+        }
 
-#         file_details = []
-#         for file in files:
-#             file_info = {
-#                 "filename": file.filename,
-#                 "status": self.GITHUB_STATUS_MAPPING.get(file.status, file.status),
-#                 "additions": file.additions,
-#                 "deletions": file.deletions,
-#                 "changes": file.changes,
-#                 "patch": file.patch,  # Diff of the changes
-#             }
+        def fetch_blob(sha: Optional[str]) -> Optional[str]:
+            if sha is None:
+                return ""
+            git_blob = self._git_repository.get_git_blob(sha)
+            if git_blob.size > MAX_BLOB_BYTES:
+                return None
+            return decode_blob(base64.b64decode(git_blob.content))
 
-#             # Fetch the file content if the file is not deleted
-#             if file.status != "removed":
-#                 try:
-#                     contents = self._git_repository.get_contents(file.filename, ref=pull_request_head_sha)
-#                     file_info["content"] = base64.b64decode(contents.content).decode('utf-8')
-#                 except Exception as e:
-#                     file_info["content"] = f"Error fetching content: {str(e)}"
-#             else:
-#                 file_info["content"] = None  # No content for removed files
+        def build(change_file: CompactChangeFile) -> None:
+            source_sha = (
+                None if change_file.status == ChangeStatus.addition
+                else base_paths.get(change_file.source_full_name)
+            )
+            target_sha = None if change_file.status == ChangeStatus.deletion else change_file.sha
+            source, target = fetch_blob(source_sha), fetch_blob(target_sha)
+            if source is None or target is None:
+                diff_content = CompactDiff.empty()
+            else:
+                diff_content = build_compact_diff(build_patch(source, target))
+            change_file.diff_content = diff_content
+            self._truncated_paths.discard(change_file.full_name)
+            if self._diff_cache is not None:
+                self._diff_cache.put_diff_content(
+                    base_sha, change_file.sha, change_file.full_name, diff_content
+                )
 
-#             file_details.append(file_info)
+        with ThreadPoolExecutor(max_workers) as executor:
+            list(executor.map(build, change_files))
+    
 
-#         return file_details
+    def get_repository(self) -> Repository:
+        """Get the repository details."""
+        return self._build_repository(self._git_repository)
@@ -1,102 +1,696 @@
-from github import Github
+from __future__ import annotations
 import os
 import asyncio
+import importlib
+import logging
+import math
+import aiohttp
+from pathlib import Path
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
 from dotenv import load_dotenv
-from github_retriever import GithubRetriever, ChangeFile
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from async_github_retriever import AsyncGithubRetriever
+from git_retriever import MIRROR_DIR_ENV, GitCommandError, GitMirror, GitMirrorRetriever
+from utils.github_http import GithubHttpClient
+from utils.request_scheduler import PRIORITY_NORMAL
+from cache import CommentIndex, ContextCache, DiffCache, LLMCache, ResponseCache
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate
 import prompt_templates.grimoire as grimoire
-from utils.output_struc import Comment
-
-
-def list_repositories():
-    github_token = os.getenv("GITHUB_TOKEN")
-
-    if not github_token:
-        raise ValueError("GITHUB_TOKEN environment variable not set.")
-
-    # Authenticate with GitHub
-    gh = Github(github_token)
-
-    # Fetch all repositories for the authenticated user
-    user = gh.get_user()
-    repos = user.get_repos()
-
-    # Print repository names
-    for repo in repos:
-        print(repo.full_name)
-
-
-if __name__ == "__main__":
-    list_repositories()
-
-
-async def analyze_pr(retriever: GithubRetriever):
-    llm = ChatOpenAI(
-        api_key=os.getenv("INPUT_OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY"),
-        model="gpt-4o-mini",
-        max_retries=2,
+from utils.output_struc import Comment, Finding
+from models import ChangeFile, ChangeSummary, ReviewState
+from processors import (
+    ContextIndex, DiffLineIndex, ModelRouter, PathIndex, PullRequestProcessor, PromptPacker, RoutingConfig, Shard, ShardPlanner,
+)
+from processors.context_index import DEFAULT_MAX_NEW_BLOBS, DEFAULT_MAX_NEW_REST_BLOBS
+from processors.prompt_packer import DEFAULT_TOKEN_BUDGET, DEFAULT_FILE_TOKEN_BUDGET
+from processors.review_comments import finding_path, parse_findings, plan_inline_review
+from progressive_comment import DEFAULT_UPDATE_INTERVAL, ProgressiveComment
+from utils.llm_pool import BackendConfig, LLMPool, PoolConfig
+from utils.stub_llm import STUB_MODEL, StubChatModel
+from utils.telemetry import span, telemetry, traced
+from utils.token_utils import count_tokens, truncate_to_tokens
+from pr_summary.code_summary import DEFAULT_MAX_CONCURRENCY, ContextCallable, asummarize_change_files
+
+if TYPE_CHECKING:
+    # PyGithub is only needed by the synchronous retriever.
+    from github_retriever import GithubRetriever
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+
+def build_chat_model(config: BackendConfig) -> BaseChatModel:
+    """Build the chat model of one pool backend; the `stub` model answers offline."""
+    if config.model == STUB_MODEL:
+        return StubChatModel()
+    # Imported on first use: langchain_openai and openai take most of the startup time.
+    from langchain_openai import ChatOpenAI
+
+    api_key = os.getenv(config.api_key_env) if config.api_key_env else None
+    return ChatOpenAI(
+        api_key=api_key or os.getenv("INPUT_OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY"),
+        base_url=config.base_url,
+        model=config.model,
+        max_retries=config.max_retries,
+        timeout=config.timeout,
     )
 
+
+def build_llm(
+    cache: Optional[LLMCache] = None,
+    model: Optional[str] = None,
+    pool_config: Optional[PoolConfig] = None,
+) -> LLMPool:
+    """Build the backend pool used as chat model, answering repeated requests from `cache`.
+
+    Backends come from `pool_config`, else one backend of `model` when
+    given, else `$PR_AGENT_LLM_BACKENDS`, else one gpt-4o-mini backend.
+    """
+    if pool_config is None:
+        if model is None:
+            pool_config = PoolConfig.from_env()
+        if pool_config is None:
+            pool_config = PoolConfig(backends=[BackendConfig(model=model or DEFAULT_MODEL)])
+    return LLMPool.from_config(pool_config, build_chat_model, cache=cache)
+
+
+def model_llm(llm: BaseChatModel, model: str) -> BaseChatModel:
+    """The chat model answering with `model` in place of `llm`.
+
+    A pool gives its own pool of `model`, built once and shared by every
+    job using the pool; any other chat model gets a new pool.
+    """
+    if isinstance(llm, LLMPool):
+        return llm.with_model(model)
+    return build_llm(llm.cache, model)
+
+
+ANALYZE_HUMAN_PROMPT = (
+    "{part}{change_files}\n\nHere are the summaries of each file change:\n{code_summaries}"
+)
+
+
+async def analyze_pr(
+    retriever: GithubRetriever | AsyncGithubRetriever,
+    code_summaries: list[ChangeSummary],
+    llm: Optional[BaseChatModel] = None,
+    packer: Optional[PromptPacker] = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+) -> Comment:
+    """Reduce stage: review the pull request from its file summaries.
+
+    When the file listing and summaries do not fit the packer's budget, the
+    files are split into shards by ShardPlanner, at most `max_concurrency`
+    shards are reviewed at once, and the partial reviews are merged by
+    `merge_reviews`.
+    """
+    llm = llm or build_llm()
+    packer = packer or PromptPacker()
+    change_files = retriever.pull_request.change_files
+
+    planner = ShardPlanner(packer.token_budget - count_tokens(grimoire.PR_SUMMARY))
+    with span("prompt.build", stage="shard", files=len(change_files)):
+        shards = planner.plan(change_files, code_summaries)
+    if len(shards) <= 1:
+        return await _analyze_files(change_files, code_summaries, llm, packer)
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def analyze_shard(shard: Shard) -> tuple[str, Comment]:
+        async with semaphore:
+            with span("analyze.shard", shard=shard.label, files=len(shard.change_files)):
+                comment = await _analyze_files(
+                    shard.change_files, shard.code_summaries, llm, packer, shard.label
+                )
+        return shard.label, comment
+
+    reviews = await asyncio.gather(*(analyze_shard(shard) for shard in shards))
+    return await merge_reviews(list(reviews), llm, packer, max_concurrency)
+
+
+async def _analyze_files(
+    change_files: list[ChangeFile],
+    code_summaries: list[ChangeSummary],
+    llm: BaseChatModel,
+    packer: PromptPacker,
+    shard_label: Optional[str] = None,
+) -> Comment:
+    """Review a set of files, the whole pull request unless `shard_label` is given."""
     structured_llm = llm.with_structured_output(Comment)
 
     prompt_template = ChatPromptTemplate.from_messages(
         [
             ("system", grimoire.PR_SUMMARY),
-            ("human", "Here are the file changes to analyze: {change_files}"),
+            ("human", ANALYZE_HUMAN_PROMPT),
         ]
     )
 
     chain = prompt_template | structured_llm
 
-    result = await chain.ainvoke({"change_files": retriever.pull_request.change_files})
+    part = ""
+    if shard_label is not None:
+        part = f"This PR is too large to review at once; review the part covering {shard_label}.\n\n"
+    with span("prompt.build", stage="analyze", files=len(code_summaries)):
+        material = PullRequestProcessor.gen_material_change_files(change_files)
+        summaries_budget = packer.token_budget - count_tokens(
+            grimoire.PR_SUMMARY + part + material
+        )
+        packed_summaries = packer.pack_code_summaries(code_summaries, max(summaries_budget, 0))
+
+    result = await chain.ainvoke(
+        {
+            "part": part,
+            "change_files": material,
+            "code_summaries": packed_summaries,
+        }
+    )
 
     return result
 
 
-def find_or_create_bot_comment(
-    repo, pr_number, bot_username, comment_body, retriever: GithubRetriever
-):
+def render_partial_review(label: str, comment: Comment) -> str:
+    """Format a shard's review as material for merge_reviews."""
+    lines = [
+        f"Part: {label}",
+        f"Category: {comment.pr_category}",
+        f"Description: {comment.changes_description}",
+        f"Objective: {comment.objective}",
+    ]
+    if comment.important_changes:
+        lines.append(f"Important changes: {', '.join(comment.important_changes)}")
+    return "\n".join(lines)
+
+
+def _batch_reviews(texts: list[str], token_budget: int) -> list[range]:
+    """Split consecutive reviews into batches of at least two within the budget where possible."""
+    batches = []
+    start, tokens = 0, 0
+    for index, text in enumerate(texts):
+        text_tokens = count_tokens(text)
+        if index - start >= 2 and tokens + text_tokens > token_budget:
+            batches.append(range(start, index))
+            start, tokens = index, 0
+        tokens += text_tokens
+    batches.append(range(start, len(texts)))
+    return batches
+
+
+async def merge_reviews(
+    reviews: list[tuple[str, Comment]],
+    llm: BaseChatModel,
+    packer: PromptPacker,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+) -> Comment:
+    """Merge labelled partial reviews into one, hierarchically.
+
+    Consecutive reviews are merged in batches that fit the packer's budget,
+    concurrently, and the merged reviews are merged again until one is left.
+    """
+    structured_llm = llm.with_structured_output(Comment)
+    prompt_template = ChatPromptTemplate.from_messages(
+        [("system", grimoire.PR_REVIEW_MERGE), ("human", "{reviews}")]
+    )
+    chain = prompt_template | structured_llm
+    token_budget = packer.token_budget - count_tokens(grimoire.PR_REVIEW_MERGE)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def merge(batch: list[tuple[str, Comment]], texts: list[str]) -> tuple[str, Comment]:
+        if len(batch) == 1:
+            return batch[0]
+        share = token_budget // len(texts)
+        material = "\n\n".join(truncate_to_tokens(text, share) for text in texts)
+        async with semaphore:
+            with span("analyze.merge", parts=len(batch)):
+                comment = await chain.ainvoke({"reviews": material})
+        return f"{batch[0][0]} to {batch[-1][0]}", comment
+
+    while len(reviews) > 1:
+        texts = [render_partial_review(label, comment) for label, comment in reviews]
+        batches = _batch_reviews(texts, token_budget)
+        reviews = list(await asyncio.gather(
+            *(merge([reviews[i] for i in batch], [texts[i] for i in batch]) for batch in batches)
+        ))
+    return reviews[0][1]
+
+
+def render_review_comment(
+    comment_body: Comment,
+    retriever: GithubRetriever | AsyncGithubRetriever,
+    review_state: Optional[ReviewState] = None,
+    findings: Optional[list[Finding]] = None,
+    path_index: Optional[PathIndex] = None,
+) -> str:
+    """Render the review comment markdown, with the state marker if given.
+
+    `findings` are listed in the comment, for those that could not be posted
+    as inline comments. Important changes are linked to their diffs through
+    `path_index`, built from the retriever's change files if not given.
+    """
     changes_description = comment_body.changes_description
     pr_category = comment_body.pr_category
     important_changes = comment_body.important_changes
     objective = comment_body.objective
-    pr = repo.get_pull(pr_number)
 
+    path_index = path_index or PathIndex(retriever.pull_request.change_files)
     # Construct the "Important Changes" section with URLs
     important_changes_with_urls = []
-    for change in important_changes:
-        # Find the corresponding diff URL
-        diff_url = next(
-            (
-                change_file.diff_url
-                for change_file in retriever.pull_request.change_files
-                if change in change_file.full_name
-            ),
-            None,
-        )
+    for change in important_changes or []:
+        change_file = path_index.get(change)
+        diff_url = change_file.diff_url if change_file else None
         if diff_url:
             important_changes_with_urls.append(f"[{change}]({diff_url})")
         else:
             important_changes_with_urls.append(change)
 
-    comment_body = (
+    body = (
         f"### Changes Description\n{changes_description}\n\n"
         f"### PR Category\n{pr_category}\n\n"
         f"### Important Changes\n{', '.join(important_changes_with_urls)}\n\n"
         f"### Objective\n{objective}"
     )
+    if findings:
+        body += "\n\n### Findings\n" + "\n".join(
+            f"- `{finding.path}:{finding.line}` **{finding.kind}**: {finding.body}"
+            for finding in findings
+        )
+    if review_state is not None:
+        body += f"\n\n{review_state.to_marker()}"
+    return body
+
+
+PROGRESS_OVERVIEW_CHARS = 10000
+
+PROGRESS_SUMMARIES_CHARS = 20000
+"""Room for file summaries in the progress comment. Github caps a comment at
+65536 characters, including the review state marker."""
+
+
+def render_progress_comment(
+    overview: str,
+    summaries: dict[str, str],
+    file_count: int,
+    review_state: Optional[ReviewState] = None,
+) -> str:
+    """Render the comment shown while a review runs: the changed files and the summaries so far.
+
+    The previous review's state marker is kept, so an interrupted review
+    can still be resumed incrementally.
+    """
+    if len(overview) > PROGRESS_OVERVIEW_CHARS:
+        overview = overview[:PROGRESS_OVERVIEW_CHARS].rsplit("\n", 1)[0] + "\n..."
+    parts = [
+        f"### Review in progress\nSummarized {len(summaries)} of {file_count} files.",
+        f"### Changed Files\n{overview}",
+    ]
+    if summaries:
+        lines = []
+        remaining = PROGRESS_SUMMARIES_CHARS
+        for full_name, summary in summaries.items():
+            line = f"- **{full_name}**: {summary}"
+            remaining -= len(line) + 1
+            if remaining < 0:
+                lines.append(f"- ... ({len(summaries) - len(lines)} more)")
+                break
+            lines.append(line)
+        parts.append("### File Summaries\n" + "\n".join(lines))
+    if review_state is not None:
+        parts.append(review_state.to_marker())
+    return "\n\n".join(parts)
+
+
+def render_failed_comment(head_sha: str, error: BaseException) -> str:
+    """Render the comment left when the first review of a pull request fails."""
+    return (
+        f"### Review failed\nThe review of {head_sha[:7]} stopped with "
+        f"{type(error).__name__} and will run again on the next push."
+    )
 
-    bot_comment = None
-    for comment in pr.get_issue_comments():
-        if comment.user.login == bot_username:
-            bot_comment = comment
-            break
 
-    if bot_comment:
-        bot_comment.edit(body=comment_body)
+def _is_bot_comment(comment: dict, bot_username: str) -> bool:
+    # A state marker in anyone else's comment is a forgery.
+    return (comment.get("user") or {}).get("login") == bot_username
+
+
+async def fetch_bot_comment(
+    http_client: GithubHttpClient,
+    repo_full_name: str,
+    pr_number: int,
+    comment_count: int,
+    bot_username: Optional[str] = None,
+    comment_index: Optional[CommentIndex] = None,
+    priority: int = PRIORITY_NORMAL,
+) -> Optional[dict]:
+    """Fetch the comment holding the review as a REST dict.
+
+    Only comments written by `bot_username`, by default the client's own
+    login, are considered. A comment id remembered in `comment_index` is
+    fetched directly in one request. Otherwise every comment page, sized
+    from `comment_count`, is fetched at once, the bot's comment carrying the
+    state marker is preferred, and the id found is remembered for the next
+    run.
+    """
+    bot_username = bot_username or await http_client.login()
+    repo_path = f"/repos/{repo_full_name}"
+    comment_id = comment_index.get(repo_full_name, pr_number) if comment_index else None
+    if comment_id is not None:
+        try:
+            comment = await http_client.get_json(
+                f"{repo_path}/issues/comments/{comment_id}", priority=priority
+            )
+            if _is_bot_comment(comment, bot_username):
+                return comment
+        except aiohttp.ClientResponseError as e:
+            if e.status != 404:
+                raise
+        comment_index.delete(repo_full_name, pr_number)
+
+    page_count = math.ceil(comment_count / http_client.PER_PAGE)
+    comments = await http_client.get_pages(
+        f"{repo_path}/issues/{pr_number}/comments",
+        range(1, page_count + 1),
+        priority=priority,
+    )
+    own = [c for c in comments if _is_bot_comment(c, bot_username)]
+    # Prefer the comment carrying the state marker over one merely by the author.
+    comment = next(
+        (c for c in own if ReviewState.MARKER_PREFIX in (c.get("body") or "")), None
+    ) or next(iter(own), None)
+
+    if comment is not None and comment_index is not None:
+        comment_index.put(repo_full_name, pr_number, comment["id"])
+    return comment
+
+
+async def post_bot_comment(
+    http_client: GithubHttpClient,
+    repo_full_name: str,
+    pr_number: int,
+    body: str,
+    comment_id: Optional[int] = None,
+    comment_index: Optional[CommentIndex] = None,
+) -> int:
+    """Edit the review comment, or create it if there is none. Returns its id.
+
+    A comment that is gone, or that the bot may not edit, is replaced by a
+    new one.
+    """
+    repo_path = f"/repos/{repo_full_name}"
+    comment = None
+    with span("comment.write", repo=repo_full_name, pr=pr_number, chars=len(body)):
+        if comment_id is not None:
+            try:
+                comment = await http_client.patch_json(
+                    f"{repo_path}/issues/comments/{comment_id}", {"body": body}
+                )
+            except aiohttp.ClientResponseError as e:
+                # Deleted since it was fetched, or written by someone else.
+                if e.status not in (403, 404):
+                    raise
+        if comment is None:
+            comment = await http_client.post_json(
+                f"{repo_path}/issues/{pr_number}/comments", {"body": body}
+            )
+
+    if comment_index is not None:
+        comment_index.put(repo_full_name, pr_number, comment["id"])
+    return comment["id"]
+
+
+async def post_review(
+    http_client: GithubHttpClient,
+    repo_full_name: str,
+    pr_number: int,
+    head_sha: str,
+    comments: list[dict],
+) -> Optional[int]:
+    """Post inline comments in one review of `head_sha`. Returns its id.
+
+    Returns None when Github rejects the comments, e.g. because the head
+    moved on and a line is no longer in the diff.
+    """
+    with span("review.write", repo=repo_full_name, pr=pr_number, comments=len(comments)):
+        try:
+            review = await http_client.post_json(
+                f"/repos/{repo_full_name}/pulls/{pr_number}/reviews",
+                {
+                    "commit_id": head_sha,
+                    "event": "COMMENT",
+                    "body": f"{len(comments)} finding(s) from the automated review.",
+                    "comments": comments,
+                },
+            )
+        except aiohttp.ClientResponseError as e:
+            if e.status != 422:
+                raise
+            logger.warning(
+                "Inline review rejected for %s#%d: %s", repo_full_name, pr_number, e.message
+            )
+            return None
+    return review["id"]
+
+
+@dataclass
+class ReviewJob:
+    """A retrieved pull request waiting for its review."""
+
+    retriever: AsyncGithubRetriever
+    head_sha: str
+    bot_comment: Optional[dict] = None
+    """The existing review comment as a REST dict, if any."""
+    previous_state: Optional[ReviewState] = None
+    changed_paths: Optional[set[str]] = None
+    routing_config: Optional[RoutingConfig] = None
+    """The repository's model routing settings; None disables routing."""
+
+
+async def retrieve_review_job(
+    http_client: GithubHttpClient,
+    repo_full_name: str,
+    pr_number: int,
+    bot_username: Optional[str] = None,
+    diff_cache: Optional[DiffCache] = None,
+    incremental: bool = True,
+    priority: int = PRIORITY_NORMAL,
+    comment_index: Optional[CommentIndex] = None,
+    mirror_root: Optional[Path] = None,
+    routing: bool = True,
+) -> Optional[ReviewJob]:
+    """Retrieve a pull request, its previous review state and routing settings.
+
+    Change files are read from a local git mirror under `mirror_root` when
+    given, and from the REST API otherwise. Routing settings are read from
+    the base commit when `routing` is set. Returns None when the head commit
+    was already reviewed.
+    """
+    if mirror_root is not None:
+        retriever = await GitMirrorRetriever.create(
+            http_client, repo_full_name, pr_number, mirror_root, priority
+        )
     else:
-        pr.create_issue_comment(body=comment_body)
+        retriever = await AsyncGithubRetriever.create(
+            http_client, repo_full_name, pr_number, diff_cache, priority
+        )
+    head_sha = retriever.pull_request.raw["head"]["sha"]
+
+    bot_comment, routing_config = await asyncio.gather(
+        fetch_bot_comment(
+            http_client,
+            repo_full_name,
+            pr_number,
+            retriever.pull_request.raw.get("comments", 0),
+            bot_username,
+            comment_index,
+            priority,
+        ),
+        RoutingConfig.fetch(
+            http_client, repo_full_name, retriever.pull_request.raw["base"]["sha"], priority
+        ) if routing else asyncio.sleep(0),
+    )
+    previous_state = (
+        ReviewState.from_comment_body(bot_comment["body"])
+        if incremental and bot_comment
+        else None
+    )
+
+    changed_paths = None
+    if previous_state is not None:
+        if previous_state.head_sha == head_sha:
+            return None
+        changed_paths = await retriever.get_changed_paths_since(
+            previous_state.head_sha
+        )
+
+    return ReviewJob(
+        retriever=retriever,
+        head_sha=head_sha,
+        bot_comment=bot_comment,
+        previous_state=previous_state,
+        changed_paths=changed_paths,
+        routing_config=routing_config,
+    )
+
+
+def review_context(job: ReviewJob, context_cache: ContextCache) -> ContextCallable:
+    """Context for the summary prompts, from a ContextIndex of the base commit.
+
+    The index is updated when the files left to summarize are known,
+    parsing fewer new blobs per review when each is a REST request. A
+    failure to read the repository only costs the context.
+    """
+    source = job.retriever.blob_source()
+    max_new_blobs = (
+        DEFAULT_MAX_NEW_BLOBS if isinstance(source, GitMirror) else DEFAULT_MAX_NEW_REST_BLOBS
+    )
+    index = ContextIndex(source, context_cache, max_new_blobs)
+    base_sha = job.retriever.pull_request.raw["base"]["sha"]
+
+    async def context(change_files: list[ChangeFile]) -> dict[str, str]:
+        try:
+            await index.update(base_sha)
+            return await index.contexts(change_files)
+        except (aiohttp.ClientError, GitCommandError) as e:
+            logger.warning(
+                "No context index for %s: %s", job.retriever.repository.repository_full_name, e
+            )
+            return {}
+
+    return context
+
+
+@traced("review")
+async def run_review_job(
+    job: ReviewJob,
+    llm: BaseChatModel,
+    http_client: GithubHttpClient,
+    diff_cache: Optional[DiffCache] = None,
+    packer: Optional[PromptPacker] = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    comment_index: Optional[CommentIndex] = None,
+    progress_interval: Optional[float] = None,
+    inline_comments: bool = True,
+    context_cache: Optional[ContextCache] = None,
+) -> Comment:
+    """Summarize, analyze and post the review of a retrieved pull request.
+
+    With routing settings, the job's files are routed between rules, the
+    repository's small model and `llm` (or its `large_model` override).
+    With a `progress_interval`, the comment first shows the changed files
+    and is then updated with file summaries as they complete, at most once
+    per interval, before the final review replaces it. Should the review
+    fail, the comment is restored to the previous review, or says that the
+    review failed when there was none.
+    With `inline_comments`, the findings the file summaries end with are
+    posted in one review when on lines shown in the diff, skipping those
+    already posted on the same lines, and the rest are listed in the
+    comment. With a `context_cache`, summary prompts get the definitions
+    around each file's changes and their callers, from an index of the
+    repository kept in the cache.
+    """
+    router = None
+    config = job.routing_config
+    if config is not None and config.enabled:
+        if config.large_model:
+            llm = model_llm(llm, config.large_model)
+        small_llm = model_llm(llm, config.small_model) if config.small_model else None
+        router = ModelRouter(config, small_llm)
+
+    repo_full_name = job.retriever.repository.repository_full_name
+    pr_number = job.retriever.pull_request.pull_request_number
+    change_files = job.retriever.pull_request.change_files
+    comment_id = job.bot_comment["id"] if job.bot_comment else None
+
+    async def post(body: str) -> None:
+        nonlocal comment_id
+        comment_id = await post_bot_comment(
+            http_client, repo_full_name, pr_number, body, comment_id, comment_index
+        )
+
+    progress = None
+    summaries: dict[str, str] = {}
+    if progress_interval is not None:
+        overview = PullRequestProcessor.gen_material_change_files(change_files)
+        progress = ProgressiveComment(
+            post,
+            lambda: render_progress_comment(
+                overview, summaries, len(change_files), job.previous_state
+            ),
+            progress_interval,
+        )
+        progress.changed()
+
+    def on_summary(summary: ChangeSummary) -> None:
+        summaries[summary.full_name] = summary.summary
+        progress.changed()
+
+    try:
+        code_summaries = await asummarize_change_files(
+            llm,
+            change_files,
+            max_concurrency=max_concurrency,
+            previous_summaries=job.previous_state.file_summaries if job.previous_state else None,
+            changed_paths=job.changed_paths,
+            diff_cache=diff_cache,
+            packer=packer,
+            prefetch=job.retriever.prefetch_diff_contents,
+            router=router,
+            on_summary=on_summary if progress is not None else None,
+            context=review_context(job, context_cache) if context_cache is not None else None,
+        )
+
+        result = await analyze_pr(job.retriever, code_summaries, llm, packer, max_concurrency)
+    except BaseException as e:
+        if progress is not None:
+            await progress.close()
+            if progress.stats["posts"]:
+                # Take the progress placeholder down again.
+                try:
+                    await post(
+                        job.bot_comment["body"] if job.bot_comment
+                        else render_failed_comment(job.head_sha, e)
+                    )
+                except Exception:
+                    logger.warning(
+                        "Could not restore the comment of %s#%d",
+                        repo_full_name, pr_number, exc_info=True,
+                    )
+        raise
+
+    path_index = PathIndex(change_files)
+    # Keys of files no longer in the pull request can never match again.
+    posted_findings = [
+        key for key in (job.previous_state.posted_findings if job.previous_state else [])
+        if finding_path(key) in path_index
+    ]
+    unplaced = parse_findings(code_summaries)
+    if inline_comments and unplaced:
+        inline_review = plan_inline_review(
+            unplaced, DiffLineIndex(change_files, path_index), posted_findings
+        )
+        unplaced = inline_review.unplaced
+        if inline_review.comments:
+            review_id = await post_review(
+                http_client, repo_full_name, pr_number, job.head_sha, inline_review.comments
+            )
+            if review_id is not None:
+                posted_findings += inline_review.keys
+            else:
+                unplaced = inline_review.placed + unplaced
+
+    review_state = ReviewState(
+        head_sha=job.head_sha,
+        file_summaries={
+            summary.full_name: summary.summary for summary in code_summaries
+        },
+        posted_findings=posted_findings,
+    )
+    body = render_review_comment(result, job.retriever, review_state, unplaced, path_index)
+    if progress is not None:
+        await progress.finish(body)
+    else:
+        await post(body)
+    return result
 
 
 async def main():
@@ -116,21 +710,100 @@ async def main():
     except ValueError:
         raise ValueError("Invalid PR_NUMBER format.")
 
-    gh = Github(github_token)
-    repo_name = os.getenv("INPUT_REPO_NAME") or os.getenv("REPO_NAME")
-    repo = gh.get_repo(f"kasagi-labo/{repo_name}")
-
-    retriever = GithubRetriever(gh, repo.full_name, pr_number)
-
-    result = await analyze_pr(retriever)
-
-    bot_username = os.getenv("GITHUB_ACTOR")
+    incremental = (os.getenv("INPUT_INCREMENTAL") or "true").lower() == "true"
+    routing = (os.getenv("INPUT_ROUTING") or "true").lower() == "true"
+    progressive = (os.getenv("INPUT_PROGRESSIVE") or "true").lower() == "true"
+    inline_comments = (os.getenv("INPUT_INLINE_COMMENTS") or "true").lower() == "true"
+    use_context_index = (os.getenv("INPUT_CONTEXT_INDEX") or "false").lower() == "true"
+    max_concurrency = int(
+        os.getenv("INPUT_MAX_CONCURRENCY") or DEFAULT_MAX_CONCURRENCY
+    )
+    packer = PromptPacker(
+        token_budget=int(os.getenv("INPUT_TOKEN_BUDGET") or DEFAULT_TOKEN_BUDGET),
+        file_token_budget=int(
+            os.getenv("INPUT_FILE_TOKEN_BUDGET") or DEFAULT_FILE_TOKEN_BUDGET
+        ),
+    )
 
-    find_or_create_bot_comment(repo, pr_number, bot_username, result, retriever)
+    # Github sets GITHUB_REPOSITORY to the repository running the workflow.
+    repo_name = (
+        os.getenv("INPUT_REPO_NAME") or os.getenv("REPO_NAME") or os.getenv("GITHUB_REPOSITORY")
+    )
+    if not repo_name:
+        raise ValueError("REPO_NAME not found.")
+    if "/" in repo_name:
+        repo_full_name = repo_name
+    else:
+        owner = os.getenv("GITHUB_REPOSITORY_OWNER")
+        if not owner:
+            raise ValueError("GITHUB_REPOSITORY_OWNER not found for a REPO_NAME without owner.")
+        repo_full_name = f"{owner}/{repo_name}"
+    diff_cache = DiffCache()
+    response_cache = ResponseCache()
+    comment_index = CommentIndex()
+    use_llm_cache = (os.getenv("INPUT_LLM_CACHE") or "true").lower() == "true"
+    llm_cache = LLMCache() if use_llm_cache else None
+    context_cache = ContextCache() if use_context_index else None
+    llm = None
+    # Resolved from the token when not given, e.g. for a Github App's token.
+    bot_username = os.getenv("INPUT_BOT_USERNAME") or None
+    mirror_dir = os.getenv(MIRROR_DIR_ENV)
+    telemetry.configure()
+    # The OpenAI client is imported while the pull request is retrieved,
+    # so its import time overlaps the network wait.
+    warm_up = asyncio.ensure_future(asyncio.to_thread(importlib.import_module, "langchain_openai"))
 
-    gh.close()
+    try:
+        async with GithubHttpClient(
+            github_token, response_cache=response_cache
+        ) as http_client:
+            job = await retrieve_review_job(
+                http_client,
+                repo_full_name,
+                pr_number,
+                bot_username,
+                diff_cache,
+                incremental,
+                comment_index=comment_index,
+                mirror_root=Path(mirror_dir) if mirror_dir else None,
+                routing=routing,
+            )
+            if job is None:
+                logger.info("Head of %s#%d was already reviewed", repo_full_name, pr_number)
+                return
+
+            await warm_up
+            llm = build_llm(llm_cache)
+            await run_review_job(
+                job,
+                llm,
+                http_client,
+                diff_cache,
+                packer,
+                max_concurrency,
+                comment_index,
+                DEFAULT_UPDATE_INTERVAL if progressive else None,
+                inline_comments,
+                context_cache,
+            )
+    finally:
+        # Not awaited when returning early. The import thread finishes regardless,
+        # but the task is cancelled and collected rather than left pending.
+        warm_up.cancel()
+        await asyncio.gather(warm_up, return_exceptions=True)
+        if llm is not None:
+            logger.info("LLM pool: %s", llm.stats)
+        if llm_cache is not None:
+            logger.info("LLM cache: %s", llm_cache.stats)
+            llm_cache.close()
+        if context_cache is not None:
+            context_cache.close()
+        comment_index.close()
+        response_cache.close()
+        diff_cache.close()
+        telemetry.close()
 
 
 if __name__ == "__main__":
-    list_repositories()
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
@@ -5,5 +5,7 @@ from .change_file import ChangeFile,ChangeStatus
 from .diff import DiffContent,DiffSegment
 from .pr_summary import PRSummary
 from .change_summary import ChangeSummary
+from .review_state import ReviewState
+from .compact import CompactChangeFile, CompactDiff, SegmentView
 
-__all__ = ['PullRequest', 'Repository','Issue','ChangeFile','DiffContent','DiffSegment','ChangeStatus','PRSummary','ChangeSummary']
\ No newline at end of file
+__all__ = ['PullRequest', 'Repository','Issue','ChangeFile','DiffContent','DiffSegment','ChangeStatus','PRSummary','ChangeSummary','ReviewState','CompactChangeFile','CompactDiff','SegmentView']
\ No newline at end of file
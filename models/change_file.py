@@ -27,6 +27,17 @@ class ChangeStatus(str, Enum):
     """Unknown change type (most probably a bug, please report it)"""
 
 
+GITHUB_STATUS_MAPPING = {
+    "added": "A",
+    "copied": "C",
+    "removed": "D",
+    "modified": "M",
+    "renamed": "R",
+    "type_change": "T",
+}
+"""Github file status to ChangeStatus value."""
+
+
 class ChangeFile(BaseModel):
     """A changed file between two commit."""
 
@@ -0,0 +1,295 @@
+"""Compact in-memory forms of ChangeFile, DiffContent and DiffSegment.
+
+These hold the same information as the pydantic models in a fraction of the
+memory: hunks are rows of one integer array pointing into the file's single
+patch string, shas are 20 byte `bytes` shared between the files of a pull
+request, and no raw API objects are kept. They expose the attributes of the
+models they stand for, so the processors accept either; `to_model` builds
+the pydantic model where one is needed for validation or serialization.
+"""
+from __future__ import annotations
+
+from array import array
+from typing import Callable, Iterable, Optional
+
+from .change_file import ChangeFile, ChangeStatus
+from .diff import DiffContent, DiffSegment
+
+_COLUMNS = 8
+# Row layout of CompactDiff.hunks.
+_START, _END, _SOURCE_START, _SOURCE_LENGTH, _TARGET_START, _TARGET_LENGTH, _ADD, _REMOVE = range(_COLUMNS)
+
+
+class SegmentView:
+    """A DiffSegment read from a row of a CompactDiff."""
+
+    __slots__ = ("_diff", "_row")
+
+    def __init__(self, diff: CompactDiff, index: int):
+        self._diff = diff
+        self._row = index * _COLUMNS
+
+    def _get(self, column: int) -> int:
+        return self._diff.hunks[self._row + column]
+
+    @property
+    def add_count(self) -> int:
+        return self._get(_ADD)
+
+    @property
+    def remove_count(self) -> int:
+        return self._get(_REMOVE)
+
+    @property
+    def content(self) -> str:
+        return self._diff.content[self._get(_START):self._get(_END)]
+
+    @property
+    def source_start_line_number(self) -> int:
+        return self._get(_SOURCE_START)
+
+    @property
+    def source_length(self) -> int:
+        return self._get(_SOURCE_LENGTH)
+
+    @property
+    def target_start_line_number(self) -> int:
+        return self._get(_TARGET_START)
+
+    @property
+    def target_length(self) -> int:
+        return self._get(_TARGET_LENGTH)
+
+    def to_model(self) -> DiffSegment:
+        return DiffSegment(
+            add_count=self.add_count,
+            remove_count=self.remove_count,
+            content=self.content,
+            source_start_line_number=self.source_start_line_number,
+            source_length=self.source_length,
+            target_start_line_number=self.target_start_line_number,
+            target_length=self.target_length,
+        )
+
+
+class CompactDiff:
+    """DiffContent whose segments are offsets into its patch."""
+
+    __slots__ = ("content", "add_count", "remove_count", "hunks")
+
+    def __init__(self, content: str, add_count: int, remove_count: int, hunks: array):
+        self.content = content
+        """The whole patch."""
+        self.add_count = add_count
+        self.remove_count = remove_count
+        self.hunks = hunks
+        """One row per hunk: start and end offsets in `content`, source start
+        and length, target start and length, added and removed line counts."""
+
+    @classmethod
+    def empty(cls) -> CompactDiff:
+        return cls("", 0, 0, array("i"))
+
+    @classmethod
+    def from_rows(cls, content: str, rows: Iterable[Iterable[int]]) -> CompactDiff:
+        """Build from `(start, end, source start, source length, target start,
+        target length, added, removed)` rows, such as diff_utils.HunkSpan."""
+        hunks = array("i")
+        for row in rows:
+            hunks.extend(row)
+        return cls(
+            content,
+            sum(hunks[_ADD::_COLUMNS]),
+            sum(hunks[_REMOVE::_COLUMNS]),
+            hunks,
+        )
+
+    @classmethod
+    def from_model(cls, diff_content: DiffContent) -> CompactDiff:
+        """Build from a DiffContent.
+
+        Segments are located in the patch; if one was re-rendered and is not
+        found verbatim, the buffer is rebuilt from the segment contents.
+        """
+        content = diff_content.content
+        segments = diff_content.diff_segments
+        spans = []
+        offset = 0
+        for segment in segments:
+            start = content.find(segment.content, offset)
+            if start == -1:
+                content = "".join(segment.content for segment in segments)
+                return cls.from_model(
+                    DiffContent(
+                        add_count=diff_content.add_count,
+                        remove_count=diff_content.remove_count,
+                        content=content,
+                        diff_segments=segments,
+                    )
+                )
+            offset = start + len(segment.content)
+            spans.append((start, offset))
+
+        rows = []
+        for (start, end), segment in zip(spans, segments):
+            rows.append((
+                start,
+                end,
+                segment.source_start_line_number,
+                segment.source_length,
+                segment.target_start_line_number,
+                segment.target_length,
+                segment.add_count,
+                segment.remove_count,
+            ))
+        diff = cls.from_rows(content, rows)
+        diff.add_count = diff_content.add_count
+        diff.remove_count = diff_content.remove_count
+        return diff
+
+    @property
+    def segment_count(self) -> int:
+        return len(self.hunks) // _COLUMNS
+
+    @property
+    def diff_segments(self) -> list[SegmentView]:
+        return [SegmentView(self, index) for index in range(self.segment_count)]
+
+    def to_model(self) -> DiffContent:
+        return DiffContent(
+            add_count=self.add_count,
+            remove_count=self.remove_count,
+            content=self.content,
+            diff_segments=[segment.to_model() for segment in self.diff_segments],
+        )
+
+
+class CompactChangeFile:
+    """ChangeFile with shas kept as bytes and a lazily built CompactDiff.
+
+    Commit shas are shared by every file of a pull request, so callers pass
+    the same `bytes` objects for all of them. When built with `diff_loader`,
+    the diff is only loaded on first access of `diff_content`, so files that
+    are only listed by name are never parsed.
+    """
+
+    __slots__ = (
+        "blob_sha",
+        "full_name",
+        "source_full_name",
+        "status",
+        "pull_request_id",
+        "start_commit_sha",
+        "end_commit_sha",
+        "diff_url",
+        "blob_url",
+        "_diff_content",
+        "_diff_loader",
+    )
+
+    raw = None
+    """Raw API objects are not kept."""
+
+    def __init__(
+        self,
+        blob_sha: bytes,
+        full_name: str,
+        source_full_name: str,
+        status: ChangeStatus,
+        pull_request_id: int,
+        start_commit_sha: bytes,
+        end_commit_sha: bytes,
+        diff_url: str = "",
+        blob_url: str = "",
+        diff_content: Optional[CompactDiff] = None,
+        diff_loader: Optional[Callable[[], CompactDiff]] = None,
+    ):
+        self.blob_sha = blob_sha
+        self.full_name = full_name
+        # Unchanged paths share the full name string.
+        self.source_full_name = full_name if source_full_name == full_name else source_full_name
+        self.status = status
+        self.pull_request_id = pull_request_id
+        self.start_commit_sha = start_commit_sha
+        self.end_commit_sha = end_commit_sha
+        self.diff_url = diff_url
+        self.blob_url = blob_url
+        if diff_content is None and diff_loader is None:
+            diff_content = CompactDiff.empty()
+        self._diff_content = diff_content
+        self._diff_loader = diff_loader
+
+    @property
+    def diff_content(self) -> CompactDiff:
+        if self._diff_content is None:
+            self._diff_content = self._diff_loader()
+            self._diff_loader = None
+        return self._diff_content
+
+    @diff_content.setter
+    def diff_content(self, diff_content: CompactDiff) -> None:
+        self._diff_content = diff_content
+        self._diff_loader = None
+
+    @property
+    def diff_loaded(self) -> bool:
+        return self._diff_content is not None
+
+    @property
+    def sha(self) -> str:
+        return self.blob_sha.hex()
+
+    @property
+    def blob_id(self) -> int:
+        return int.from_bytes(self.blob_sha, "big")
+
+    @property
+    def start_commit_id(self) -> int:
+        return int.from_bytes(self.start_commit_sha, "big")
+
+    @property
+    def end_commit_id(self) -> int:
+        return int.from_bytes(self.end_commit_sha, "big")
+
+    @property
+    def name(self) -> str:
+        return self.full_name.rsplit("/", 1)[-1]
+
+    @property
+    def suffix(self) -> str:
+        return self.name.split(".")[-1]
+
+    def __repr__(self) -> str:
+        return f"CompactChangeFile({self.status.value} {self.full_name})"
+
+    @classmethod
+    def from_model(cls, change_file: ChangeFile) -> CompactChangeFile:
+        return cls(
+            blob_sha=change_file.blob_id.to_bytes(20, "big"),
+            full_name=change_file.full_name,
+            source_full_name=change_file.source_full_name,
+            status=change_file.status,
+            pull_request_id=change_file.pull_request_id,
+            start_commit_sha=change_file.start_commit_id.to_bytes(20, "big"),
+            end_commit_sha=change_file.end_commit_id.to_bytes(20, "big"),
+            diff_url=change_file.diff_url,
+            blob_url=change_file.blob_url,
+            diff_content=CompactDiff.from_model(change_file.diff_content),
+        )
+
+    def to_model(self) -> ChangeFile:
+        return ChangeFile(
+            blob_id=self.blob_id,
+            sha=self.sha,
+            full_name=self.full_name,
+            source_full_name=self.source_full_name,
+            status=self.status,
+            pull_request_id=self.pull_request_id,
+            start_commit_id=self.start_commit_id,
+            end_commit_id=self.end_commit_id,
+            name=self.name,
+            suffix=self.suffix,
+            diff_url=self.diff_url,
+            blob_url=self.blob_url,
+            diff_content=self.diff_content.to_model(),
+        )
@@ -1,9 +1,11 @@
 from typing import Any
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from models.change_file import ChangeFile
+from models.compact import CompactChangeFile
 
 class PullRequest(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
     """Pull Request id (Global id. Not number/iid)"""
     pull_request_id: int = Field()  
     """Repository id this pull request belongs to."""
@@ -15,7 +17,7 @@ class PullRequest(BaseModel):
     body: str = Field(default="")
     """Pull Request url."""
     url: str = Field(default="")
-    change_files: list[ChangeFile] = Field(default_factory=list, exclude=True)
+    change_files: list[ChangeFile | CompactChangeFile] = Field(default_factory=list, exclude=True)
     """Repository name this pull request belongs to."""
     repository_name: str = Field(default="")
     """git PR raw object"""
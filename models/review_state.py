@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import base64
+import json
+import re
+import zlib
+from typing import ClassVar, Optional
+
+from pydantic import BaseModel, Field, ValidationError
+
+
+class ReviewState(BaseModel):
+    """State of the last review, stored as a hidden marker in the bot comment."""
+
+    MARKER_PREFIX: ClassVar[str] = "<!-- pr-review-agent:state "
+    MAX_MARKER_LENGTH: ClassVar[int] = 32000
+
+    head_sha: str = Field()
+    """Head commit sha the review was made on."""
+    file_summaries: dict[str, str] = Field(default_factory=dict)
+    """Per-file change summaries, keyed by file full name."""
+    posted_findings: list[str] = Field(default_factory=list)
+    """Keys of the findings posted as inline review comments, see
+    processors.review_comments.finding_key."""
+
+    def to_marker(self) -> str:
+        """Encode the state into an html comment invisible in rendered markdown.
+
+        File summaries are dropped if they would push the marker past
+        MAX_MARKER_LENGTH, keeping the comment under Github's body limit,
+        and then the oldest posted findings until it fits.
+        """
+        marker = self._encode(self.model_dump())
+        posted_findings = self.posted_findings
+        while len(marker) > self.MAX_MARKER_LENGTH:
+            marker = self._encode(
+                {"head_sha": self.head_sha, "posted_findings": posted_findings}
+            )
+            if not posted_findings:
+                break
+            posted_findings = posted_findings[len(posted_findings) // 2 + 1:]
+        return marker
+
+    def _encode(self, data: dict) -> str:
+        payload = base64.b64encode(
+            zlib.compress(json.dumps(data).encode())
+        ).decode()
+        return f"{self.MARKER_PREFIX}{payload} -->"
+
+    @classmethod
+    def from_comment_body(cls, body: str) -> Optional[ReviewState]:
+        """Decode the state marker from a comment body, if it has a valid one."""
+        match = re.search(re.escape(cls.MARKER_PREFIX) + r"([A-Za-z0-9+/=]+) -->", body or "")
+        if match is None:
+            return None
+        try:
+            return cls.model_validate_json(
+                zlib.decompress(base64.b64decode(match.group(1)))
+            )
+        except (ValueError, zlib.error, ValidationError):
+            return None
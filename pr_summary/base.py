@@ -12,14 +12,32 @@ from pydantic import BaseModel, Field, ConfigDict
 from functools import lru_cache
 import itertools
 from models import PullRequest, PRSummary, ChangeSummary, ChangeFile, ChangeStatus
-from pr_summary.prompts import PR_SUMMARY_PROMPT
+from pr_summary.prompts import PR_SUMMARY_PROMPT, CODE_SUMMARY_PROMPT
+from pr_summary.code_summary import (
+    DEFAULT_MAX_CONCURRENCY,
+    asummarize_change_files,
+    summarize_change_files,
+)
+from processors.model_router import ModelRouter
 from processors.pr_processor import PullRequestProcessor
+from processors.prompt_packer import PromptPacker
+from utils.token_utils import count_tokens
 
 class PRSummaryChain(Chain):
 
 
     pr_summary_chain: BaseLanguageModel = Field(..., description="Language model chain for PR summary")
     pr_summary_prompt: BasePromptTemplate = Field(default=PR_SUMMARY_PROMPT)
+    code_summary_prompt: BasePromptTemplate = Field(default=CODE_SUMMARY_PROMPT)
+    max_concurrency: int = Field(
+        default=DEFAULT_MAX_CONCURRENCY,
+        description="Maximum number of concurrent per-file summary calls",
+    )
+    prompt_packer: PromptPacker = Field(default_factory=PromptPacker)
+    model_router: Optional[ModelRouter] = Field(
+        default=None,
+        description="Routes cheap files to rules or a small model; all files use the main model if unset",
+    )
     output_parser: PydanticOutputParser = Field(
         default_factory=lambda: PydanticOutputParser(pydantic_object=PRSummary)
     )
@@ -42,11 +60,22 @@ class PRSummaryChain(Chain):
         pr: PullRequest, 
         code_summaries: List[ChangeSummary]
     ) -> Dict[str, str]:
-        """Process PR and code summaries into input format."""
+        """Process PR and code summaries into input format.
+
+        Code summaries get whatever is left of the packer's token budget
+        after the file listing and metadata.
+        """
+        change_files = PullRequestProcessor.gen_material_change_files(pr.change_files)
+        metadata = PullRequestProcessor.gen_material_pr_metadata(pr)
+        summaries_budget = self.prompt_packer.token_budget - count_tokens(
+            change_files + metadata
+        )
         return {
-            "change_files": PullRequestProcessor.gen_material_change_files(pr.change_files),
-            "code_summaries": PullRequestProcessor.gen_material_code_summaries(code_summaries),
-            "metadata": PullRequestProcessor.gen_material_pr_metadata(pr)
+            "change_files": change_files,
+            "code_summaries": self.prompt_packer.pack_code_summaries(
+                code_summaries, max(summaries_budget, 0)
+            ),
+            "metadata": metadata
         }
 
     async def _acall(
@@ -59,7 +88,15 @@ class PRSummaryChain(Chain):
         await _run_manager.on_text(inputs["pull_request"].json() + "\n")
         
         pr: PullRequest = inputs["pull_request"]
-        code_summaries = []  # Initialize empty as we're not processing code summaries
+        # Map: summarize every change file concurrently
+        code_summaries = await asummarize_change_files(
+            self.pr_summary_chain,
+            pr.change_files,
+            prompt=self.code_summary_prompt,
+            max_concurrency=self.max_concurrency,
+            packer=self.prompt_packer,
+            router=self.model_router,
+        )
         
         # Generate the input for the prompt
         pr_input = self._process_pr_summary_input(pr, code_summaries)
@@ -67,8 +104,8 @@ class PRSummaryChain(Chain):
         # Format the prompt
         prompt_value = self.pr_summary_prompt.format_prompt(**pr_input)
         
-        # Get response from LLM
-        response = await self.pr_summary_chain.agenerate([prompt_value.to_string()])
+        # Reduce: get response from LLM
+        response = await self.pr_summary_chain.agenerate_prompt([prompt_value])
         
         # Parse the output
         try:
@@ -88,17 +125,25 @@ class PRSummaryChain(Chain):
         _run_manager.on_text(inputs["pull_request"].json() + "\n")
         
         pr: PullRequest = inputs["pull_request"]
-        code_summaries = []  # Initialize empty as we're not processing code summaries
+        # Map: summarize every change file on a thread pool
+        code_summaries = summarize_change_files(
+            self.pr_summary_chain,
+            pr.change_files,
+            prompt=self.code_summary_prompt,
+            max_concurrency=self.max_concurrency,
+            packer=self.prompt_packer,
+            router=self.model_router,
+        )
         
         # Generate the input for the prompt
         pr_input = self._process_pr_summary_input(pr, code_summaries)
-        print("here we fucking go",pr_input)
         
         # Format the prompt
         prompt_value = self.pr_summary_prompt.format_prompt(**pr_input)
         
         
-        response = self.pr_summary_chain.generate([prompt_value.to_string()])
+        # Reduce: get response from LLM
+        response = self.pr_summary_chain.generate_prompt([prompt_value])
         
         # Parse the output
         try:
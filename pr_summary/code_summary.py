@@ -0,0 +1,318 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Dict, List, Optional
+from langchain_core.language_models import BaseChatModel, BaseLanguageModel
+from langchain_core.load import dumps
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import BasePromptTemplate
+from cache import DiffCache
+from models import ChangeFile, ChangeSummary
+from pr_summary.prompts import CODE_SUMMARY_PROMPT
+from processors.model_router import TIER_RULE, TIER_SMALL, ModelRouter
+from processors.pr_processor import PullRequestProcessor
+from processors.prompt_packer import PromptPacker
+from utils.telemetry import span
+
+NO_DIFF_SUMMARY = "No textual diff available (binary or too large)."
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+PrefetchCallable = Callable[[List[ChangeFile]], Awaitable[None]]
+"""Loads the diffs of the given change files ahead of use, e.g.
+AsyncGithubRetriever.prefetch_diff_contents."""
+
+SummaryCallable = Callable[[ChangeSummary], None]
+"""Receives each file summary as soon as it is known, in completion order."""
+
+ContextCallable = Callable[[List[ChangeFile]], Awaitable[Dict[str, str]]]
+"""Gives context for the prompts of the given change files, by path, e.g.
+ContextIndex.contexts."""
+
+
+def _base_sha(change_file: ChangeFile) -> str:
+    return format(change_file.start_commit_id, "040x")
+
+
+def _model_string(llm: Optional[BaseLanguageModel]) -> str:
+    if llm is None:
+        return ""
+    if isinstance(llm, BaseChatModel):
+        return llm._get_llm_string()
+    return str(sorted(llm._identifying_params.items()))
+
+
+def summary_fingerprint(
+    llm: BaseLanguageModel,
+    prompt: BasePromptTemplate,
+    router: Optional[ModelRouter] = None,
+    with_context: bool = False,
+) -> str:
+    """Hash of what shapes a file summary: the models, the prompt, the routing
+    and whether the prompt has context.
+
+    Part of the diff cache key of summaries, so that a summary written by
+    another model or prompt, or with or without context, is not reused.
+    """
+    parts = [_model_string(llm), dumps(prompt)]
+    if router is not None:
+        parts += [_model_string(router.small_llm), router.config.model_dump_json()]
+    if with_context:
+        parts.append("context")
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+
+def _reuse_summary(
+    change_file: ChangeFile,
+    previous_summaries: Dict[str, str],
+    changed_paths: Optional[set[str]],
+    diff_cache: Optional[DiffCache],
+    packer: PromptPacker,
+    fingerprint: str = "",
+) -> Optional[str]:
+    """Find an existing summary for the file, or None if it must be summarized."""
+    reason = packer.skip_reason(change_file)
+    if reason:
+        return f"Not summarized ({reason} file)."
+
+    if changed_paths is not None and change_file.full_name not in changed_paths:
+        summary = previous_summaries.get(change_file.full_name)
+        if summary is not None:
+            return summary
+
+    if diff_cache is not None:
+        summary = diff_cache.get_summary(
+            _base_sha(change_file), change_file.sha, change_file.full_name, fingerprint
+        )
+        if summary is not None:
+            return summary
+    return None
+
+
+def _partition(
+    change_files: List[ChangeFile],
+    previous_summaries: Dict[str, str],
+    changed_paths: Optional[set[str]],
+    diff_cache: Optional[DiffCache],
+    packer: PromptPacker,
+    fingerprint: str = "",
+) -> tuple[Dict[str, str], List[ChangeFile]]:
+    """Split change files into reusable summaries and files left to summarize.
+
+    Diffs are not touched, so files with a reusable summary are never loaded.
+    """
+    reused: Dict[str, str] = {}
+    pending: List[ChangeFile] = []
+    for change_file in change_files:
+        summary = _reuse_summary(
+            change_file, previous_summaries, changed_paths, diff_cache, packer, fingerprint
+        )
+        if summary is None:
+            pending.append(change_file)
+        else:
+            reused[change_file.full_name] = summary
+    return reused, pending
+
+
+def _drop_empty_diffs(
+    pending: List[ChangeFile], small: List[bool], reused: Dict[str, str]
+) -> tuple[List[ChangeFile], List[bool]]:
+    """Move pending files without a textual diff to `reused`, with a fixed summary.
+
+    `small` holds each pending file's routing and is filtered alongside.
+    """
+    with_diff, with_diff_small = [], []
+    for change_file, is_small in zip(pending, small):
+        if change_file.diff_content and change_file.diff_content.content:
+            with_diff.append(change_file)
+            with_diff_small.append(is_small)
+        else:
+            reused[change_file.full_name] = NO_DIFF_SUMMARY
+    return with_diff, with_diff_small
+
+
+def _route(
+    pending: List[ChangeFile], reused: Dict[str, str], router: Optional[ModelRouter]
+) -> tuple[List[ChangeFile], List[bool]]:
+    """Move files the router gives a rule summary to `reused`.
+
+    Returns the files left for the models and, for each, whether it goes to
+    the small model. Files without a textual diff are left for
+    `_drop_empty_diffs`, except pure renames which get a rule summary.
+    """
+    if router is None:
+        return pending, [False] * len(pending)
+    routed, small = [], []
+    for change_file in pending:
+        if not change_file.diff_content.content and not router.is_pure_rename(change_file):
+            routed.append(change_file)
+            small.append(False)
+            continue
+        tier, reason = router.route(change_file)
+        if tier == TIER_RULE:
+            reused[change_file.full_name] = router.rule_summary(change_file, reason)
+        else:
+            routed.append(change_file)
+            small.append(tier == TIER_SMALL)
+    return routed, small
+
+
+def _build_summary_input(
+    change_file: ChangeFile, packer: PromptPacker, context: str = ""
+) -> Dict[str, str]:
+    return {
+        "name": change_file.full_name,
+        "status": change_file.status.name,
+        "patch": packer.pack_file(change_file),
+        "context": f"\n\n{context}" if context else "",
+    }
+
+
+async def asummarize_change_files(
+    llm: BaseLanguageModel,
+    change_files: List[ChangeFile],
+    prompt: BasePromptTemplate = CODE_SUMMARY_PROMPT,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    previous_summaries: Optional[Dict[str, str]] = None,
+    changed_paths: Optional[set[str]] = None,
+    diff_cache: Optional[DiffCache] = None,
+    packer: Optional[PromptPacker] = None,
+    prefetch: Optional[PrefetchCallable] = None,
+    router: Optional[ModelRouter] = None,
+    on_summary: Optional[SummaryCallable] = None,
+    context: Optional[ContextCallable] = None,
+) -> List[ChangeSummary]:
+    """Map stage: summarize each change file with at most `max_concurrency` llm calls in flight.
+
+    A previous summary is reused when the file is not in `changed_paths`, and
+    the diff cache is consulted before calling the llm. Each prompt carries
+    the file's diff packed by `packer`, and files it skips are not sent at
+    all. Only the diffs of files left to summarize are loaded, through
+    `prefetch` when given. With a `router`, files are summarized by rules,
+    its small model or `llm` depending on their tier. `on_summary` is called
+    with reused summaries once the files are partitioned and with each new
+    one as it completes. `context` is asked once for the files left to
+    summarize, and what it gives for a file is added to its prompt.
+    Summaries are returned in the order of `change_files`.
+    """
+    chain = prompt | llm | StrOutputParser()
+    small_chain = chain
+    if router is not None and router.small_llm is not None:
+        small_chain = prompt | router.small_llm | StrOutputParser()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def summarize(summary_input: Dict[str, str], small: bool) -> Dict[str, str]:
+        async with semaphore:
+            text = await (small_chain if small else chain).ainvoke(summary_input)
+        if on_summary is not None:
+            on_summary(ChangeSummary(full_name=summary_input["name"], summary=text))
+        return {"text": text}
+
+    packer = packer or PromptPacker()
+    fingerprint = (
+        summary_fingerprint(llm, prompt, router, context is not None)
+        if diff_cache is not None else ""
+    )
+    reused, pending = _partition(
+        change_files, previous_summaries or {}, changed_paths, diff_cache, packer, fingerprint
+    )
+    if prefetch is not None:
+        await prefetch(pending)
+    pending, small = _route(pending, reused, router)
+    pending, small = _drop_empty_diffs(pending, small, reused)
+    if on_summary is not None:
+        for full_name, summary in reused.items():
+            on_summary(ChangeSummary(full_name=full_name, summary=summary))
+
+    contexts = await context(pending) if context is not None and pending else {}
+    with span("prompt.build", stage="summarize", files=len(pending)):
+        summaries_input = [
+            _build_summary_input(change_file, packer, contexts.get(change_file.full_name, ""))
+            for change_file in pending
+        ]
+    summaries_output = await asyncio.gather(
+        *(summarize(i, is_small) for i, is_small in zip(summaries_input, small))
+    )
+
+    return _merge_summaries(
+        change_files,
+        pending,
+        reused,
+        summaries_input,
+        list(summaries_output),
+        diff_cache,
+        fingerprint,
+    )
+
+
+def summarize_change_files(
+    llm: BaseLanguageModel,
+    change_files: List[ChangeFile],
+    prompt: BasePromptTemplate = CODE_SUMMARY_PROMPT,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    previous_summaries: Optional[Dict[str, str]] = None,
+    changed_paths: Optional[set[str]] = None,
+    diff_cache: Optional[DiffCache] = None,
+    packer: Optional[PromptPacker] = None,
+    router: Optional[ModelRouter] = None,
+) -> List[ChangeSummary]:
+    """Synchronous version of `asummarize_change_files`, using a thread pool."""
+    chain = prompt | llm | StrOutputParser()
+    small_chain = chain
+    if router is not None and router.small_llm is not None:
+        small_chain = prompt | router.small_llm | StrOutputParser()
+
+    packer = packer or PromptPacker()
+    fingerprint = summary_fingerprint(llm, prompt, router) if diff_cache is not None else ""
+    reused, pending = _partition(
+        change_files, previous_summaries or {}, changed_paths, diff_cache, packer, fingerprint
+    )
+    pending, small = _route(pending, reused, router)
+    pending, small = _drop_empty_diffs(pending, small, reused)
+
+    with span("prompt.build", stage="summarize", files=len(pending)):
+        summaries_input = [_build_summary_input(change_file, packer) for change_file in pending]
+    texts: Dict[int, str] = {}
+    for use_small in (False, True):
+        indices = [index for index, is_small in enumerate(small) if is_small == use_small]
+        outputs = (small_chain if use_small else chain).batch(
+            [summaries_input[index] for index in indices],
+            config={"max_concurrency": max_concurrency},
+        )
+        texts.update(zip(indices, outputs))
+    summaries_output = [{"text": texts[index]} for index in range(len(summaries_input))]
+
+    return _merge_summaries(
+        change_files, pending, reused, summaries_input, summaries_output, diff_cache, fingerprint
+    )
+
+
+def _merge_summaries(
+    change_files: List[ChangeFile],
+    pending: List[ChangeFile],
+    reused: Dict[str, str],
+    summaries_input: List[Dict[str, str]],
+    summaries_output: List[Dict[str, str]],
+    diff_cache: Optional[DiffCache],
+    fingerprint: str = "",
+) -> List[ChangeSummary]:
+    """Combine new and reused summaries in change file order, caching the new ones."""
+    new_summaries = PullRequestProcessor.build_change_summaries(
+        summaries_input, summaries_output
+    )
+    if diff_cache is not None:
+        for change_file, summary in zip(pending, new_summaries):
+            diff_cache.put_summary(
+                _base_sha(change_file),
+                change_file.sha,
+                change_file.full_name,
+                summary.summary,
+                fingerprint,
+            )
+
+    summaries_by_name = {summary.full_name: summary for summary in new_summaries}
+    return [
+        summaries_by_name.get(change_file.full_name)
+        or ChangeSummary(full_name=change_file.full_name, summary=reused[change_file.full_name])
+        for change_file in change_files
+    ]
@@ -4,7 +4,12 @@ from prompt_templates import grimoire
 
 
 PR_SUMMARY_PROMPT = PromptTemplate(
-    template=grimoire.PR_SUMMARY,
-    input_variables=["change_files"]
+    template=grimoire.PR_SUMMARY
+    + "{change_files}\n\nFile Change Summaries:\n{code_summaries}\n\n{metadata}",
+    input_variables=["change_files", "code_summaries", "metadata"]
 )
 
+CODE_SUMMARY_PROMPT = PromptTemplate(
+    template=grimoire.FILE_SUMMARY + "\nFile: {name} ({status})\n\n{patch}{context}",
+    input_variables=["name", "status", "patch", "context"]
+)
@@ -1,3 +1,12 @@
+from .context_index import ContextIndex
+from .model_router import ModelRouter, RoutingConfig
+from .path_index import PathIndex
 from .pr_processor import PullRequestProcessor
+from .prompt_packer import PromptPacker
+from .review_comments import DiffLineIndex, InlineReview
+from .shard_planner import Shard, ShardPlanner
 
-__all__ = ["PullRequestProcessor"]
+__all__ = [
+    "ContextIndex", "ModelRouter", "RoutingConfig", "PathIndex", "PullRequestProcessor", "PromptPacker", "DiffLineIndex",
+    "InlineReview", "Shard", "ShardPlanner",
+]
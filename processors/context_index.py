@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import asyncio
+import posixpath
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from cache import ContextCache
+from models import ChangeFile, ChangeStatus
+from processors.path_index import PathIndex
+from processors.symbols import Definition, FileSymbols, language, parse_symbols
+from utils.telemetry import count, span
+from utils.token_utils import truncate_to_tokens
+
+if TYPE_CHECKING:
+    from git_retriever import GitMirror
+    from utils.blob_fetcher import BlobFetcher
+
+DEFAULT_CONTEXT_TOKENS = 400
+"""Budget of the context added to one file's summary prompt."""
+
+DEFAULT_MAX_CALLERS = 5
+"""Callers listed per definition."""
+
+MAX_DEFINITIONS = 6
+"""Definitions listed per file."""
+
+DEFAULT_MAX_NEW_BLOBS = 2000
+"""Blobs parsed per update; the rest of a large first index is left to later updates."""
+
+DEFAULT_MAX_NEW_REST_BLOBS = 200
+"""Blobs parsed per update when each is a REST request, sharing the review's rate limit."""
+
+PARSE_CHUNK = 200
+"""Blobs read and parsed at a time, bounding the text held in memory."""
+
+SAME_PACKAGE_LANGUAGES = {"go", "java", "csharp"}
+"""Languages whose files call definitions of their directory without importing them."""
+
+CONTEXT_HEADER = "Definitions around the changes and their direct callers:"
+
+
+class ContextIndex:
+    """Symbols and imports of a repository at a commit, to give reviews context.
+
+    The index maps every file of SUFFIX_LANGUAGE_MAPPING languages at a
+    commit to the definitions, imports and call sites of its blob. Blobs
+    are parsed once and kept in a ContextCache by blob sha, so `update` to
+    a new commit only reads and parses blobs not seen before, in any
+    repository.
+
+    `contexts` describes each changed file for its summary prompt: the
+    definitions around its hunks in the new version, and their direct
+    callers, i.e. call sites of the same name in the file itself, in files
+    of the same package, or in files importing it. Imports are resolved to
+    paths lazily, only for the files holding such call sites.
+    """
+
+    def __init__(
+        self,
+        source: BlobFetcher | GitMirror,
+        cache: Optional[ContextCache] = None,
+        max_new_blobs: int = DEFAULT_MAX_NEW_BLOBS,
+    ):
+        self._source = source
+        """Lists trees and reads blobs."""
+        self._cache = cache
+        self.max_new_blobs = max_new_blobs
+        self._paths: Dict[str, str] = {}
+        """Indexed path to blob sha, at the last updated commit."""
+        self._symbols: Dict[str, FileSymbols] = {}
+        """Blob sha to its symbols."""
+        self.stats = {"files": 0, "cached": 0, "parsed": 0, "deferred": 0}
+
+    async def _load(self, paths: Dict[str, str], limit: Optional[int] = None) -> set[str]:
+        """Load or parse the symbols of the blobs of `paths`, at most `limit` parses.
+
+        Returns the blob shas left unparsed.
+        """
+        blob_paths: Dict[str, str] = {}
+        for path, sha in paths.items():
+            if sha not in self._symbols:
+                blob_paths.setdefault(sha, path)
+        if blob_paths and self._cache is not None:
+            languages = {sha: language(path) for sha, path in blob_paths.items()}
+            for sha, data in self._cache.get_symbols(languages).items():
+                self._symbols[sha] = FileSymbols.from_dict(data)
+                del blob_paths[sha]
+                self.stats["cached"] += 1
+
+        missing = sorted(blob_paths)
+        deferred = set(missing[limit:]) if limit is not None else set()
+        missing = missing[:limit] if limit is not None else missing
+        for start in range(0, len(missing), PARSE_CHUNK):
+            chunk = missing[start:start + PARSE_CHUNK]
+            texts = await self._source.blobs(chunk)
+
+            def parse() -> Dict[str, FileSymbols]:
+                # Binary, oversized and unreadable blobs are kept without symbols.
+                return {
+                    sha: (texts.get(sha) is not None and parse_symbols(blob_paths[sha], texts[sha]))
+                    or FileSymbols()
+                    for sha in chunk
+                }
+
+            parsed = await asyncio.to_thread(parse)
+            self._symbols.update(parsed)
+            if self._cache is not None:
+                self._cache.put_symbols(
+                    {sha: symbols.to_dict() for sha, symbols in parsed.items()},
+                    {sha: language(blob_paths[sha]) for sha in parsed},
+                )
+            self.stats["parsed"] += len(parsed)
+            count("context_blobs_parsed", len(parsed))
+        return deferred
+
+    async def update(self, commit_sha: str) -> None:
+        """Index the repository at `commit_sha`, parsing only blobs not seen before."""
+        with span("context.update", commit=commit_sha) as update_span:
+            tree, _ = await self._source.tree(commit_sha)
+            paths = {path: sha for path, sha in tree.items() if language(path) is not None}
+            deferred = await self._load(paths, self.max_new_blobs)
+            self._paths = {path: sha for path, sha in paths.items() if sha not in deferred}
+            live = set(self._paths.values())
+            self._symbols = {sha: self._symbols[sha] for sha in live}
+            self.stats["files"] = len(self._paths)
+            self.stats["deferred"] = len(deferred)
+            update_span.set("files", len(self._paths))
+            update_span.set("parsed", self.stats["parsed"])
+
+    async def contexts(
+        self,
+        change_files: Iterable[ChangeFile],
+        max_tokens: int = DEFAULT_CONTEXT_TOKENS,
+        max_callers: int = DEFAULT_MAX_CALLERS,
+    ) -> Dict[str, str]:
+        """Context of each changed source file with hunks, by path, in at most `max_tokens` each."""
+        change_files = [
+            change_file for change_file in change_files
+            if language(change_file.full_name) is not None
+            and change_file.status != ChangeStatus.deletion
+            and change_file.diff_content
+            and change_file.diff_content.diff_segments
+        ]
+        if not change_files:
+            return {}
+        with span("context.lookup", files=len(change_files)):
+            # The changed files are read at the pull request head.
+            heads = {change_file.full_name: change_file.sha for change_file in change_files}
+            await self._load(heads)
+            files = dict(self._paths)
+            for change_file in change_files:
+                if change_file.source_full_name != change_file.full_name:
+                    files.pop(change_file.source_full_name, None)
+            files.update(heads)
+            view = _RepositoryView(files, self._symbols)
+
+            definitions = {
+                change_file.full_name: self._changed_definitions(
+                    change_file, self._symbols[change_file.sha]
+                )
+                for change_file in change_files
+            }
+            names = {d.name for file_definitions in definitions.values() for d in file_definitions}
+            call_sites = view.call_sites(names)
+
+            contexts = {}
+            for path, file_definitions in definitions.items():
+                lines = []
+                for definition in file_definitions:
+                    lines.append(_describe(definition))
+                    for caller_path, call in view.callers(
+                        path, definition, call_sites.get(definition.name, []), max_callers
+                    ):
+                        caller = view.symbols(caller_path).caller_of(call.line)
+                        where = f" in {caller.name}" if caller is not None else ""
+                        lines.append(f"  - called at {caller_path}:{call.line}{where}: `{call.text}`")
+                if lines:
+                    contexts[path] = truncate_to_tokens(
+                        "\n".join([CONTEXT_HEADER, *lines]), max_tokens
+                    )
+            return contexts
+
+    @staticmethod
+    def _changed_definitions(change_file: ChangeFile, symbols: FileSymbols) -> List[Definition]:
+        found: Dict[tuple, Definition] = {}
+        for segment in change_file.diff_content.diff_segments:
+            start = segment.target_start_line_number
+            end = start + max(segment.target_length - 1, 0)
+            for definition in symbols.enclosing(start, end):
+                found.setdefault((definition.start, definition.name), definition)
+        return sorted(found.values(), key=lambda d: d.start)[:MAX_DEFINITIONS]
+
+
+def _describe(definition: Definition) -> str:
+    parent = f" in {definition.parent}" if definition.parent else ""
+    return f"- lines {definition.start}-{definition.end}{parent}: `{definition.signature}`"
+
+
+class _RepositoryView:
+    """Files of the index with the changed files at the head, and their imports."""
+
+    def __init__(self, files: Dict[str, str], symbols: Dict[str, FileSymbols]):
+        self._files = files
+        self._symbols = symbols
+        self._imports: Dict[str, set[str]] = {}
+        self._path_index: Optional[PathIndex] = None
+        self._directories: Optional[Dict[str, List[str]]] = None
+        self._directory_index: Optional[PathIndex] = None
+
+    def symbols(self, path: str) -> FileSymbols:
+        return self._symbols[self._files[path]]
+
+    def call_sites(self, names: set[str]) -> Dict[str, List[tuple]]:
+        """`(path, call)` of every call of `names`, by name, in path and line order."""
+        sites: Dict[str, List[tuple]] = {}
+        if not names:
+            return sites
+        for path in sorted(self._files):
+            for call in self.symbols(path).calls:
+                if call.name in names:
+                    sites.setdefault(call.name, []).append((path, call))
+        return sites
+
+    def callers(
+        self, path: str, definition: Definition, sites: List[tuple], max_callers: int
+    ) -> List[tuple]:
+        """Call sites of `definition` that can reach it, its own file first."""
+        same_package = language(path) in SAME_PACKAGE_LANGUAGES
+        directory = posixpath.dirname(path)
+        callers = []
+        for caller_path, call in sorted(sites, key=lambda site: site[0] != path):
+            if caller_path == path:
+                if definition.start <= call.line <= definition.end:
+                    # Recursion, or a call within the changed lines themselves.
+                    continue
+            elif not (
+                same_package and posixpath.dirname(caller_path) == directory
+            ) and path not in self.imports(caller_path):
+                continue
+            callers.append((caller_path, call))
+            if len(callers) == max_callers:
+                break
+        return callers
+
+    def imports(self, path: str) -> set[str]:
+        """Paths of the indexed files `path` imports."""
+        imported = self._imports.get(path)
+        if imported is None:
+            imported = self._imports[path] = set()
+            for spec in self.symbols(path).imports:
+                imported.update(self._resolve(path, spec))
+        return imported
+
+    @property
+    def path_index(self) -> PathIndex:
+        if self._path_index is None:
+            self._path_index = PathIndex.from_paths(self._files)
+        return self._path_index
+
+    def _first(self, candidates: Iterable[str], suffix: bool = True) -> List[str]:
+        """The first candidate path that is indexed, exactly or as a unique suffix."""
+        candidates = list(candidates)
+        for candidate in candidates:
+            if candidate in self._files:
+                return [candidate]
+        if suffix:
+            for candidate in candidates:
+                resolved = self.path_index.resolve(candidate)
+                if resolved is not None:
+                    return [resolved]
+        return []
+
+    def _package(self, parts: List[str]) -> List[str]:
+        """Files of the directory ending with the longest unique trailing part of `parts`."""
+        if self._directories is None:
+            self._directories = {}
+            for file_path in self._files:
+                self._directories.setdefault(posixpath.dirname(file_path), []).append(file_path)
+            self._directory_index = PathIndex.from_paths(self._directories)
+        for start in range(max(len(parts) - 1, 1)):
+            directory = self._directory_index.resolve("/".join(parts[start:]))
+            if directory is not None:
+                return self._directories[directory]
+        return []
+
+    def _resolve(self, path: str, spec: str) -> List[str]:
+        language_name = language(path)
+        directory = posixpath.dirname(path)
+        if language_name == "python":
+            level = len(spec) - len(spec.lstrip("."))
+            module = spec[level:].replace(".", "/")
+            if level:
+                base = directory
+                for _ in range(level - 1):
+                    base = posixpath.dirname(base)
+                module = posixpath.join(base, module) if module else base
+                return self._first([f"{module}.py", f"{module}/__init__.py"], suffix=False)
+            return self._first([f"{module}.py", f"{module}/__init__.py"])
+        if language_name in ("javascript", "typescript"):
+            if not spec.startswith("."):
+                # A package.
+                return []
+            base = posixpath.normpath(posixpath.join(directory, spec))
+            return self._first(
+                [base, f"{base}.ts", f"{base}.js", f"{base}/index.ts", f"{base}/index.js"],
+                suffix=False,
+            )
+        if language_name in ("c", "cpp"):
+            return self._first([posixpath.normpath(posixpath.join(directory, spec)), spec])
+        if language_name == "java":
+            return self._first([spec.replace(".", "/") + ".java"])
+        if language_name in ("go", "csharp"):
+            return self._package(spec.replace(".", "/").split("/") if language_name == "csharp"
+                                 else spec.split("/"))
+        if language_name == "php":
+            if "\\" in spec:
+                return self._first([spec.strip("\\").replace("\\", "/") + ".php"])
+            return self._first([posixpath.normpath(posixpath.join(directory, spec)), spec])
+        if language_name == "rust":
+            if "::" not in spec:
+                # `mod name;`
+                return self._first(
+                    [posixpath.join(directory, f"{spec}.rs"), posixpath.join(directory, spec, "mod.rs")],
+                    suffix=False,
+                )
+            parts = [part for part in spec.split("::") if part not in ("crate", "self", "super")]
+            for end in range(len(parts), 0, -1):
+                module = "/".join(parts[:end])
+                resolved = self._first([f"{module}.rs", f"{module}/mod.rs"])
+                if resolved:
+                    return resolved
+        return []
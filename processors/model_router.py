@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import base64
+import fnmatch
+import json
+import logging
+from typing import List, Optional
+
+import aiohttp
+from langchain_core.language_models import BaseLanguageModel
+from pydantic import BaseModel, Field
+
+from models import ChangeFile, ChangeStatus
+from processors.pr_processor import SUFFIX_LANGUAGE_MAPPING
+from processors.prompt_packer import DOC_FILE_SUFFIX
+from utils.github_http import GithubHttpClient
+from utils.request_scheduler import PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+TIER_RULE = "rule"
+"""Summarized by a fixed sentence, without any model."""
+TIER_SMALL = "small"
+"""Summarized by the small model."""
+TIER_LARGE = "large"
+"""Summarized by the main model."""
+
+CONFIG_PATH = ".github/pr-agent.json"
+"""Repository file holding the `routing` section of RoutingConfig."""
+
+
+class RoutingConfig(BaseModel):
+    """Per repository settings of the model router."""
+
+    enabled: bool = Field(default=True)
+    """When disabled, every file goes to the main model."""
+    small_model: Optional[str] = Field(default=None)
+    """Model for docs, non-code files and small code changes, e.g.
+    `gpt-4.1-nano` or `stub`. Without one, docs and non-code files get rule
+    summaries and small code changes go to the main model."""
+    large_model: Optional[str] = Field(default=None)
+    """Overrides the main model for this repository."""
+    small_change_lines: int = Field(default=4)
+    """Code files changing fewer lines than this go to the small model."""
+    rule_paths: List[str] = Field(default_factory=list)
+    """fnmatch patterns of files always given a rule summary."""
+    large_paths: List[str] = Field(default_factory=list)
+    """fnmatch patterns of files always sent to the main model."""
+
+    @classmethod
+    async def fetch(
+        cls,
+        client: GithubHttpClient,
+        repository_full_name: str,
+        ref: str,
+        priority: int = PRIORITY_NORMAL,
+    ) -> RoutingConfig:
+        """Read the `routing` section of CONFIG_PATH at `ref`.
+
+        The defaults are used when the file is absent, and, with a warning,
+        when it is not a file of valid settings, so a typo does not stop the
+        repository's reviews.
+        """
+        try:
+            contents = await client.get_json(
+                f"/repos/{repository_full_name}/contents/{CONFIG_PATH}",
+                {"ref": ref},
+                priority=priority,
+            )
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                return cls()
+            raise
+        try:
+            if not isinstance(contents, dict) or contents.get("type") != "file":
+                raise ValueError("not a file")
+            data = json.loads(base64.b64decode(contents["content"]))
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+            return cls.model_validate(data.get("routing", {}))
+        except (KeyError, ValueError) as e:
+            logger.warning(
+                "Ignoring invalid %s of %s at %s: %s", CONFIG_PATH, repository_full_name, ref, e
+            )
+            return cls()
+
+
+class ModelRouter:
+    """Decides which tier summarizes each change file.
+
+    Renames and copies without content changes, and files matching
+    `rule_paths`, get a rule summary. Docs, files in languages outside
+    SUFFIX_LANGUAGE_MAPPING and code changes under `small_change_lines` go to
+    the small model, or get a rule summary when there is none (small code
+    changes then go to the main model). Everything else, i.e. substantive
+    code hunks, goes to the main model. Lockfiles, generated and vendored
+    files never reach the router: the prompt packer skips them earlier.
+    """
+
+    def __init__(
+        self,
+        config: Optional[RoutingConfig] = None,
+        small_llm: Optional[BaseLanguageModel] = None,
+    ):
+        self.config = config or RoutingConfig()
+        self.small_llm = small_llm
+        self.stats = {TIER_RULE: 0, TIER_SMALL: 0, TIER_LARGE: 0}
+
+    def _matches(self, change_file: ChangeFile, patterns: List[str]) -> bool:
+        return any(fnmatch.fnmatch(change_file.full_name, pattern) for pattern in patterns)
+
+    @staticmethod
+    def is_pure_rename(change_file: ChangeFile) -> bool:
+        """Whether the file was renamed or copied without content changes."""
+        diff_content = change_file.diff_content
+        return (
+            change_file.status in (ChangeStatus.renaming, ChangeStatus.copy)
+            and not diff_content.add_count + diff_content.remove_count
+        )
+
+    def classify(self, change_file: ChangeFile) -> tuple[str, str]:
+        """Get the file's tier and the reason for it, before small model availability."""
+        config = self.config
+        if not config.enabled or self._matches(change_file, config.large_paths):
+            return TIER_LARGE, "code"
+        if self._matches(change_file, config.rule_paths):
+            return TIER_RULE, "excluded"
+
+        if self.is_pure_rename(change_file):
+            return TIER_RULE, change_file.status.name
+
+        suffix = change_file.suffix.lower()
+        if suffix in DOC_FILE_SUFFIX:
+            return TIER_SMALL, "documentation"
+        if suffix not in SUFFIX_LANGUAGE_MAPPING:
+            return TIER_SMALL, "non-code"
+        diff_content = change_file.diff_content
+        if diff_content.add_count + diff_content.remove_count < config.small_change_lines:
+            return TIER_SMALL, "small change"
+        return TIER_LARGE, "code"
+
+    def route(self, change_file: ChangeFile) -> tuple[str, str]:
+        """Get the tier that summarizes the file and the reason, and count it."""
+        tier, reason = self.classify(change_file)
+        if tier == TIER_SMALL and self.small_llm is None:
+            tier = TIER_LARGE if reason == "small change" else TIER_RULE
+        self.stats[tier] += 1
+        return tier, reason
+
+    @staticmethod
+    def rule_summary(change_file: ChangeFile, reason: str) -> str:
+        diff_content = change_file.diff_content
+        lines = f"+{diff_content.add_count} -{diff_content.remove_count} lines"
+        if reason == "renaming":
+            return f"Renamed from {change_file.source_full_name} without content changes."
+        if reason == "copy":
+            return f"Copied from {change_file.source_full_name} without content changes."
+        if reason == "documentation":
+            return f"Documentation updated ({lines})."
+        if reason == "non-code":
+            return f"Non-code file changed ({lines})."
+        return f"Not summarized ({reason} file, {lines})."
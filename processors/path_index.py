@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional
+
+from models import ChangeFile
+
+
+class _SuffixNode:
+    __slots__ = ("children", "names")
+
+    def __init__(self):
+        self.children: Dict[str, _SuffixNode] = {}
+        self.names: List[str] = []
+        """Changed paths ending with the components from the root to this node."""
+
+
+class PathIndex:
+    """Resolve file paths named by the model to the changed files.
+
+    The model names files by their full path, by their basename, or by a
+    trailing part of the path such as `api/views.py`. Paths are looked up
+    in an exact map, then in a trie of path components stored last
+    component first, whose first level is the basename map. A lookup costs
+    one step per component of the name, whatever the number of files. The
+    trie is built on the first lookup that is not an exact path, as most
+    names the model gives are.
+
+    Names only match on whole components, so `views.py` does not match
+    `old_views.py`, and a name matching several files resolves to none of
+    them rather than to whichever comes first.
+    """
+
+    def __init__(self, change_files: Iterable[ChangeFile]):
+        self._change_files: Dict[str, ChangeFile] = {cf.full_name: cf for cf in change_files}
+        self._root: Optional[_SuffixNode] = None
+
+    @classmethod
+    def from_paths(cls, paths: Iterable[str]) -> PathIndex:
+        """An index of paths that are not change files, for which `get` returns None."""
+        index = cls(())
+        index._change_files = dict.fromkeys(paths)
+        return index
+
+    def add(self, change_file: ChangeFile) -> None:
+        full_name = change_file.full_name
+        if full_name not in self._change_files and self._root is not None:
+            self._insert(full_name)
+        self._change_files[full_name] = change_file
+
+    def _insert(self, full_name: str) -> None:
+        node = self._root
+        for part in reversed(full_name.split("/")):
+            node = node.children.setdefault(part, _SuffixNode())
+            node.names.append(full_name)
+
+    def __len__(self) -> int:
+        return len(self._change_files)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._change_files
+
+    @staticmethod
+    def normalize(path: str) -> str:
+        """Drop the quoting and leading `./` or `/` the model may add to a path."""
+        return path.strip().strip("`'\"").strip().removeprefix("./").lstrip("/")
+
+    def matches(self, path: str) -> List[str]:
+        """Changed paths equal to `path` or ending with it, sorted."""
+        path = self.normalize(path)
+        if path in self._change_files:
+            return [path]
+        if self._root is None:
+            self._root = _SuffixNode()
+            for full_name in self._change_files:
+                self._insert(full_name)
+        node = self._root
+        for part in reversed(path.split("/")):
+            node = node.children.get(part)
+            if node is None:
+                return []
+        return sorted(node.names)
+
+    def resolve(self, path: str) -> Optional[str]:
+        """The one changed path `path` names, or None if it names none or several."""
+        matches = self.matches(path)
+        return matches[0] if len(matches) == 1 else None
+
+    def get(self, path: str) -> Optional[ChangeFile]:
+        """The one changed file `path` names, or None."""
+        full_name = self.resolve(path)
+        return self._change_files[full_name] if full_name is not None else None
@@ -40,7 +40,7 @@ class PullRequestProcessor:
         STATUS_HEADER_MAPPING = {
             ChangeStatus.addition: "Added Files:",
             ChangeStatus.modified: "Modified Files:",
-            ChangeStatus.deleted: "Deleted Files:",
+            ChangeStatus.deletion: "Deleted Files:",
             ChangeStatus.renaming: "Renamed Files:",
             ChangeStatus.copy: "Copied Files:",
             ChangeStatus.unknown: "Other Changes:"
@@ -83,9 +83,6 @@ class PullRequestProcessor:
         return f"""Pull Request Title: {pr.title}
         Description:
         {pr.body}
-
-        Related Issues:
-        {chr(10).join(f'- {issue.title}' for issue in pr.related_issues)}
         """
 
     @staticmethod
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import fnmatch
+from typing import List, Optional
+
+from models import ChangeFile, ChangeStatus, ChangeSummary
+from processors.pr_processor import SUPPORT_CODE_FILE_SUFFIX
+from utils.token_utils import count_tokens, truncate_to_tokens
+
+DOC_FILE_SUFFIX = {"md", "rst", "txt", "adoc"}
+
+DEFAULT_TOKEN_BUDGET = 12000
+
+DEFAULT_FILE_TOKEN_BUDGET = 4000
+
+TRUNCATED_MARKER = "\n... (hunk truncated)"
+
+TRUNCATED_MARKER_TOKENS = count_tokens(TRUNCATED_MARKER)
+
+
+class PromptPacker:
+    """Fit diff material into a token budget.
+
+    Hunks are ranked by changed line count weighted by file importance and
+    packed greedily; hunks that do not fit are truncated or dropped, and
+    lockfiles, generated code and vendored directories only get a header
+    line. The output is a compact diff, one `##` header per file followed by
+    its kept hunks.
+    """
+
+    LOCKFILE_NAMES = {
+        "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock",
+        "Pipfile.lock", "Cargo.lock", "go.sum", "composer.lock", "Gemfile.lock",
+        "uv.lock", "bun.lockb",
+    }
+    GENERATED_PATTERNS = (
+        "*.min.js", "*.min.css", "*.map", "*_pb2.py", "*_pb2_grpc.py", "*.pb.go",
+        "*.generated.*", "*_generated.*", "*.snap",
+    )
+    VENDORED_DIRS = ("vendor/", "node_modules/", "third_party/", "dist/", "build/")
+
+    CODE_WEIGHT = 1.0
+    TEST_WEIGHT = 0.6
+    OTHER_WEIGHT = 0.4
+    DOC_WEIGHT = 0.2
+
+    def __init__(
+        self,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        file_token_budget: int = DEFAULT_FILE_TOKEN_BUDGET,
+        min_hunk_tokens: int = 32,
+    ):
+        self.token_budget = token_budget
+        """Budget for the material of a whole pull request."""
+        self.file_token_budget = file_token_budget
+        """Budget for the material of a single file."""
+        self.min_hunk_tokens = min_hunk_tokens
+        """Hunks are not truncated below this size, they are dropped instead."""
+
+    def skip_reason(self, change_file: ChangeFile) -> Optional[str]:
+        """Why a file's diff should be left out of prompts, or None to keep it."""
+        path = change_file.full_name
+        if change_file.name in self.LOCKFILE_NAMES:
+            return "lockfile"
+        if any(fnmatch.fnmatch(change_file.name, pattern) for pattern in self.GENERATED_PATTERNS):
+            return "generated"
+        if any(path.startswith(d) or f"/{d}" in path for d in self.VENDORED_DIRS):
+            return "vendored"
+        return None
+
+    def file_weight(self, change_file: ChangeFile) -> float:
+        suffix = change_file.suffix.lower()
+        if suffix in DOC_FILE_SUFFIX:
+            return self.DOC_WEIGHT
+        if suffix not in SUPPORT_CODE_FILE_SUFFIX:
+            return self.OTHER_WEIGHT
+        if "test" in change_file.full_name.lower():
+            return self.TEST_WEIGHT
+        return self.CODE_WEIGHT
+
+    @staticmethod
+    def file_header(change_file: ChangeFile) -> str:
+        diff_content = change_file.diff_content
+        header = f"## {change_file.status.value} {change_file.full_name}"
+        if change_file.status in (ChangeStatus.renaming, ChangeStatus.copy):
+            header += f" (from {change_file.source_full_name})"
+        if diff_content:
+            header += f" (+{diff_content.add_count} -{diff_content.remove_count})"
+        return header
+
+    def pack(self, change_files: List[ChangeFile], token_budget: Optional[int] = None) -> str:
+        """Pack the diffs of `change_files` into a compact diff within the budget."""
+        budget = self.token_budget if token_budget is None else token_budget
+
+        headers = []
+        skipped = []
+        candidates = []
+        for file_index, change_file in enumerate(change_files):
+            header = self.file_header(change_file)
+            reason = self.skip_reason(change_file)
+            skipped.append(reason is not None)
+            if reason:
+                header += f" [skipped: {reason}]"
+            headers.append(header)
+            budget -= count_tokens(header) + 1
+            if reason or not change_file.diff_content:
+                continue
+
+            weight = self.file_weight(change_file)
+            for hunk_index, segment in enumerate(change_file.diff_content.diff_segments):
+                score = (segment.add_count + segment.remove_count) * weight
+                candidates.append((score, file_index, hunk_index, segment.content))
+
+        # A hunk may take at most half of the remaining budget unless it is the
+        # last candidate, so one huge hunk cannot crowd out all the others.
+        kept: dict[tuple[int, int], str] = {}
+        ranked = sorted(candidates, key=lambda c: (-c[0], c[1], c[2]))
+        for rank, (_, file_index, hunk_index, content) in enumerate(ranked):
+            allowed = budget if rank == len(ranked) - 1 else budget // 2
+            tokens = count_tokens(content)
+            if tokens <= allowed:
+                kept[(file_index, hunk_index)] = content
+                budget -= tokens
+            elif allowed >= self.min_hunk_tokens:
+                truncated = truncate_to_tokens(
+                    content, allowed - TRUNCATED_MARKER_TOKENS, line_boundary=True
+                )
+                kept[(file_index, hunk_index)] = truncated + TRUNCATED_MARKER
+                budget -= allowed
+
+        parts = []
+        for file_index, change_file in enumerate(change_files):
+            parts.append(headers[file_index])
+            segments = change_file.diff_content.diff_segments if change_file.diff_content else []
+            omitted = 0
+            for hunk_index in range(len(segments)):
+                content = kept.get((file_index, hunk_index))
+                if content is None:
+                    omitted += 1
+                else:
+                    parts.append(content.rstrip("\n"))
+            if omitted and not skipped[file_index]:
+                parts.append(f"... ({omitted} hunks omitted)")
+        return "\n".join(parts)
+
+    def pack_file(self, change_file: ChangeFile, token_budget: Optional[int] = None) -> str:
+        """Pack a single file's diff within the per-file budget."""
+        budget = self.file_token_budget if token_budget is None else token_budget
+        return self.pack([change_file], budget)
+
+    def pack_code_summaries(
+        self, code_summaries: List[ChangeSummary], token_budget: Optional[int] = None
+    ) -> str:
+        """Format code summaries, truncating each to a fair share of the budget."""
+        budget = self.token_budget if token_budget is None else token_budget
+        parts = []
+        for index, summary in enumerate(code_summaries):
+            share = budget // (len(code_summaries) - index)
+            text = f"File: {summary.full_name}\n{summary.summary}"
+            if count_tokens(text) > share:
+                text = truncate_to_tokens(text, share)
+                if not text:
+                    parts.append(f"... ({len(code_summaries) - index} more files omitted)")
+                    break
+                text += " ..."
+            budget -= count_tokens(text)
+            parts.append(text)
+        return "\n\n".join(parts)
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import bisect
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from models import ChangeFile, ChangeSummary
+from processors.path_index import PathIndex
+from utils.output_struc import Finding
+
+MAX_SNAP_LINES = 3
+"""Findings this many lines outside a hunk are moved onto its nearest line."""
+
+MAX_INLINE_COMMENTS = 50
+
+FINDING_PATTERN = re.compile(
+    r"^\s*FINDING\s+(\d+)(?:\s*-\s*(\d+))?\s+(bug|error)\s*:\s*(.+?)\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+"""A finding line of a file summary, see grimoire.FILE_SUMMARY."""
+
+
+def parse_findings(code_summaries: Iterable[ChangeSummary]) -> List[Finding]:
+    """Read the findings the file summaries end with.
+
+    They are written by the summary model, which has the file's hunks in
+    its prompt, so their line numbers come from the diff itself.
+    """
+    findings = []
+    for summary in code_summaries:
+        for match in FINDING_PATTERN.finditer(summary.summary or ""):
+            line, end_line, kind, body = match.groups()
+            end_line = int(end_line) if end_line else None
+            findings.append(Finding(
+                path=summary.full_name,
+                line=int(line),
+                end_line=end_line if end_line and end_line > int(line) else None,
+                kind=kind.lower(),
+                body=body,
+            ))
+    return findings
+
+
+class LineAnchor(NamedTuple):
+    """Lines of the new version of a file that are shown in its diff."""
+
+    path: str
+    line: int
+    start_line: Optional[int]
+    """First line of a multi-line anchor, in the same hunk as `line`."""
+    text: str
+    """Content of `line`."""
+
+
+class DiffLineIndex:
+    """Maps lines of the new version of the changed files to their diff hunks.
+
+    Review comments can only be placed on lines shown in the diff, which on
+    the new side are exactly the target ranges of the hunks. Each file's
+    ranges are read from its parsed hunk rows on first lookup and searched
+    by bisection; only the hunk holding an anchor is scanned for its text.
+    """
+
+    def __init__(
+        self, change_files: Iterable[ChangeFile], path_index: Optional[PathIndex] = None
+    ):
+        self._change_files: Dict[str, ChangeFile] = {cf.full_name: cf for cf in change_files}
+        self._ranges: Dict[str, tuple[list[int], list[int], list]] = {}
+        self.path_index = path_index or PathIndex(self._change_files.values())
+
+    def _file_ranges(self, path: str) -> tuple[list[int], list[int], list]:
+        ranges = self._ranges.get(path)
+        if ranges is None:
+            starts, ends, segments = [], [], []
+            diff_content = self._change_files[path].diff_content
+            for segment in diff_content.diff_segments if diff_content else []:
+                # Hunks that only remove lines show nothing of the new file.
+                if segment.target_length == 0:
+                    continue
+                starts.append(segment.target_start_line_number)
+                ends.append(segment.target_start_line_number + segment.target_length)
+                segments.append(segment)
+            ranges = self._ranges[path] = (starts, ends, segments)
+        return ranges
+
+    def _nearest(self, path: str, line: int, max_distance: int) -> Optional[tuple[int, int]]:
+        """`(hunk, line)` of the shown line nearest to `line`, within `max_distance`."""
+        starts, ends, _ = self._file_ranges(path)
+        index = bisect.bisect_right(starts, line) - 1
+        candidates = []
+        if index >= 0:
+            candidates.append((index, min(line, ends[index] - 1)))
+        if index + 1 < len(starts):
+            candidates.append((index + 1, starts[index + 1]))
+        best = min(candidates, key=lambda candidate: abs(candidate[1] - line), default=None)
+        if best is None or abs(best[1] - line) > max_distance:
+            return None
+        return best
+
+    def _line_text(self, path: str, hunk: int, line: int) -> str:
+        segment = self._file_ranges(path)[2][hunk]
+        target_line = segment.target_start_line_number
+        for diff_line in segment.content.split("\n")[1:]:
+            if diff_line.startswith(("-", "\\")):
+                continue
+            if target_line == line:
+                return diff_line[1:]
+            target_line += 1
+        return ""
+
+    def anchor(
+        self,
+        path: str,
+        line: int,
+        end_line: Optional[int] = None,
+        max_distance: int = MAX_SNAP_LINES,
+    ) -> Optional[LineAnchor]:
+        """Place lines `line` to `end_line` on the diff, or None if they are not near it.
+
+        Lines a little outside a hunk are moved onto it, and a range is cut
+        to the hunk holding its last line.
+        """
+        full_name = self.path_index.resolve(path)
+        if full_name is None:
+            return None
+        last = end_line if end_line is not None and end_line > line else line
+        nearest = self._nearest(full_name, last, max_distance)
+        if nearest is None:
+            return None
+        hunk, last = nearest
+        start_line = None
+        if last > line:
+            start_line = max(line, self._file_ranges(full_name)[0][hunk])
+            if start_line == last:
+                start_line = None
+        return LineAnchor(full_name, last, start_line, self._line_text(full_name, hunk, last))
+
+
+def finding_key(anchor: LineAnchor) -> str:
+    """Identify a finding by its file, line and the line's content.
+
+    A finding on the same unchanged line is not posted twice, while one on
+    a line whose content changed is.
+    """
+    digest = hashlib.sha1(anchor.text.strip().encode()).hexdigest()[:12]
+    return f"{anchor.path}:{anchor.line}:{digest}"
+
+
+def finding_path(key: str) -> str:
+    """File of a finding_key."""
+    return key.rsplit(":", 2)[0]
+
+
+@dataclass
+class InlineReview:
+    """Findings split into review comments and those that could not be placed."""
+
+    comments: List[dict] = field(default_factory=list)
+    """Review comments in the format of Github's create review endpoint."""
+    keys: List[str] = field(default_factory=list)
+    """finding_key of each comment."""
+    placed: List[Finding] = field(default_factory=list)
+    """Finding of each comment."""
+    unplaced: List[Finding] = field(default_factory=list)
+    """Findings on files or lines not shown in the diff."""
+    duplicates: int = 0
+
+
+def plan_inline_review(
+    findings: Iterable[Finding],
+    index: DiffLineIndex,
+    posted_keys: Iterable[str] = (),
+    max_comments: int = MAX_INLINE_COMMENTS,
+) -> InlineReview:
+    """Anchor findings to diff lines, dropping ones already posted on the same lines."""
+    review = InlineReview()
+    seen = set(posted_keys)
+    for finding in findings:
+        anchor = index.anchor(finding.path, finding.line, finding.end_line)
+        if anchor is None or len(review.comments) >= max_comments:
+            review.unplaced.append(finding)
+            continue
+        key = finding_key(anchor)
+        if key in seen:
+            review.duplicates += 1
+            continue
+        seen.add(key)
+        comment = {
+            "path": anchor.path,
+            "line": anchor.line,
+            "side": "RIGHT",
+            "body": f"**{finding.kind}**: {finding.body}",
+        }
+        if anchor.start_line is not None:
+            comment["start_line"] = anchor.start_line
+            comment["start_side"] = "RIGHT"
+        review.comments.append(comment)
+        review.keys.append(key)
+        review.placed.append(finding)
+    return review
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import posixpath
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from models import ChangeFile, ChangeStatus, ChangeSummary
+from processors.pr_processor import SUFFIX_LANGUAGE_MAPPING
+from processors.prompt_packer import DEFAULT_TOKEN_BUDGET
+from utils.token_utils import count_tokens
+
+OTHER_LANGUAGE = "other"
+
+
+@dataclass
+class Shard:
+    """Change files reviewed together, with their summaries."""
+
+    label: str
+    """Common directory and languages of the files, e.g. `src/api (python)`."""
+    change_files: List[ChangeFile] = field(default_factory=list)
+    code_summaries: List[ChangeSummary] = field(default_factory=list)
+    tokens: int = 0
+    """Estimated tokens of the shard's file listing and summaries."""
+
+
+@dataclass
+class _Unit:
+    """Files that stay in one shard: a single file, or a directory move."""
+
+    directory: tuple[str, ...]
+    language: str
+    change_files: List[ChangeFile]
+    code_summaries: List[ChangeSummary]
+    tokens: int
+
+
+class ShardPlanner:
+    """Split the files of a large pull request into cohesive shards within a token budget.
+
+    A pull request whose file listing and summaries fit the budget is one
+    shard. Otherwise the directory tree is split top down until every
+    subtree fits, files directly in a directory that is still too large
+    are grouped by language, and neighbouring small shards are joined back
+    up to the budget. Files renamed or copied between the same two
+    directories stay together, up to the budget, so a directory move is
+    reviewed as a whole.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        """Budget for the file listing and summaries of one shard."""
+
+    @staticmethod
+    def language(path: str) -> str:
+        suffix = path.rsplit(".", 1)[-1] if "." in posixpath.basename(path) else ""
+        return SUFFIX_LANGUAGE_MAPPING.get(suffix, OTHER_LANGUAGE)
+
+    @staticmethod
+    def file_tokens(change_file: ChangeFile, summary: Optional[ChangeSummary]) -> int:
+        """Estimated tokens of the file's listing line and summary."""
+        tokens = count_tokens(f"- {change_file.full_name} ({change_file.source_full_name})")
+        if summary is not None:
+            tokens += count_tokens(f"File: {summary.full_name}\n{summary.summary}")
+        return tokens
+
+    def plan(
+        self, change_files: List[ChangeFile], code_summaries: List[ChangeSummary]
+    ) -> List[Shard]:
+        """Group `change_files` and their summaries into shards, in path order."""
+        units = self._units(change_files, code_summaries)
+        groups = self._coalesce(self._split(units, 0))
+        return [self._shard(group) for group in groups]
+
+    def _units(
+        self, change_files: List[ChangeFile], code_summaries: List[ChangeSummary]
+    ) -> List[_Unit]:
+        summaries = {summary.full_name: summary for summary in code_summaries}
+        moves: Dict[tuple[str, str], _Unit] = {}
+        units = []
+        for change_file in sorted(change_files, key=lambda cf: cf.full_name):
+            summary = summaries.get(change_file.full_name)
+            directory = posixpath.dirname(change_file.full_name)
+            tokens = self.file_tokens(change_file, summary)
+            unit = _Unit(
+                tuple(filter(None, directory.split("/"))),
+                self.language(change_file.full_name),
+                [change_file],
+                [summary] if summary is not None else [],
+                tokens,
+            )
+            if change_file.status in (ChangeStatus.renaming, ChangeStatus.copy):
+                key = (posixpath.dirname(change_file.source_full_name), directory)
+                move = moves.get(key)
+                if move is not None and move.tokens + tokens <= self.token_budget:
+                    move.change_files += unit.change_files
+                    move.code_summaries += unit.code_summaries
+                    move.tokens += tokens
+                    continue
+                moves[key] = unit
+            units.append(unit)
+        return units
+
+    def _split(self, units: List[_Unit], depth: int) -> List[List[_Unit]]:
+        """Split units below the directory at `depth` until each group fits the budget."""
+        if sum(unit.tokens for unit in units) <= self.token_budget:
+            return [units]
+        direct = [unit for unit in units if len(unit.directory) <= depth]
+        subdirectories: Dict[str, List[_Unit]] = {}
+        for unit in units:
+            if len(unit.directory) > depth:
+                subdirectories.setdefault(unit.directory[depth], []).append(unit)
+
+        groups = self._split_by_language(direct) if direct else []
+        for name in sorted(subdirectories):
+            groups += self._split(subdirectories[name], depth + 1)
+        return groups
+
+    def _split_by_language(self, units: List[_Unit]) -> List[List[_Unit]]:
+        """Group files of one directory by language, chunked to the budget."""
+        by_language: Dict[str, List[_Unit]] = {}
+        for unit in units:
+            by_language.setdefault(unit.language, []).append(unit)
+        groups = []
+        for language in sorted(by_language):
+            chunk: List[_Unit] = []
+            tokens = 0
+            for unit in by_language[language]:
+                if chunk and tokens + unit.tokens > self.token_budget:
+                    groups.append(chunk)
+                    chunk, tokens = [], 0
+                chunk.append(unit)
+                tokens += unit.tokens
+            groups.append(chunk)
+        return groups
+
+    def _coalesce(self, groups: List[List[_Unit]]) -> List[List[_Unit]]:
+        """Join neighbouring groups while they fit the budget together."""
+        joined: List[List[_Unit]] = []
+        tokens = 0
+        for group in groups:
+            group_tokens = sum(unit.tokens for unit in group)
+            if joined and tokens + group_tokens <= self.token_budget:
+                joined[-1] = joined[-1] + group
+                tokens += group_tokens
+            else:
+                joined.append(group)
+                tokens = group_tokens
+        return joined
+
+    @staticmethod
+    def _shard(units: List[_Unit]) -> Shard:
+        shard = Shard(label="")
+        for unit in units:
+            shard.change_files += unit.change_files
+            shard.code_summaries += unit.code_summaries
+            shard.tokens += unit.tokens
+        directories = [unit.directory for unit in units]
+        common = []
+        for parts in zip(*directories):
+            if len(set(parts)) > 1:
+                break
+            common.append(parts[0])
+        languages = sorted({unit.language for unit in units} - {OTHER_LANGUAGE})
+        shard.label = "/".join(common) or "/"
+        if languages:
+            shard.label += f" ({', '.join(languages)})"
+        return shard
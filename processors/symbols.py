@@ -0,0 +1,287 @@
+"""Definitions, imports and call sites of source files, for the context index.
+
+Python is read with `ast`. The other languages of SUFFIX_LANGUAGE_MAPPING
+are read line by line with regular expressions, and a definition ends
+where the braces opened on or after its first line are closed again. This
+misses some definitions and calls, which only costs context, never
+correctness of the review.
+"""
+from __future__ import annotations
+
+import ast
+import posixpath
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from processors.pr_processor import SUFFIX_LANGUAGE_MAPPING
+
+MAX_CALL_TEXT = 120
+"""Call site lines are kept up to this many characters."""
+
+KEYWORDS = frozenset({
+    "if", "for", "while", "switch", "catch", "return", "sizeof", "elif", "with", "match",
+    "assert", "typeof", "await", "yield", "defined", "foreach", "using", "lock", "fixed",
+    "synchronized", "else", "do", "try", "throw",
+})
+"""Words followed by a parenthesis that are neither calls nor definitions."""
+
+NOT_CALLED = KEYWORDS | {"function", "func", "fn", "import", "async", "super"}
+
+
+@dataclass
+class Definition:
+    name: str
+    kind: str
+    """`function` or `class`."""
+    start: int
+    end: int
+    """Last line, inclusive."""
+    signature: str
+    """The definition's first line, stripped."""
+    parent: Optional[str] = None
+    """Name of the enclosing definition, if any."""
+
+    def to_list(self) -> list:
+        return [self.name, self.kind, self.start, self.end, self.signature, self.parent]
+
+
+@dataclass
+class CallSite:
+    name: str
+    """Called name, the last component of a dotted call."""
+    line: int
+    text: str
+    """The line of the call, stripped and shortened to MAX_CALL_TEXT."""
+
+
+@dataclass
+class FileSymbols:
+    """What the context index keeps of one blob."""
+
+    definitions: List[Definition] = field(default_factory=list)
+    imports: List[str] = field(default_factory=list)
+    """Module specifiers as written, e.g. `..models`, `./api` or `a.b.C`."""
+    calls: List[CallSite] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "d": [definition.to_list() for definition in self.definitions],
+            "i": self.imports,
+            "c": [[call.name, call.line, call.text] for call in self.calls],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> FileSymbols:
+        return cls(
+            [Definition(*definition) for definition in data["d"]],
+            data["i"],
+            [CallSite(*call) for call in data["c"]],
+        )
+
+    def enclosing(self, start: int, end: int) -> List[Definition]:
+        """Innermost definitions overlapping lines `start` to `end`, in line order."""
+        overlapping = [d for d in self.definitions if d.start <= end and d.end >= start]
+        # Keep a definition only if no other overlapping one lies inside it.
+        return [
+            outer for outer in overlapping
+            if not any(
+                inner is not outer and outer.start <= inner.start and inner.end <= outer.end
+                for inner in overlapping
+            )
+        ]
+
+    def caller_of(self, line: int) -> Optional[Definition]:
+        """The innermost definition holding `line`."""
+        holding = [d for d in self.definitions if d.start <= line <= d.end]
+        return min(holding, key=lambda d: d.end - d.start, default=None)
+
+
+def language(path: str) -> Optional[str]:
+    """Language of a path by its suffix, None if it is not indexed."""
+    name = posixpath.basename(path)
+    return SUFFIX_LANGUAGE_MAPPING.get(name.rsplit(".", 1)[-1]) if "." in name else None
+
+
+def _call_text(line: str) -> str:
+    return line.strip()[:MAX_CALL_TEXT]
+
+
+def _parse_python(text: str) -> FileSymbols:
+    tree = ast.parse(text)
+    lines = text.split("\n")
+    symbols = FileSymbols()
+
+    def visit(node: ast.AST, parent: Optional[str]) -> None:
+        for child in ast.iter_child_nodes(node):
+            name = parent
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                symbols.definitions.append(Definition(
+                    child.name,
+                    "class" if isinstance(child, ast.ClassDef) else "function",
+                    child.lineno,
+                    child.end_lineno or child.lineno,
+                    lines[child.lineno - 1].strip(),
+                    parent,
+                ))
+                name = child.name
+            elif isinstance(child, ast.Import):
+                symbols.imports += [alias.name for alias in child.names]
+            elif isinstance(child, ast.ImportFrom):
+                module = "." * child.level + (child.module or "")
+                symbols.imports.append(module)
+                # The names may be modules of a package.
+                separator = "" if module.endswith(".") else "."
+                symbols.imports += [
+                    module + separator + alias.name for alias in child.names if alias.name != "*"
+                ]
+            elif isinstance(child, ast.Call):
+                function = child.func
+                called = (
+                    function.id if isinstance(function, ast.Name)
+                    else function.attr if isinstance(function, ast.Attribute)
+                    else None
+                )
+                if called is not None:
+                    symbols.calls.append(
+                        CallSite(called, child.lineno, _call_text(lines[child.lineno - 1]))
+                    )
+            visit(child, name)
+
+    visit(tree, None)
+    return symbols
+
+
+_CLASS = r"(?:class|interface|enum|struct|record|trait|union)"
+_DEFINITIONS = {
+    "go": [
+        (re.compile(r"^func\s+(?:\([^)]*\)\s*)?(\w+)"), "function"),
+        (re.compile(r"^type\s+(\w+)\s+(?:struct|interface)\b"), "class"),
+    ],
+    "rust": [
+        (re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:const\s+)?(?:async\s+)?(?:unsafe\s+)?"
+                    r"(?:extern\s+\"\w+\"\s+)?fn\s+(\w+)"), "function"),
+        (re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait|union)\s+(\w+)"), "class"),
+        (re.compile(r"^\s*impl(?:<[^>]*>)?\s+(?:[\w:<>, ]+\s+for\s+)?(\w+)"), "class"),
+    ],
+    "javascript": [
+        (re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(\w+)"), "function"),
+        (re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+(\w+)"), "class"),
+        (re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+(\w+)\s*=\s*(?:async\s+)?"
+                    r"(?:function\b|\([^)]*\)\s*=>|\w+\s*=>)"), "function"),
+        (re.compile(r"^\s+(?:(?:public|private|protected|static|async|get|set|readonly)\s+)*"
+                    r"(\w+)\s*\([^)]*\)\s*(?::\s*[^{]+)?\{\s*$"), "function"),
+    ],
+    "php": [
+        (re.compile(r"^\s*(?:(?:public|private|protected|static|abstract|final)\s+)*function\s+&?\s*(\w+)"),
+         "function"),
+        (re.compile(r"^\s*(?:abstract\s+|final\s+)?(?:class|interface|trait|enum)\s+(\w+)"), "class"),
+    ],
+    "java": [
+        (re.compile(r"^\s*(?:[\w@]+\s+)*" + _CLASS + r"\s+(\w+)"), "class"),
+        (re.compile(r"^\s*(?:[\w@<>\[\],.?]+\s+)+(\w+)\s*\([^;]*$"), "function"),
+    ],
+    "c": [
+        (re.compile(r"^(?:typedef\s+)?" + _CLASS + r"\s+(\w+)[^;]*$"), "class"),
+        (re.compile(r"^[A-Za-z_][\w\s\*&:<>,~]*?\b(~?\w+)\s*\([^;]*$"), "function"),
+    ],
+}
+_DEFINITIONS["typescript"] = _DEFINITIONS["javascript"]
+_DEFINITIONS["csharp"] = _DEFINITIONS["java"]
+_DEFINITIONS["cpp"] = [
+    (re.compile(r"^\s*(?:template\s*<[^>]*>\s*)?(?:typedef\s+)?" + _CLASS + r"\s+(\w+)[^;]*$"), "class"),
+    (re.compile(r"^[A-Za-z_][\w\s\*&:<>,~]*?\b(~?\w+)\s*\([^;]*$"), "function"),
+]
+
+_IMPORTS = {
+    "go": [re.compile(r"^\s*(?:import\s+)?(?:[\w.]+\s+)?\"([^\"]+)\"\s*$")],
+    "rust": [re.compile(r"^\s*(?:pub\s+)?use\s+([\w:]+)"), re.compile(r"^\s*(?:pub\s+)?mod\s+(\w+)\s*;")],
+    "javascript": [
+        re.compile(r"\bfrom\s*['\"]([^'\"]+)['\"]"),
+        re.compile(r"^\s*import\s*['\"]([^'\"]+)['\"]"),
+        re.compile(r"\b(?:require|import)\(\s*['\"]([^'\"]+)['\"]\s*\)"),
+    ],
+    "php": [
+        re.compile(r"^\s*use\s+([\w\\]+)"),
+        re.compile(r"\b(?:require|include)(?:_once)?\s*\(?\s*['\"]([^'\"]+)['\"]"),
+    ],
+    "java": [re.compile(r"^\s*import\s+(?:static\s+)?([\w.]+?)(?:\.\*)?\s*;")],
+    "csharp": [re.compile(r"^\s*using\s+(?:static\s+)?([\w.]+)\s*;")],
+    "c": [re.compile(r"^\s*#\s*include\s*\"([^\"]+)\"")],
+}
+_IMPORTS["typescript"] = _IMPORTS["javascript"]
+_IMPORTS["cpp"] = _IMPORTS["c"]
+
+_CALL = re.compile(r"\b([A-Za-z_]\w*)\s*\(")
+_STRINGS = re.compile(r"\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*'")
+_LINE_COMMENT = re.compile(r"//.*$")
+_LINE_COMMENTS = {"php": re.compile(r"(?://|#).*$")}
+"""Languages whose line comments also start with `#`; elsewhere it is code, e.g.
+private fields in javascript."""
+_PREPROCESSED = frozenset({"c", "cpp"})
+"""Languages whose `#` lines are preprocessor directives, read only for imports."""
+_STATEMENT = re.compile(r"^\s*(?:return|new|throw|else|await|yield|case|goto)\b")
+
+
+def _parse_braces(language_name: str, text: str) -> FileSymbols:
+    patterns = _DEFINITIONS[language_name]
+    import_patterns = _IMPORTS[language_name]
+    line_comment = _LINE_COMMENTS.get(language_name, _LINE_COMMENT)
+    preprocessed = language_name in _PREPROCESSED
+    symbols = FileSymbols()
+    # Definitions whose body is open: (definition, depth before it, body opened).
+    open_definitions: list[list] = []
+    depth = 0
+    for number, line in enumerate(text.split("\n"), 1):
+        if preprocessed and line.lstrip().startswith("#"):
+            code = ""
+        else:
+            code = line_comment.sub("", _STRINGS.sub('""', line))
+        for pattern in import_patterns:
+            symbols.imports += pattern.findall(line)
+
+        defined = None
+        for pattern, kind in patterns if not _STATEMENT.match(code) else ():
+            match = pattern.match(code)
+            if match and match.group(1) not in KEYWORDS:
+                parent = open_definitions[-1][0].name if open_definitions else None
+                defined = Definition(match.group(1), kind, number, number, line.strip(), parent)
+                open_definitions.append([defined, depth, False])
+                break
+
+        for match in _CALL.finditer(code):
+            name = match.group(1)
+            if name not in NOT_CALLED and (defined is None or name != defined.name):
+                symbols.calls.append(CallSite(name, number, _call_text(line)))
+
+        opens, closes = code.count("{"), code.count("}")
+        depth = max(depth + opens - closes, 0)
+        while open_definitions:
+            definition, start_depth, opened = open_definitions[-1]
+            opened = opened or opens > 0
+            open_definitions[-1][2] = opened
+            if opened and depth <= start_depth:
+                definition.end = number
+                symbols.definitions.append(definition)
+            elif not opened and (code.rstrip().endswith(";") or number - definition.start >= 3):
+                # A declaration, or a call that looked like one.
+                pass
+            else:
+                break
+            open_definitions.pop()
+            opens = 0
+    symbols.definitions.sort(key=lambda d: d.start)
+    return symbols
+
+
+def parse_symbols(path: str, text: str) -> Optional[FileSymbols]:
+    """Symbols of a source file, or None if its language is not indexed."""
+    language_name = language(path)
+    if language_name is None:
+        return None
+    if language_name == "python":
+        try:
+            return _parse_python(text)
+        except (SyntaxError, ValueError):
+            return FileSymbols()
+    return _parse_braces(language_name, text)
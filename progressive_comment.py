@@ -0,0 +1,90 @@
+"""Rate-limited updates of a review comment while the review is running."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPDATE_INTERVAL = 5.0
+
+PostCallable = Callable[[str], Awaitable[None]]
+"""Creates or edits the comment with the given body."""
+
+
+class ProgressiveComment:
+    """Keeps a comment in step with a body that changes as results arrive.
+
+    `changed` only marks the body as stale; the body is rendered and posted
+    at most once per `min_interval` seconds, so a burst of results turns
+    into one edit. The first change is posted right away. Posts never
+    overlap, and a failed intermediate post is logged and skipped.
+    """
+
+    def __init__(
+        self,
+        post: PostCallable,
+        render: Callable[[], str],
+        min_interval: float = DEFAULT_UPDATE_INTERVAL,
+    ):
+        self._post = post
+        self._render = render
+        self._min_interval = min_interval
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._dirty = False
+        self._posting = False
+        self._last_post = -math.inf
+        self.stats = {"posts": 0, "coalesced": 0, "failures": 0}
+
+    def changed(self) -> None:
+        """Mark the body as changed; it is posted within `min_interval` seconds."""
+        if self._dirty:
+            self.stats["coalesced"] += 1
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush())
+
+    async def _flush(self) -> None:
+        while self._dirty:
+            delay = self._last_post + self._min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._dirty = False
+            try:
+                await self._send(self._render())
+            except Exception:
+                self.stats["failures"] += 1
+                logger.warning("Progress update of the review comment failed", exc_info=True)
+
+    async def _send(self, body: str) -> None:
+        async with self._lock:
+            self._posting = True
+            try:
+                await self._post(body)
+            finally:
+                self._posting = False
+                self._last_post = time.monotonic()
+            self.stats["posts"] += 1
+
+    async def _stop(self) -> None:
+        """Drop pending changes, letting a post already in flight complete."""
+        self._dirty = False
+        if self._task is None or self._task.done():
+            return
+        if self._posting:
+            await self._task
+        else:
+            self._task.cancel()
+
+    async def finish(self, body: str) -> None:
+        """Post the final body in place of any pending update."""
+        await self._stop()
+        await self._send(body)
+
+    async def close(self) -> None:
+        """Stop updating without posting, e.g. when the review failed."""
+        await self._stop()
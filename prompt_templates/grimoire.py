@@ -14,3 +14,25 @@ Change Files (with status):
 
 
 
+FILE_SUMMARY = """Act as a Code Reviewer Assistant. Summarize the changes made to a single file
+of a Pull Request(PR) in a few sentences, so the summary can be combined with the
+summaries of the other files of the PR.
+
+Focus on what behaviour changed and why it matters. Do not restate the diff line by line.
+If a change likely introduces a bug or will fail, end the summary with one line per problem:
+FINDING <line>[-<end line>] <bug|error>: <what is wrong and how to fix it>
+Line numbers are in the new version of the file, counted from the `+` start of the hunk
+header. Write no FINDING line when there is no such problem.
+"""
+
+
+PR_REVIEW_MERGE = """Act as a Code Reviewer Assistant. A large Pull Request(PR) was reviewed in parts,
+each covering the files of some directories. Combine the partial reviews below into a
+single review of the whole PR.
+
+- Describe the changes of the whole PR and its objective, not of each part.
+- Pick the one category that fits the whole PR: Feature,Fix,Refactor,Perf,Doc,Test,Ci,Style,Housekeeping
+- Keep the important change files that matter most for the whole PR.
+
+Partial reviews:
+"""
@@ -0,0 +1,356 @@
+"""Long-running review server receiving Github pull_request webhooks.
+
+Usage:
+    GITHUB_WEBHOOK_SECRET=... python server.py --port 8080 --workers 4
+
+Webhook deliveries are acknowledged immediately and turned into review jobs
+on an in-process queue. A pool of async workers reviews them with warm,
+shared clients and caches. Events for a pull request that is already
+waiting in the queue are coalesced into the pending job, so a burst of
+pushes produces a single review of the latest head.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+from aiohttp import web
+from dotenv import load_dotenv
+from batch import ReviewTarget
+from cache import CommentIndex, ContextCache, DiffCache, LLMCache, ResponseCache
+from main import build_llm, retrieve_review_job, run_review_job
+from pr_summary.code_summary import DEFAULT_MAX_CONCURRENCY
+from processors import PromptPacker
+from utils.github_http import GithubHttpClient
+from utils.telemetry import TELEMETRY_ENV, telemetry
+
+logger = logging.getLogger(__name__)
+
+REVIEW_ACTIONS = {"opened", "synchronize", "reopened", "ready_for_review"}
+
+ReviewCallable = Callable[[ReviewTarget], Awaitable[None]]
+
+
+class ReviewQueue:
+    """Queue of pull requests to review, holding each pull request at most once.
+
+    Pull requests are queued in arrival order. A pull request that is queued
+    again while still waiting is coalesced into the waiting entry; one queued
+    again while being reviewed is reviewed once more after the current review.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue[ReviewTarget] = asyncio.Queue()
+        self._pending: set[ReviewTarget] = set()
+        self._running: set[ReviewTarget] = set()
+        self._rerun: set[ReviewTarget] = set()
+        self.coalesced = 0
+        """Number of events merged into an already pending review."""
+
+    def put(self, target: ReviewTarget) -> bool:
+        """Queue a review. Returns False if it was coalesced into a pending one."""
+        if target in self._pending or target in self._rerun:
+            self.coalesced += 1
+            return False
+        if target in self._running:
+            self._rerun.add(target)
+            return True
+        self._pending.add(target)
+        self._queue.put_nowait(target)
+        return True
+
+    async def get(self) -> ReviewTarget:
+        target = await self._queue.get()
+        self._pending.discard(target)
+        self._running.add(target)
+        return target
+
+    def done(self, target: ReviewTarget) -> None:
+        self._running.discard(target)
+        if target in self._rerun:
+            self._rerun.discard(target)
+            self.put(target)
+        # Marked done after any requeue so join() does not return in between.
+        self._queue.task_done()
+
+    async def join(self) -> None:
+        await self._queue.join()
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+
+class ReviewServer:
+    """Webhook endpoint plus the worker pool reviewing queued pull requests.
+
+    Deliveries must be signed with `webhook_secret`, since each one can
+    start a paid review. Only with `insecure` set may it be omitted, in
+    which case unsigned deliveries are accepted.
+    """
+
+    def __init__(
+        self,
+        review: ReviewCallable,
+        workers: int = 4,
+        webhook_secret: Optional[str] = None,
+        insecure: bool = False,
+    ):
+        if not webhook_secret and not insecure:
+            raise ValueError("A webhook secret is required unless running insecure.")
+        self._review = review
+        self._worker_count = workers
+        self._webhook_secret = webhook_secret
+        self._workers: list[asyncio.Task] = []
+        self.queue = ReviewQueue()
+        self.stats = {"received": 0, "ignored": 0, "reviewed": 0, "failed": 0}
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/webhook", self.handle_webhook)
+        app.router.add_get("/healthz", self.handle_health)
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.on_startup.append(self._start_workers)
+        app.on_cleanup.append(self._stop_workers)
+        return app
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        if not self._verify_signature(body, request.headers.get("X-Hub-Signature-256")):
+            return web.json_response({"error": "invalid signature"}, status=401)
+
+        self.stats["received"] += 1
+        event = request.headers.get("X-GitHub-Event")
+        if event == "ping":
+            return web.json_response({"status": "pong"})
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return web.json_response({"error": "invalid json"}, status=400)
+
+        try:
+            target = self._parse_target(event, payload)
+        except (KeyError, TypeError, ValueError):
+            return web.json_response({"error": "malformed payload"}, status=400)
+        if target is None:
+            self.stats["ignored"] += 1
+            return web.json_response({"status": "ignored"})
+
+        queued = self.queue.put(target)
+        return web.json_response(
+            {"status": "queued" if queued else "coalesced", "target": str(target)},
+            status=202,
+        )
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, "queued": len(self.queue)})
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """Span durations and counters in Prometheus text format."""
+        return web.Response(
+            text=telemetry.render_prometheus(), content_type="text/plain", charset="utf-8"
+        )
+
+    @staticmethod
+    def _parse_target(event: Optional[str], payload: dict) -> Optional[ReviewTarget]:
+        """The pull request to review, None for other events.
+
+        Raises KeyError, TypeError or ValueError for a malformed payload.
+        """
+        if not isinstance(payload, dict):
+            raise ValueError("Payload is not an object.")
+        if event != "pull_request" or payload.get("action") not in REVIEW_ACTIONS:
+            return None
+        pull_request = payload["pull_request"]
+        if not isinstance(pull_request, dict):
+            raise ValueError("Pull request is not an object.")
+        if pull_request.get("draft"):
+            return None
+        repo_full_name = payload["repository"]["full_name"]
+        number = pull_request["number"]
+        if not isinstance(repo_full_name, str) or "/" not in repo_full_name:
+            raise ValueError(f"Invalid repository: {repo_full_name!r}")
+        if not isinstance(number, int) or isinstance(number, bool):
+            raise ValueError(f"Invalid pull request number: {number!r}")
+        return ReviewTarget(repo_full_name, number)
+
+    def _verify_signature(self, body: bytes, signature: Optional[str]) -> bool:
+        if not self._webhook_secret:
+            return True
+        if not signature:
+            return False
+        expected = "sha256=" + hmac.new(
+            self._webhook_secret.encode(), body, hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    async def _start_workers(self, app: web.Application) -> None:
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self._worker_count)
+        ]
+
+    async def _stop_workers(self, app: web.Application) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    async def _work(self) -> None:
+        while True:
+            target = await self.queue.get()
+            try:
+                await self._review(target)
+                self.stats["reviewed"] += 1
+            except Exception:
+                self.stats["failed"] += 1
+                logger.exception("Review of %s failed", target)
+            finally:
+                self.queue.done(target)
+
+
+def build_reviewer(
+    http_client: GithubHttpClient,
+    diff_cache: Optional[DiffCache] = None,
+    packer: Optional[PromptPacker] = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    comment_index: Optional[CommentIndex] = None,
+    mirror_root: Optional[Path] = None,
+    llm_cache: Optional[LLMCache] = None,
+    routing: bool = True,
+    progress_interval: Optional[float] = None,
+    inline_comments: bool = True,
+    context_cache: Optional[ContextCache] = None,
+    bot_username: Optional[str] = None,
+) -> ReviewCallable:
+    """Build the review callable used by the workers, sharing clients and caches.
+
+    Review comments are looked up among those by `bot_username`, by default
+    the login of the client's token.
+    """
+    llm = build_llm(llm_cache)
+
+    async def review(target: ReviewTarget) -> None:
+        job = await retrieve_review_job(
+            http_client,
+            target.repo_full_name,
+            target.pr_number,
+            bot_username,
+            diff_cache=diff_cache,
+            comment_index=comment_index,
+            mirror_root=mirror_root,
+            routing=routing,
+        )
+        if job is None:
+            logger.info("Head of %s was already reviewed", target)
+            return
+        await run_review_job(
+            job,
+            llm,
+            http_client,
+            diff_cache,
+            packer,
+            max_concurrency,
+            comment_index,
+            progress_interval,
+            inline_comments,
+            context_cache,
+        )
+        logger.info("Reviewed %s", target)
+
+    return review
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help="per pull request concurrent file summaries")
+    parser.add_argument("--mirror-dir", type=Path,
+                        help="read change files from local git mirrors kept in this directory")
+    parser.add_argument("--no-llm-cache", action="store_true",
+                        help="always ask the LLM instead of reusing cached responses")
+    parser.add_argument("--no-routing", action="store_true",
+                        help="send every file to the main model, ignoring repository routing settings")
+    parser.add_argument("--progress-interval", type=float,
+                        help="post file summaries to the comment as they complete, "
+                             "at most once per this many seconds")
+    parser.add_argument("--no-inline-comments", action="store_true",
+                        help="list findings in the review comment instead of on the diff lines")
+    parser.add_argument("--context-index", action="store_true",
+                        help="give summaries the definitions around each change and their callers, "
+                             "from an index of the repository kept in the cache")
+    parser.add_argument("--telemetry", default=os.getenv(TELEMETRY_ENV, ""),
+                        help="comma separated span exporters: jsonl=PATH, otel")
+    parser.add_argument("--bot-username",
+                        help="login the review comments are written as, "
+                             "when it cannot be read from the token")
+    parser.add_argument("--insecure", action="store_true",
+                        help="accept unsigned webhook deliveries when GITHUB_WEBHOOK_SECRET "
+                             "is not set, e.g. behind a trusted proxy or in tests")
+    return parser.parse_args(argv)
+
+
+async def serve(argv: Optional[list[str]] = None) -> None:
+    load_dotenv(override=True)
+    args = parse_args(argv)
+    github_token = os.getenv("GITHUB_TOKEN")
+
+    if not github_token:
+        raise ValueError("GITHUB_TOKEN not found.")
+    webhook_secret = os.getenv("GITHUB_WEBHOOK_SECRET")
+    if not webhook_secret and not args.insecure:
+        raise ValueError("GITHUB_WEBHOOK_SECRET not found; pass --insecure to run without it.")
+
+    diff_cache = DiffCache()
+    response_cache = ResponseCache()
+    comment_index = CommentIndex()
+    llm_cache = None if args.no_llm_cache else LLMCache()
+    context_cache = ContextCache() if args.context_index else None
+    telemetry.configure(args.telemetry)
+    try:
+        async with GithubHttpClient(
+            github_token, response_cache=response_cache
+        ) as http_client:
+            review = build_reviewer(
+                http_client,
+                diff_cache,
+                PromptPacker(),
+                args.max_concurrency,
+                comment_index,
+                args.mirror_dir,
+                llm_cache,
+                not args.no_routing,
+                args.progress_interval,
+                not args.no_inline_comments,
+                context_cache,
+                args.bot_username or await http_client.login(),
+            )
+            server = ReviewServer(review, args.workers, webhook_secret, args.insecure)
+            runner = web.AppRunner(server.build_app())
+            await runner.setup()
+            await web.TCPSite(runner, args.host, args.port).start()
+            logger.info("Listening on %s:%d", args.host, args.port)
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await runner.cleanup()
+    finally:
+        if llm_cache is not None:
+            logger.info("LLM cache: %s", llm_cache.stats)
+            llm_cache.close()
+        if context_cache is not None:
+            context_cache.close()
+        comment_index.close()
+        response_cache.close()
+        diff_cache.close()
+        telemetry.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve())
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+import batch
+from batch import ReviewTarget, review_targets
+
+
+def test_retrieval_runs_a_bounded_distance_ahead_of_analysis(monkeypatch):
+    held = set()
+    peak = 0
+
+    async def retrieve_review_job(http_client, repo_full_name, pr_number, *args):
+        nonlocal peak
+        held.add(pr_number)
+        peak = max(peak, len(held))
+        await asyncio.sleep(0)
+        return pr_number
+
+    async def run_review_job(job, *args):
+        await asyncio.sleep(0.01)
+        held.discard(job)
+
+    monkeypatch.setattr(batch, "build_llm", lambda llm_cache: None)
+    monkeypatch.setattr(batch, "retrieve_review_job", retrieve_review_job)
+    monkeypatch.setattr(batch, "run_review_job", run_review_job)
+    targets = [ReviewTarget("o/r", number) for number in range(50)]
+    results = asyncio.run(
+        review_targets(None, targets, retrieve_concurrency=8, analyze_concurrency=2)
+    )
+
+    assert [result.status for result in results] == ["reviewed"] * 50
+    assert peak <= 4
+
+
+def test_targets_are_parsed():
+    assert ReviewTarget.parse(" o/r.js#12 ") == ReviewTarget("o/r.js", 12)
+    for text in ["o/r", "o#1", "o/r/x#1", "../x#1", "owner/..#1", "./r#1", "o/.#1"]:
+        with pytest.raises(ValueError):
+            ReviewTarget.parse(text)
@@ -0,0 +1,10 @@
+from pr_summary.code_summary import summary_fingerprint
+from pr_summary.prompts import CODE_SUMMARY_PROMPT
+from utils.stub_llm import StubChatModel
+
+
+def test_summaries_with_context_are_cached_apart():
+    llm = StubChatModel()
+    without = summary_fingerprint(llm, CODE_SUMMARY_PROMPT)
+    assert without == summary_fingerprint(llm, CODE_SUMMARY_PROMPT)
+    assert without != summary_fingerprint(llm, CODE_SUMMARY_PROMPT, with_context=True)
@@ -0,0 +1,64 @@
+import io
+import random
+
+import pytest
+import unidiff
+
+from utils.diff_utils import build_patch, iter_hunk_spans
+
+EDGE_CASES = [
+    "@@ -1,2 +1,2 @@\n-a\n+b\n c\n\\ No newline at end of file\n",
+    "@@ -1 +1 @@\n-a\n\\ No newline at end of file\n+a\n",
+    "@@ -0,0 +1 @@\n+only",
+    "@@ -1 +0,0 @@\n-gone\n",
+    # Blank context lines, as some tools write them without the leading space.
+    "@@ -1,4 +1,4 @@\n a\n\n-b\n+c\n \n",
+    "@@ -1,2 +1,2 @@\r\n-a\r\n+b\r\n c\r\n",
+    "@@ -1,2 +1,3 @@ def f():\n a\n+-b\n-+c\n+d\n@@ -10 +11 @@\n-x\n+y\n",
+]
+
+
+def unidiff_hunks(patch):
+    patched_file = unidiff.PatchSet(io.StringIO(f"--- a/f\n+++ b/f\n{patch}"))[0]
+    return [
+        (h.source_start, h.source_length, h.target_start, h.target_length, h.added, h.removed)
+        for h in patched_file
+    ]
+
+
+def span_hunks(patch):
+    spans = list(iter_hunk_spans(patch))
+    # The spans cover the patch from its first hunk on, without gaps.
+    assert spans[0].start == patch.find("@@")
+    assert [span.start for span in spans[1:]] == [span.end for span in spans[:-1]]
+    assert spans[-1].end == len(patch)
+    return [tuple(span)[2:] for span in spans]
+
+
+@pytest.mark.parametrize("patch", EDGE_CASES)
+def test_edge_cases_match_unidiff(patch):
+    assert span_hunks(patch) == unidiff_hunks(patch)
+
+
+def random_text(rng, lines):
+    return "\n".join(rng.choice(["a", "b", "", "+x", "-y", "@@ z", "c d"]) for _ in range(lines))
+
+
+def test_random_patches_match_unidiff():
+    rng = random.Random(10)
+    for _ in range(300):
+        source = random_text(rng, rng.randint(0, 40))
+        target = "\n".join(
+            line if rng.random() < 0.7 else random_text(rng, rng.randint(0, 2))
+            for line in source.split("\n")
+        )
+        patch = build_patch(source, target, context=rng.randint(0, 3))
+        if not patch:
+            continue
+        assert span_hunks(patch) == unidiff_hunks(patch), patch
+
+
+def test_text_before_the_first_hunk_is_ignored():
+    patch = "diff --git a/f b/f\n--- a/f\n+++ b/f\n@@ -1 +1 @@\n-a\n+b\n"
+    assert span_hunks(patch) == [(1, 1, 1, 1, 1, 1)]
+    assert list(iter_hunk_spans("Binary files differ\n")) == []
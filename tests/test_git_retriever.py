@@ -0,0 +1,124 @@
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+from git_retriever import GitMirror, GitMirrorRetriever, mirror_path
+from models import ChangeStatus
+
+GIT = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+
+KEPT = "".join(f"line {i}\n" for i in range(20))
+
+
+def git(cwd, *args) -> str:
+    return subprocess.run(
+        [*GIT, *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def write(root, path, text):
+    path = root / path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+@pytest.fixture
+def repository(tmp_path):
+    """A repository whose head adds, modifies, renames, deletes and changes the type of files."""
+    source = tmp_path / "source"
+    source.mkdir()
+    git(source, "init", "--quiet", "--initial-branch=main")
+    write(source, "b.txt", "b\n")
+    write(source, "c.txt", "c1\nc2\n")
+    write(source, "d.txt", "d1\nd2\n")
+    write(source, "gone.txt", "gone\n")
+    write(source, "keep.txt", KEPT)
+    write(source, "naïve.txt", "old\n")
+    git(source, "add", "-A")
+    git(source, "commit", "--quiet", "-m", "base")
+    base = git(source, "rev-parse", "HEAD")
+
+    write(source, "new.txt", "new\n")
+    write(source, "b.txt", "b\nmore\n")
+    (source / "c.txt").unlink()
+    (source / "c.txt").symlink_to("b.txt")
+    write(source, "d.txt", "d1\nd2 changed\n")
+    (source / "gone.txt").unlink()
+    (source / "keep.txt").rename(source / "moved.txt")
+    write(source, "moved.txt", KEPT + "appended\n")
+    write(source, "naïve.txt", "new\n")
+    git(source, "add", "-A")
+    git(source, "commit", "--quiet", "-m", "head")
+    head = git(source, "rev-parse", "HEAD")
+    return source, base, head
+
+
+def build_change_files(tmp_path, source, base, head):
+    mirror = GitMirror(tmp_path / "mirror.git", str(source))
+    git_pr = {
+        "id": 1,
+        "html_url": "https://github.com/o/r/pull/1",
+        "base": {"sha": base, "repo": {"html_url": "https://github.com/o/r"}},
+        "head": {"sha": head, "repo": None},
+    }
+
+    async def build():
+        await mirror.ensure_commits([base, head], ["+refs/heads/main:refs/heads/main"])
+        return await GitMirrorRetriever._build_change_files_from_git(mirror, git_pr)
+
+    return {change_file.full_name: change_file for change_file in asyncio.run(build())}
+
+
+def test_change_files_get_their_own_diffs(tmp_path, repository):
+    change_files = build_change_files(tmp_path, *repository)
+
+    assert {name: cf.status for name, cf in change_files.items()} == {
+        "b.txt": ChangeStatus.modified,
+        "c.txt": ChangeStatus.type_change,
+        "d.txt": ChangeStatus.modified,
+        "gone.txt": ChangeStatus.deletion,
+        "moved.txt": ChangeStatus.renaming,
+        "naïve.txt": ChangeStatus.modified,
+        "new.txt": ChangeStatus.addition,
+    }
+    assert change_files["moved.txt"].source_full_name == "keep.txt"
+
+    def content(name):
+        return change_files[name].diff_content.content
+
+    assert "+new" in content("new.txt")
+    assert "+more" in content("b.txt")
+    assert "-gone" in content("gone.txt")
+    assert "+appended" in content("moved.txt")
+    assert "+new" in content("naïve.txt") and "-old" in content("naïve.txt")
+    # The old file's removal and the symlink's target, not another file's hunks.
+    assert "-c1" in content("c.txt") and "+b.txt" in content("c.txt")
+    assert "+d2 changed" in content("d.txt") and "b.txt" not in content("d.txt")
+
+
+def test_token_is_passed_in_the_environment(tmp_path, monkeypatch):
+    calls = []
+
+    async def create_subprocess_exec(*args, env=None, **kwargs):
+        calls.append((args, env))
+        raise RuntimeError("not run")
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", create_subprocess_exec)
+    mirror = GitMirror(tmp_path / "mirror.git", "https://github.com/o/r.git", "secret-token")
+    with pytest.raises(RuntimeError):
+        asyncio.run(mirror.git("fetch", "origin"))
+
+    (args, env), = calls
+    assert not any("extraHeader" in arg or "Authorization" in arg for arg in args)
+    assert env["GIT_CONFIG_KEY_0"] == "http.extraHeader"
+    assert env["GIT_CONFIG_VALUE_0"].startswith("Authorization: Basic ")
+    assert env["PATH"] == os.environ["PATH"]
+
+
+def test_mirror_paths_stay_inside_the_mirror_root(tmp_path):
+    assert mirror_path(tmp_path, "o/r") == tmp_path / "o/r.git"
+    for name in ["../x", "o/../../x", "/etc/x"]:
+        with pytest.raises(ValueError):
+            mirror_path(tmp_path, name)
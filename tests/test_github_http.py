@@ -0,0 +1,18 @@
+import pytest
+
+from utils.github_http import GithubHttpClient
+
+
+def test_absolute_urls_must_point_at_the_api():
+    client = GithubHttpClient("token", base_url="https://ghe.example.com/api/v3/")
+    assert client._url("/repos/o/r") == "https://ghe.example.com/api/v3/repos/o/r"
+    page = "https://ghe.example.com/api/v3/repos/o/r/pulls?page=2"
+    assert client._url(page) == page
+    for url in [
+        "https://evil.example.com/repos/o/r",
+        "http://ghe.example.com/api/v3/repos/o/r",
+        "https://ghe.example.com:8443/api/v3/repos/o/r",
+        "https://ghe.example.com.evil.example/api/v3",
+    ]:
+        with pytest.raises(ValueError):
+            client._url(url)
@@ -0,0 +1,61 @@
+import asyncio
+
+from langchain_core.messages import HumanMessage
+
+from utils.llm_pool import BackendConfig, LLMBackend, LLMPool, PoolConfig
+from utils.stub_llm import StubChatModel
+
+
+class FailingModel(StubChatModel):
+    async def _agenerate(self, *args, **kwargs):
+        raise RuntimeError("backend down")
+
+
+def build_pool(models, hedge_after=None, failure_threshold=3):
+    config = PoolConfig(hedge_after=hedge_after, failure_threshold=failure_threshold)
+    backends = [
+        LLMBackend(model, BackendConfig(model=f"model-{index}"), failure_threshold)
+        for index, model in enumerate(models)
+    ]
+    return LLMPool._from_backends(backends, config, lambda backend: StubChatModel())
+
+
+def ask(pool):
+    async def run():
+        result = await pool._agenerate([HumanMessage("hi")])
+        return result.generations[0].message.content, asyncio.all_tasks()
+
+    return asyncio.run(run())
+
+
+def test_slow_backend_is_hedged_and_the_loser_collected():
+    pool = build_pool(
+        [StubChatModel(response="slow", latency=5), StubChatModel(response="fast")],
+        hedge_after=0.01,
+    )
+    answer, tasks = ask(pool)
+    assert answer == "fast"
+    assert pool.stats["hedges"] == 1
+    # Only the test's own task is left: the slow request was awaited after its cancel.
+    assert len(tasks) == 1
+    # Losing a hedge race is no failure of the slow backend.
+    assert pool.backends[0].stats["failures"] == 0
+
+
+def test_failed_backend_falls_back_to_the_next():
+    pool = build_pool([FailingModel(), StubChatModel(response="second")])
+    answer, _ = ask(pool)
+    assert answer == "second"
+    assert pool.stats["fallbacks"] == 1
+    assert pool.backends[0].stats["failures"] == 1
+
+
+def test_circuit_opens_after_consecutive_failures():
+    pool = build_pool([FailingModel(), StubChatModel(response="second")], failure_threshold=2)
+    for _ in range(2):
+        ask(pool)
+    assert not pool.backends[0].available
+    ask(pool)
+    # The open backend is skipped, not tried again.
+    assert pool.backends[0].stats["requests"] == 2
+    assert pool.stats["fallbacks"] == 2
@@ -0,0 +1,43 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from processors import RoutingConfig
+
+
+class FakeClient:
+    """Answers the contents request of the settings file."""
+
+    def __init__(self, contents):
+        self.contents = contents
+
+    async def get_json(self, path, params=None, priority=None):
+        return self.contents
+
+
+def file_contents(text):
+    return {"type": "file", "content": base64.b64encode(text.encode()).decode()}
+
+
+def fetch(contents):
+    return asyncio.run(RoutingConfig.fetch(FakeClient(contents), "o/r", "head"))
+
+
+def test_routing_section_is_read():
+    config = fetch(file_contents(json.dumps({"routing": {"small_model": "stub"}})))
+    assert config.small_model == "stub"
+
+
+@pytest.mark.parametrize("contents", [
+    file_contents("{not json"),
+    file_contents(json.dumps({"routing": {"small_change_lines": "many"}})),
+    file_contents(json.dumps(["routing"])),
+    file_contents(json.dumps({"routing": None})),
+    [{"type": "file", "name": "pr-agent.json"}],
+    {"type": "symlink", "target": "elsewhere.json"},
+    {"type": "file", "content": "%%%"},
+])
+def test_invalid_settings_fall_back_to_the_defaults(contents):
+    assert fetch(contents) == RoutingConfig()
@@ -0,0 +1,53 @@
+from models import ChangeStatus, CompactChangeFile
+from processors import PathIndex
+
+PATHS = ["src/api/views.py", "src/web/views.py", "src/api/old_views.py", "README.md"]
+
+
+def change_file(path):
+    return CompactChangeFile(b"\0" * 20, path, path, ChangeStatus.modified, 1, b"\1" * 20, b"\2" * 20)
+
+
+def build_index():
+    return PathIndex(change_file(path) for path in PATHS)
+
+
+def test_full_paths_basenames_and_trailing_parts_resolve():
+    index = build_index()
+    assert index.resolve("src/api/views.py") == "src/api/views.py"
+    assert index.resolve("api/views.py") == "src/api/views.py"
+    assert index.resolve("old_views.py") == "src/api/old_views.py"
+    assert index.resolve("README.md") == "README.md"
+    assert index.get("web/views.py").full_name == "src/web/views.py"
+
+
+def test_names_are_normalized():
+    index = build_index()
+    assert index.resolve("`./src/api/views.py`") == "src/api/views.py"
+    assert index.resolve(" '/README.md' ") == "README.md"
+
+
+def test_ambiguous_and_partial_names_resolve_to_none():
+    index = build_index()
+    assert index.matches("views.py") == ["src/api/views.py", "src/web/views.py"]
+    assert index.resolve("views.py") is None
+    assert index.get("views.py") is None
+    # Only whole components match.
+    assert index.resolve("_views.py") is None
+    assert index.resolve("pi/views.py") is None
+    assert index.resolve("missing.py") is None
+
+
+def test_files_added_after_the_first_lookup_are_found():
+    index = build_index()
+    assert index.resolve("api/views.py") == "src/api/views.py"
+    index.add(change_file("lib/api/views.py"))
+    assert index.resolve("api/views.py") is None
+    assert "lib/api/views.py" in index
+    assert len(index) == len(PATHS) + 1
+
+
+def test_index_of_plain_paths():
+    index = PathIndex.from_paths(["a/b.py"])
+    assert index.resolve("b.py") == "a/b.py"
+    assert index.get("b.py") is None
@@ -0,0 +1,67 @@
+import asyncio
+
+from progressive_comment import ProgressiveComment
+
+
+class Recorder:
+    """Stands in for the comment post, recording bodies."""
+
+    def __init__(self, fail=False):
+        self.bodies = []
+        self.fail = fail
+
+    async def __call__(self, body):
+        if self.fail:
+            raise RuntimeError("post failed")
+        self.bodies.append(body)
+
+
+def test_bursts_of_changes_are_coalesced():
+    recorder = Recorder()
+    state = {"count": 0}
+
+    async def run():
+        comment = ProgressiveComment(recorder, lambda: f"count {state['count']}", 0.05)
+        for _ in range(10):
+            state["count"] += 1
+            comment.changed()
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.15)
+        return comment
+
+    comment = asyncio.run(run())
+    # The first change right away, the rest of the burst in one later post.
+    assert recorder.bodies == ["count 1", "count 10"]
+    assert comment.stats["posts"] == 2
+    assert comment.stats["coalesced"] > 0
+
+
+def test_finish_replaces_pending_updates():
+    recorder = Recorder()
+
+    async def run():
+        comment = ProgressiveComment(recorder, lambda: "progress", 10.0)
+        comment.changed()
+        await asyncio.sleep(0.01)
+        comment.changed()
+        await comment.finish("final")
+
+    asyncio.run(run())
+    assert recorder.bodies == ["progress", "final"]
+
+
+def test_failed_updates_are_skipped_and_close_posts_nothing():
+    recorder = Recorder(fail=True)
+
+    async def run():
+        comment = ProgressiveComment(recorder, lambda: "progress", 0.01)
+        comment.changed()
+        await asyncio.sleep(0.05)
+        recorder.fail = False
+        comment.changed()
+        await comment.close()
+        return comment
+
+    comment = asyncio.run(run())
+    assert comment.stats["failures"] == 1
+    assert recorder.bodies == []
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.request_scheduler import PRIORITY_HIGH, PRIORITY_LOW, RequestScheduler
+
+
+def rate_limit_headers(remaining, limit=5000, reset_in=60):
+    return {
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Reset": str(int(time.time() + reset_in)),
+    }
+
+
+def test_requests_pause_once_the_reserve_is_reached():
+    async def run():
+        scheduler = RequestScheduler(reserve=50)
+        await scheduler.acquire()
+        await scheduler.record(rate_limit_headers(50))
+        assert scheduler.remaining == 50
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.acquire(PRIORITY_HIGH), 0.2)
+
+    asyncio.run(run())
+
+
+def test_rate_is_lowered_below_the_low_water_mark():
+    async def run():
+        scheduler = RequestScheduler(rate=10.0, reserve=50, low_water=0.2)
+        await scheduler.record(rate_limit_headers(150, reset_in=100))
+        # The 100 requests above the reserve are spread over the window.
+        assert scheduler._effective_rate == pytest.approx(1.0, rel=0.05)
+        await scheduler.record(rate_limit_headers(4000))
+        assert scheduler._effective_rate == 10.0
+
+    asyncio.run(run())
+
+
+def test_higher_priority_requests_go_first():
+    async def run():
+        scheduler = RequestScheduler(rate=1000.0, burst=1)
+        order = []
+        await scheduler.pause(0.05)
+
+        async def request(name, priority):
+            await scheduler.acquire(priority)
+            order.append(name)
+
+        low = asyncio.create_task(request("low", PRIORITY_LOW))
+        await asyncio.sleep(0)
+        high = asyncio.create_task(request("high", PRIORITY_HIGH))
+        await asyncio.gather(low, high)
+        return order
+
+    assert asyncio.run(run()) == ["high", "low"]
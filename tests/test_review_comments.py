@@ -0,0 +1,35 @@
+from models import ChangeSummary, ReviewState
+from processors.review_comments import finding_path, parse_findings
+
+
+def test_findings_are_read_from_file_summaries():
+    summaries = [
+        ChangeSummary(
+            full_name="src/app.py",
+            summary="Adds retries.\nFINDING 12 bug: the counter is never reset\n"
+                    "FINDING 20-24 Error: `items` may be None here",
+        ),
+        ChangeSummary(full_name="README.md", summary="Mentions the FINDING format inline."),
+    ]
+    findings = parse_findings(summaries)
+    assert [(f.path, f.line, f.end_line, f.kind) for f in findings] == [
+        ("src/app.py", 12, None, "bug"),
+        ("src/app.py", 20, 24, "error"),
+    ]
+    assert findings[1].body == "`items` may be None here"
+
+
+def test_finding_path_keeps_colons_of_the_path():
+    assert finding_path("a:b.py:12:0123456789ab") == "a:b.py"
+
+
+def test_oversized_marker_keeps_the_latest_posted_findings():
+    keys = [f"src/file_{index}.py:1:{index:012x}" for index in range(20_000)]
+    state = ReviewState(head_sha="abc", file_summaries={"a": "x" * 100_000}, posted_findings=keys)
+    marker = state.to_marker()
+
+    assert len(marker) <= ReviewState.MAX_MARKER_LENGTH
+    decoded = ReviewState.from_comment_body(marker)
+    assert decoded.file_summaries == {}
+    assert decoded.posted_findings == keys[-len(decoded.posted_findings):]
+    assert decoded.posted_findings
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import hmac
+import json
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from batch import ReviewTarget
+from server import ReviewServer
+
+SECRET = "secret"
+
+
+class FakeReviewer:
+    """Stands in for build_reviewer, recording targets instead of reviewing them."""
+
+    def __init__(self):
+        self.targets: list[ReviewTarget] = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, target: ReviewTarget) -> None:
+        self.targets.append(target)
+        await self.release.wait()
+
+
+def pull_request_event(number: int, action: str = "synchronize", **pull_request) -> dict:
+    return {
+        "action": action,
+        "repository": {"full_name": "o/r"},
+        "pull_request": {"number": number, **pull_request},
+    }
+
+
+async def deliver(client: TestClient, payload, secret=SECRET, event="pull_request"):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    headers = {"X-GitHub-Event": event}
+    if secret is not None:
+        digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        headers["X-Hub-Signature-256"] = f"sha256={digest}"
+    return await client.post("/webhook", data=body, headers=headers)
+
+
+def run_with_server(test, server: ReviewServer):
+    async def run():
+        async with TestClient(TestServer(server.build_app())) as client:
+            await test(client)
+
+    asyncio.run(run())
+
+
+def test_requires_secret_unless_insecure():
+    with pytest.raises(ValueError):
+        ReviewServer(FakeReviewer())
+    ReviewServer(FakeReviewer(), insecure=True)
+
+
+def test_rejects_unsigned_and_badly_signed_deliveries():
+    reviewer = FakeReviewer()
+    server = ReviewServer(reviewer, webhook_secret=SECRET)
+
+    async def test(client):
+        assert (await deliver(client, pull_request_event(1), secret=None)).status == 401
+        assert (await deliver(client, pull_request_event(1), secret="wrong")).status == 401
+        assert server.stats["received"] == 0
+
+    run_with_server(test, server)
+    assert reviewer.targets == []
+
+
+def test_malformed_payloads_are_bad_requests():
+    server = ReviewServer(FakeReviewer(), webhook_secret=SECRET)
+
+    async def test(client):
+        for payload in [
+            b"not json",
+            b"[]",
+            {"action": "opened"},
+            {"action": "opened", "pull_request": {"number": 1}},
+            {"action": "opened", "repository": {"full_name": "o/r"}, "pull_request": {}},
+            {"action": "opened", "repository": {}, "pull_request": {"number": 1}},
+            pull_request_event("1", action="opened"),
+            {"action": "opened", "repository": {"full_name": "o/r"}, "pull_request": None},
+        ]:
+            response = await deliver(client, payload)
+            assert response.status == 400, payload
+
+    run_with_server(test, server)
+    assert len(server.queue) == 0
+
+
+def test_ignores_other_events_and_drafts():
+    server = ReviewServer(FakeReviewer(), webhook_secret=SECRET)
+
+    async def test(client):
+        assert (await (await deliver(client, {}, event="ping")).json())["status"] == "pong"
+        for payload, event in [
+            (pull_request_event(1, action="closed"), "pull_request"),
+            (pull_request_event(1, draft=True), "pull_request"),
+            ({"action": "created"}, "issue_comment"),
+        ]:
+            response = await deliver(client, payload, event=event)
+            assert (await response.json())["status"] == "ignored"
+
+    run_with_server(test, server)
+    assert server.stats["ignored"] == 3
+
+
+def test_coalesces_events_of_a_waiting_pull_request():
+    reviewer = FakeReviewer()
+    server = ReviewServer(reviewer, workers=1, webhook_secret=SECRET)
+
+    async def test(client):
+        statuses = []
+        for number in [1, 2, 2, 2, 3]:
+            response = await deliver(client, pull_request_event(number))
+            assert response.status == 202
+            statuses.append((await response.json())["status"])
+        # The worker holds pull request 1, the others wait in the queue.
+        assert statuses == ["queued", "queued", "coalesced", "coalesced", "queued"]
+        reviewer.release.set()
+        await asyncio.wait_for(server.queue.join(), 5)
+
+    run_with_server(test, server)
+    assert reviewer.targets == [ReviewTarget("o/r", 1), ReviewTarget("o/r", 2), ReviewTarget("o/r", 3)]
+    assert server.stats["reviewed"] == 3
+    assert server.queue.coalesced == 2
+
+
+def test_insecure_server_accepts_unsigned_deliveries():
+    reviewer = FakeReviewer()
+    reviewer.release.set()
+    server = ReviewServer(reviewer, insecure=True)
+
+    async def test(client):
+        assert (await deliver(client, pull_request_event(7), secret=None)).status == 202
+        await asyncio.wait_for(server.queue.join(), 5)
+
+    run_with_server(test, server)
+    assert reviewer.targets == [ReviewTarget("o/r", 7)]
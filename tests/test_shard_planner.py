@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from main import _batch_reviews, merge_reviews
+from models import ChangeStatus, ChangeSummary, CompactChangeFile
+from processors import PromptPacker, ShardPlanner
+from prompt_templates import grimoire
+from utils.output_struc import Comment
+from utils.stub_llm import StubChatModel
+from utils.token_utils import count_tokens
+
+SUMMARY = "Changes the handling of requests and updates the matching tests. " * 3
+
+
+def change_file(path, status=ChangeStatus.modified, source=None):
+    return CompactChangeFile(b"\0" * 20, path, source or path, status, 1, b"\1" * 20, b"\2" * 20)
+
+
+def plan(paths_or_files, token_budget):
+    change_files = [
+        change_file(item) if isinstance(item, str) else item for item in paths_or_files
+    ]
+    summaries = [ChangeSummary(full_name=cf.full_name, summary=SUMMARY) for cf in change_files]
+    return change_files, ShardPlanner(token_budget).plan(change_files, summaries)
+
+
+def file_tokens(path):
+    return ShardPlanner.file_tokens(
+        change_file(path), ChangeSummary(full_name=path, summary=SUMMARY)
+    )
+
+
+def test_small_pull_request_is_one_shard():
+    change_files, shards = plan(["src/api/a.py", "src/api/b.py"], 10_000)
+    assert len(shards) == 1
+    assert shards[0].label == "src/api (python)"
+    assert [cf.full_name for cf in shards[0].change_files] == ["src/api/a.py", "src/api/b.py"]
+
+
+def test_shards_respect_the_budget_and_keep_every_file_once():
+    paths = [
+        f"src/package_{package}/module_{module}.{suffix}"
+        for package in range(8)
+        for module in range(15)
+        for suffix in ("py", "ts")
+    ] + [f"README_{index}.md" for index in range(10)]
+    budget = 20 * file_tokens(paths[0])
+    change_files, shards = plan(paths, budget)
+
+    assert len(shards) > 1
+    assert all(shard.tokens <= budget for shard in shards)
+    assert all(len(shard.code_summaries) == len(shard.change_files) for shard in shards)
+    planned = [cf.full_name for shard in shards for cf in shard.change_files]
+    assert sorted(planned) == sorted(paths)
+    assert len(planned) == len(set(planned))
+
+
+def test_files_of_a_crowded_directory_are_grouped_by_language():
+    paths = [f"lib/file_{index}.{suffix}" for index in range(10) for suffix in ("py", "go")]
+    _, shards = plan(paths, 12 * file_tokens(paths[0]))
+    assert [shard.label for shard in shards] == ["lib (go)", "lib (python)"]
+
+
+def test_neighbouring_small_shards_are_coalesced():
+    big = [f"core/module_{index}.py" for index in range(30)]
+    small = ["docs/a.md", "tools/b.py"]
+    budget = 10 * file_tokens(big[0])
+    _, shards = plan(big + small, budget)
+
+    # core is split up to the budget, and the two small directories share a shard.
+    small_shards = [
+        shard for shard in shards
+        if {cf.full_name for cf in shard.change_files} & set(small)
+    ]
+    assert len(small_shards) == 1
+    assert {cf.full_name for cf in small_shards[0].change_files} >= set(small)
+    assert len(shards) <= len(big) // 10 + 1
+
+
+def test_directory_moves_stay_together():
+    moves = [
+        change_file(f"new/pkg/module_{index}.py", ChangeStatus.renaming, f"old/pkg/module_{index}.py")
+        for index in range(12)
+    ]
+    others = [change_file(f"new/pkg/zz_{index}.py") for index in range(12)] + [
+        change_file(f"other/file_{index}.py") for index in range(12)
+    ]
+    budget = 14 * file_tokens(moves[0].full_name)
+    _, shards = plan(moves + others, budget)
+
+    holding = [shard for shard in shards if set(shard.change_files) & set(moves)]
+    assert len(holding) == 1
+    assert set(moves) <= set(holding[0].change_files)
+    assert all(shard.tokens <= budget for shard in shards)
+
+
+def test_moves_larger_than_the_budget_are_split_within_it():
+    moves = [
+        change_file(f"new/module_{index}.py", ChangeStatus.renaming, f"old/module_{index}.py")
+        for index in range(30)
+    ]
+    budget = 8 * file_tokens(moves[0].full_name)
+    _, shards = plan(moves, budget)
+    assert len(shards) > 1
+    assert all(shard.tokens <= budget for shard in shards)
+    assert sum(len(shard.change_files) for shard in shards) == len(moves)
+
+
+@pytest.mark.parametrize("count", [2, 3, 5, 17, 64])
+@pytest.mark.parametrize("token_budget", [-100, 0, 10, 1_000, 1_000_000])
+def test_batching_reviews_always_makes_progress(count, token_budget):
+    texts = [f"Part: {index}\n" + "review text " * (index % 7 + 1) for index in range(count)]
+    rounds = 0
+    while len(texts) > 1:
+        batches = _batch_reviews(texts, token_budget)
+        assert [index for batch in batches for index in batch] == list(range(len(texts)))
+        assert len(batches) < len(texts)
+        texts = [" ".join(texts[index] for index in batch) for batch in batches]
+        rounds += 1
+        assert rounds <= count
+
+
+def test_reviews_fitting_the_budget_are_merged_at_once():
+    texts = ["Part: a\nshort", "Part: b\nshort", "Part: c\nshort"]
+    assert _batch_reviews(texts, 1_000) == [range(0, 3)]
+
+
+class CountingStub(StubChatModel):
+    calls: int = 0
+
+    def _generate(self, *args, **kwargs):
+        self.calls += 1
+        return super()._generate(*args, **kwargs)
+
+
+def test_merge_reviews_ends_with_one_review():
+    reviews = [
+        (f"src/part_{index}", Comment(
+            changes_description="Reworks the part. " * 20,
+            pr_category="Refactor",
+            objective="Cleaner parts.",
+        ))
+        for index in range(9)
+    ]
+    llm = CountingStub(response="merged")
+    # Room for little more than two partial reviews per merge.
+    packer = PromptPacker(token_budget=count_tokens(grimoire.PR_REVIEW_MERGE) + 300)
+    merged = asyncio.run(merge_reviews(reviews, llm, packer, max_concurrency=2))
+
+    assert merged.changes_description == "merged"
+    # Every merge call joins at least two reviews into one.
+    assert 1 < llm.calls <= len(reviews) - 1
+
+
+def test_merge_reviews_returns_a_single_review_unchanged():
+    comment = Comment(changes_description="only", pr_category="Fix", objective="o")
+    llm = CountingStub()
+    assert asyncio.run(merge_reviews([("src", comment)], llm, PromptPacker())) is comment
+    assert llm.calls == 0
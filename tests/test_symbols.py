@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from cache import ContextCache
+from models import ChangeStatus, CompactChangeFile
+from processors import ContextIndex
+from processors.context_index import CONTEXT_HEADER
+from processors.symbols import parse_symbols
+from utils.diff_utils import build_compact_diff, build_patch
+
+SOURCES = {
+    "src/counter.js": """class Counter {
+  #count = 0;
+  inc() {
+    this.#count++;
+    if (this.#count > 3) {
+      this.reset();
+    }
+  }
+  reset() {
+    this.#count = 0;
+  }
+}
+""",
+    "src/repo.php": """<?php
+use App\\Models\\User;
+# a closing } in a comment
+class Repo {
+    public function find($id) {
+        return User::find($id); // }
+    }
+}
+""",
+    "src/clamp.c": """#include "util.h"
+#define MAX(a, b) ((a) > (b) ? (a) : (b))
+
+static int clamp(int v) {
+    return MAX(v, 0);
+}
+
+struct point {
+    int x;
+};
+""",
+    "cmd/server.go": """package main
+
+import "fmt"
+
+func (s *Server) Run() {
+    fmt.Println("#{")
+}
+
+type Server struct {
+    name string
+}
+""",
+    "pkg/service.py": """from .models import User
+
+
+class Service:
+    def load(self, user_id):
+        return User.get(user_id)
+""",
+}
+
+
+def spans(path):
+    symbols = parse_symbols(path, SOURCES[path])
+    return {d.name: (d.kind, d.start, d.end, d.parent) for d in symbols.definitions}
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("src/counter.js", {
+        "Counter": ("class", 1, 12, None),
+        "inc": ("function", 3, 8, "Counter"),
+        "reset": ("function", 9, 11, "Counter"),
+    }),
+    ("src/repo.php", {
+        "Repo": ("class", 4, 8, None),
+        "find": ("function", 5, 7, "Repo"),
+    }),
+    ("src/clamp.c", {
+        "clamp": ("function", 4, 6, None),
+        "point": ("class", 8, 10, None),
+    }),
+    ("cmd/server.go", {
+        "Run": ("function", 5, 7, None),
+        "Server": ("class", 9, 11, None),
+    }),
+    ("pkg/service.py", {
+        "Service": ("class", 4, 6, None),
+        "load": ("function", 5, 6, "Service"),
+    }),
+])
+def test_definitions(path, expected):
+    assert spans(path) == expected
+
+
+def test_imports_and_calls():
+    c = parse_symbols("src/clamp.c", SOURCES["src/clamp.c"])
+    assert c.imports == ["util.h"]
+    # The macro's definition is a preprocessor line, not a call.
+    assert [(call.name, call.line) for call in c.calls] == [("MAX", 5)]
+
+    php = parse_symbols("src/repo.php", SOURCES["src/repo.php"])
+    assert php.imports == ["App\\Models\\User"]
+    assert parse_symbols("cmd/server.go", SOURCES["cmd/server.go"]).imports == ["fmt"]
+    assert parse_symbols("pkg/service.py", SOURCES["pkg/service.py"]).imports == [
+        ".models", ".models.User"
+    ]
+
+
+def test_unindexed_and_invalid_files():
+    assert parse_symbols("README.md", "# Title\n") is None
+    assert parse_symbols("broken.py", "def (:\n").definitions == []
+
+
+def blob_sha(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class FakeSource:
+    """Serves a tree and its blobs, like GitMirror."""
+
+    def __init__(self, files):
+        self.files = files
+        self.texts = {blob_sha(text): text for text in files.values()}
+
+    async def tree(self, commit_sha):
+        return {path: blob_sha(text) for path, text in self.files.items()}, False
+
+    async def blobs(self, shas):
+        return {sha: self.texts.get(sha) for sha in shas}
+
+
+def changed_file(path, old, new):
+    return CompactChangeFile(
+        bytes.fromhex(blob_sha(new)), path, path, ChangeStatus.modified, 1, b"\1" * 20, b"\2" * 20,
+        diff_content=build_compact_diff(build_patch(old, new)),
+    )
+
+
+def test_contexts_describe_changed_definitions_and_their_callers():
+    user = SOURCES["src/counter.js"]
+    caller = "import { Counter } from './counter';\n\nfunction tick(counter) {\n  counter.inc();\n}\n"
+    source = FakeSource({"src/counter.js": user, "src/main.js": caller, "README.md": "x"})
+    index = ContextIndex(source)
+
+    new = user.replace("this.reset();", "this.reset();\n      this.#count = 0;")
+    source.texts[blob_sha(new)] = new
+
+    async def run():
+        await index.update("base")
+        return await index.contexts([changed_file("src/counter.js", user, new)])
+
+    contexts = asyncio.run(run())
+    assert index.stats["files"] == 2
+    lines = contexts["src/counter.js"].split("\n")
+    assert lines[0] == CONTEXT_HEADER
+    assert lines[1] == "- lines 3-9 in Counter: `inc() {`"
+    assert lines[2] == "  - called at src/main.js:4 in tick: `counter.inc();`"
+
+
+def test_contexts_skip_files_without_hunks_or_symbols():
+    index = ContextIndex(FakeSource({}))
+    readme = changed_file("README.md", "a\n", "b\n")
+    assert asyncio.run(index.contexts([readme])) == {}
+
+
+def test_cached_symbols_are_kept_apart_by_language(tmp_path):
+    cache = ContextCache(tmp_path / "context.sqlite3")
+    cache.put_symbols({"abc": {"d": [], "i": ["x"], "c": []}}, {"abc": "c"})
+    assert cache.get_symbols({"abc": "c"}) == {"abc": {"d": [], "i": ["x"], "c": []}}
+    assert cache.get_symbols({"abc": "cpp"}) == {}
+    cache.close()
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+from typing import AsyncIterator, Optional
+
+import aiohttp
+
+from models import ChangeStatus, CompactChangeFile, CompactDiff
+from utils.diff_utils import build_compact_diff, build_patch
+from utils.github_http import GithubHttpClient
+from utils.request_scheduler import PRIORITY_NORMAL
+
+MAX_BLOB_BYTES = 1024 * 1024
+"""Blobs larger than this are not diffed locally."""
+
+
+def decode_blob(data: bytes) -> Optional[str]:
+    """Decode blob bytes as text, or None if they look binary."""
+    if b"\0" in data[:8000]:
+        return None
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+class BlobFetcher:
+    """Fetches the base and head contents of many files through the Git database API.
+
+    Base blob shas come from one recursive tree listing of the base commit,
+    head blob shas from the pull request file listing, and every blob is then
+    fetched concurrently, so diffing N files costs N blob requests plus one
+    tree request rather than two contents requests per file.
+    """
+
+    def __init__(
+        self,
+        client: GithubHttpClient,
+        repository_full_name: str,
+        max_concurrency: int = 8,
+        max_blob_bytes: int = MAX_BLOB_BYTES,
+        priority: int = PRIORITY_NORMAL,
+    ):
+        self._client = client
+        self._repo_path = f"/repos/{repository_full_name}"
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_blob_bytes = max_blob_bytes
+        self._priority = priority
+
+    async def tree(self, commit_sha: str) -> tuple[dict[str, str], bool]:
+        """Map every file path at a commit to its blob sha.
+
+        The second value tells whether Github truncated the listing.
+        """
+        git_tree = await self._client.get_json(
+            f"{self._repo_path}/git/trees/{commit_sha}",
+            {"recursive": "1"},
+            priority=self._priority,
+        )
+        paths = {
+            entry["path"]: entry["sha"]
+            for entry in git_tree["tree"]
+            if entry["type"] == "blob"
+        }
+        return paths, git_tree.get("truncated", False)
+
+    async def blob_sha(self, path: str, ref: str) -> Optional[str]:
+        """Look up the blob sha of one path at a ref, for paths missing from a truncated tree."""
+        try:
+            contents = await self._client.get_json(
+                f"{self._repo_path}/contents/{path}", {"ref": ref}, priority=self._priority
+            )
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                return None
+            raise
+        return contents.get("sha") if isinstance(contents, dict) else None
+
+    async def blob(self, sha: str) -> Optional[str]:
+        """Fetch a blob as text, or None if it is binary or too large."""
+        async with self._semaphore:
+            git_blob = await self._client.get_json(
+                f"{self._repo_path}/git/blobs/{sha}", priority=self._priority
+            )
+        if git_blob["size"] > self._max_blob_bytes:
+            return None
+        if git_blob.get("encoding") == "base64":
+            return decode_blob(base64.b64decode(git_blob["content"]))
+        return git_blob["content"]
+
+    async def blobs(self, shas: list[str]) -> dict[str, Optional[str]]:
+        """Fetch blobs concurrently, as `blob` does."""
+        texts = await asyncio.gather(*(self.blob(sha) for sha in shas))
+        return dict(zip(shas, texts))
+
+    async def iter_diffs(
+        self, change_files: list[CompactChangeFile], base_sha: str
+    ) -> AsyncIterator[tuple[CompactChangeFile, CompactDiff]]:
+        """Diff each change file locally between the base commit and its head blob.
+
+        Results are yielded as soon as each file's blobs arrive. Files that
+        are binary or too large get an empty diff.
+        """
+        if not change_files:
+            return
+
+        base_paths, truncated = await self.tree(base_sha)
+        blobs: dict[str, asyncio.Task[Optional[str]]] = {}
+
+        def fetch(sha: Optional[str]) -> Optional[asyncio.Task[Optional[str]]]:
+            if sha is None:
+                return None
+            if sha not in blobs:
+                blobs[sha] = asyncio.ensure_future(self.blob(sha))
+            return blobs[sha]
+
+        async def base_blob_sha(change_file: CompactChangeFile) -> Optional[str]:
+            if change_file.status == ChangeStatus.addition:
+                return None
+            sha = base_paths.get(change_file.source_full_name)
+            if sha is None and truncated:
+                sha = await self.blob_sha(change_file.source_full_name, base_sha)
+            return sha
+
+        async def diff(change_file: CompactChangeFile) -> tuple[CompactChangeFile, CompactDiff]:
+            source_task = fetch(await base_blob_sha(change_file))
+            target_task = (
+                None if change_file.status == ChangeStatus.deletion else fetch(change_file.sha)
+            )
+            source = await source_task if source_task is not None else ""
+            target = await target_task if target_task is not None else ""
+            if source is None or target is None:
+                return change_file, CompactDiff.empty()
+            patch = await asyncio.to_thread(build_patch, source, target)
+            return change_file, build_compact_diff(patch)
+
+        try:
+            for result in asyncio.as_completed([diff(cf) for cf in change_files]):
+                yield await result
+        finally:
+            for task in blobs.values():
+                task.cancel()
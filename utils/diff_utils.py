@@ -1,9 +1,113 @@
+import difflib
 import io
+import itertools
+import re
+from typing import Iterator, NamedTuple, Optional
 
-import unidiff
+from models import CompactDiff, DiffContent, DiffSegment
 
+HUNK_HEADER = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
 
-def parse_diff(diff: str) -> unidiff.PatchSet:
+
+class HunkSpan(NamedTuple):
+    """A hunk located in a patch by offsets, without copying its text."""
+
+    start: int
+    """Offset of the hunk header in the patch."""
+    end: int
+    """Offset just past the hunk, including its trailing newline."""
+    source_start: int
+    source_length: int
+    target_start: int
+    target_length: int
+    add_count: int
+    remove_count: int
+
+
+def iter_hunk_spans(patch: str) -> Iterator[HunkSpan]:
+    """Scan a patch once and yield its hunks as offsets into it.
+
+    Only hunk headers are parsed; added and removed lines are counted with
+    `str.count` over the hunk's range, so no per-line objects are created.
+    Text before the first hunk header is ignored.
+    """
+    start = 0 if patch.startswith("@@") else patch.find("\n@@") + 1
+    if start == 0 and not patch.startswith("@@"):
+        return
+    while True:
+        next_header = patch.find("\n@@", start)
+        end = len(patch) if next_header == -1 else next_header + 1
+
+        header = HUNK_HEADER.match(patch, start)
+        if header is None:
+            raise ValueError(f"Invalid hunk header at offset {start}.")
+        source_start, source_length, target_start, target_length = header.groups()
+        yield HunkSpan(
+            start=start,
+            end=end,
+            source_start=int(source_start),
+            source_length=int(source_length) if source_length is not None else 1,
+            target_start=int(target_start),
+            target_length=int(target_length) if target_length is not None else 1,
+            # Body lines follow a newline; the header line itself starts with "@@".
+            add_count=patch.count("\n+", start, end),
+            remove_count=patch.count("\n-", start, end),
+        )
+        if next_header == -1:
+            return
+        start = end
+
+
+def build_diff_content(patch: Optional[str], prev_name: str, name: str) -> DiffContent:
+    """Parse a file patch and build its DiffContent.
+
+    Github omits `patch` for binary and very large files, in which case an
+    empty DiffContent is returned.
+    """
+    if not patch:
+        return DiffContent(add_count=0, remove_count=0, content="", diff_segments=[])
+
+    diff_segments = [
+        DiffSegment(
+            add_count=span.add_count,
+            remove_count=span.remove_count,
+            content=patch[span.start:span.end],
+            source_start_line_number=span.source_start,
+            source_length=span.source_length,
+            target_start_line_number=span.target_start,
+            target_length=span.target_length,
+        )
+        for span in iter_hunk_spans(patch)
+    ]
+    return DiffContent(
+        add_count=sum(segment.add_count for segment in diff_segments),
+        remove_count=sum(segment.remove_count for segment in diff_segments),
+        content=patch,
+        diff_segments=diff_segments,
+    )
+
+
+def build_patch(source: str, target: str, context: int = 3) -> str:
+    """Diff two file contents into a Github style patch: hunks without file headers."""
+    lines = difflib.unified_diff(
+        source.splitlines(), target.splitlines(), n=context, lineterm=""
+    )
+    # The first two lines are the --- and +++ file headers.
+    return "\n".join(itertools.islice(lines, 2, None))
+
+
+def build_compact_diff(patch: Optional[str]) -> CompactDiff:
+    """Parse a file patch into a CompactDiff referencing the patch by offsets."""
+    if not patch:
+        return CompactDiff.empty()
+    return CompactDiff.from_rows(patch, iter_hunk_spans(patch))
+
+
+# unidiff based parsing, kept for callers that need per-line objects. unidiff
+# is imported lazily so it is only required when these are used.
+
+
+def parse_diff(diff: str):
     """parse file diff content to unidiff.PatchSet
 
     diff content has a format of:
@@ -11,9 +115,26 @@ def parse_diff(diff: str) -> unidiff.PatchSet:
     +++ b/bbb.txt
     (diff contents)
     """
+    import unidiff
+
     return unidiff.PatchSet(io.StringIO(diff))[0]
 
 
 def parse_patch_file(patch: str, prev_name: str, name: str):
     """parse file patch content to unidiff.PatchSet"""
+    import unidiff
+
     return unidiff.PatchSet(io.StringIO(f"""--- a/{prev_name}\n+++ b/{name}\n{patch}"""))[0]
+
+
+def build_diff_segment(patched_hunk) -> DiffSegment:
+    """Build a DiffSegment from an unidiff hunk."""
+    return DiffSegment(
+        add_count=patched_hunk.added or 0,
+        remove_count=patched_hunk.removed or 0,
+        content=str(patched_hunk),
+        source_start_line_number=patched_hunk.source_start,
+        source_length=patched_hunk.source_length,
+        target_start_line_number=patched_hunk.target_start,
+        target_length=patched_hunk.target_length,
+    )
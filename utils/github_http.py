@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Optional
+
+import aiohttp
+from yarl import URL
+
+from cache import ResponseCache
+from utils.request_scheduler import PRIORITY_HIGH, PRIORITY_NORMAL, RequestScheduler
+from utils.telemetry import count, span
+
+
+class GithubHttpClient:
+    """Async Github REST client sharing one pooled HTTP session.
+
+    Every request goes through a RequestScheduler, so clients sharing one
+    scheduler share the token's rate limit. GET responses are cached with
+    their ETags when a ResponseCache is given, and repeated GETs are sent as
+    conditional requests whose 304 answers do not count against the limit.
+    """
+
+    API_URL = "https://api.github.com"
+    PER_PAGE = 100
+    MAX_RETRIES = 3
+    ACTIONS_LOGIN = "github-actions[bot]"
+    """Author of what a workflow writes with its GITHUB_TOKEN, which may not read /user."""
+
+    def __init__(
+        self,
+        token: str,
+        base_url: str = API_URL,
+        max_connections: int = 16,
+        timeout: float = 30.0,
+        scheduler: Optional[RequestScheduler] = None,
+        response_cache: Optional[ResponseCache] = None,
+    ):
+        self._token = token
+        self._base_url = base_url.rstrip("/")
+        self._max_connections = max_connections
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.scheduler = scheduler or RequestScheduler()
+        self.response_cache = response_cache
+        self.stats = {"requests": 0, "not_modified": 0, "retries": 0}
+        self._login: Optional[str] = None
+        self._login_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> GithubHttpClient:
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    @property
+    def token(self) -> str:
+        return self._token
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The pooled session. Created on first use so it binds to the running loop."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={
+                    "Authorization": f"Bearer {self._token}",
+                    "Accept": "application/vnd.github+json",
+                    "X-GitHub-Api-Version": "2022-11-28",
+                },
+                connector=aiohttp.TCPConnector(limit=self._max_connections),
+                timeout=self._timeout,
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def login(self) -> str:
+        """Login of the token's identity, asked of Github once per client."""
+        async with self._login_lock:
+            if self._login is None:
+                try:
+                    user = await self.get_json("/user", priority=PRIORITY_HIGH)
+                    self._login = user["login"]
+                except aiohttp.ClientResponseError as e:
+                    # Installation tokens cannot read /user.
+                    if e.status != 403:
+                        raise
+                    self._login = self.ACTIONS_LOGIN
+        return self._login
+
+    def _url(self, path: str) -> str:
+        """Full url of an api path, or of an absolute url taken from a response.
+
+        The session sends the token with every request, so absolute urls
+        must point at the api itself.
+        """
+        if path.startswith("http"):
+            if URL(path).origin() != URL(self._base_url).origin():
+                raise ValueError(f"Refusing to send the token to {URL(path).origin()}.")
+            return path
+        return f"{self._base_url}{path}"
+
+    @staticmethod
+    def _cache_key(url: str, params: Optional[dict]) -> str:
+        query = "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+        return f"{url}?{query}"
+
+    @staticmethod
+    def _retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+        """Seconds to back off for a rate limited response, or None if it is not one."""
+        if response.status not in (403, 429):
+            return None
+        if "Retry-After" in response.headers:
+            return float(response.headers["Retry-After"])
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = float(response.headers.get("X-RateLimit-Reset", time.time() + 60))
+            return max(1.0, reset - time.time())
+        if response.status == 429:
+            return 60.0
+        return None
+
+    async def request_json(
+        self,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        json: Any = None,
+        priority: int = PRIORITY_NORMAL,
+    ) -> Any:
+        """Send a request through the scheduler and decode the json response.
+
+        Rate limited requests are retried after the back-off Github asks for.
+        """
+        url = self._url(path)
+        cache_key = self._cache_key(url, params)
+        cached = None
+        if method == "GET" and self.response_cache is not None:
+            cached = self.response_cache.get(cache_key)
+
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        with span("github.request", method=method, path=path) as request_span:
+            for attempt in range(self.MAX_RETRIES + 1):
+                await self.scheduler.acquire(priority)
+                self.stats["requests"] += 1
+                count("github_requests", method=method)
+                async with self.session.request(
+                    method, url, params=params, json=json, headers=headers
+                ) as response:
+                    await self.scheduler.record(response.headers)
+                    request_span.set("status", response.status)
+                    if response.status == 304 and cached:
+                        self.stats["not_modified"] += 1
+                        count("cache_hits", cache="github_etag")
+                        return cached[1]
+
+                    retry_after = self._retry_after(response)
+                    if retry_after is not None and attempt < self.MAX_RETRIES:
+                        self.stats["retries"] += 1
+                        await self.scheduler.pause(retry_after)
+                        continue
+
+                    response.raise_for_status()
+                    if response.status == 204:
+                        return None
+                    # The body is buffered by read, so json decodes it without reading again.
+                    received = len(await response.read())
+                    count("github_bytes_received", received)
+                    request_span.set("bytes", received)
+                    body = await response.json()
+                    etag = response.headers.get("ETag")
+                    if method == "GET" and etag and self.response_cache is not None:
+                        self.response_cache.put(cache_key, etag, body)
+                    return body
+
+    async def get_json(
+        self, path: str, params: Optional[dict] = None, priority: int = PRIORITY_NORMAL
+    ) -> Any:
+        """GET an api path and decode the json response."""
+        return await self.request_json("GET", path, params, priority=priority)
+
+    async def get_page(
+        self,
+        path: str,
+        page: int,
+        params: Optional[dict] = None,
+        priority: int = PRIORITY_NORMAL,
+    ) -> list:
+        """GET one page of a paginated listing."""
+        page_params = {"per_page": self.PER_PAGE, "page": page, **(params or {})}
+        return await self.get_json(path, page_params, priority)
+
+    async def get_pages(
+        self,
+        path: str,
+        pages: range,
+        params: Optional[dict] = None,
+        priority: int = PRIORITY_NORMAL,
+    ) -> list:
+        """GET several pages of a listing concurrently and flatten them in order."""
+        results = await asyncio.gather(
+            *(self.get_page(path, page, params, priority) for page in pages)
+        )
+        return [item for page_items in results for item in page_items]
+
+    async def post_json(self, path: str, json: Any) -> Any:
+        """POST a json body. Writes are sent ahead of queued reads."""
+        return await self.request_json("POST", path, json=json, priority=PRIORITY_HIGH)
+
+    async def patch_json(self, path: str, json: Any) -> Any:
+        """PATCH a json body. Writes are sent ahead of queued reads."""
+        return await self.request_json("PATCH", path, json=json, priority=PRIORITY_HIGH)
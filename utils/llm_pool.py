@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.runnables import Runnable
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel, Field, PrivateAttr
+
+from utils.telemetry import Span, count, span
+
+BACKENDS_ENV = "PR_AGENT_LLM_BACKENDS"
+"""Environment variable holding a PoolConfig as JSON."""
+
+DEFAULT_TIMEOUT = 60.0
+
+DEFAULT_HEDGE_AFTER = 20.0
+
+
+class BackendConfig(BaseModel):
+    """One model endpoint, OpenAI or any OpenAI-compatible server."""
+
+    model: str = Field()
+    base_url: Optional[str] = Field(default=None)
+    """Endpoint of an OpenAI-compatible server; the OpenAI API if None."""
+    api_key_env: Optional[str] = Field(default=None)
+    """Environment variable holding the endpoint's API key."""
+    max_concurrency: int = Field(default=8)
+    """Requests in flight to this backend at once."""
+    timeout: float = Field(default=DEFAULT_TIMEOUT)
+    """Seconds before a request counts as failed."""
+    max_retries: int = Field(default=2)
+    """Retries within the backend on rate limits and server errors, as ChatOpenAI
+    does by default, before the pool falls back to the next backend."""
+
+
+class PoolConfig(BaseModel):
+    backends: list[BackendConfig] = Field(default_factory=list)
+    """Backends in order of preference."""
+    hedge_after: Optional[float] = Field(default=DEFAULT_HEDGE_AFTER)
+    """Seconds after which a duplicate request is sent; None disables hedging."""
+    failure_threshold: int = Field(default=3)
+    """Consecutive failures that open a backend's circuit."""
+    reset_after: float = Field(default=30.0)
+    """Seconds an open circuit waits before letting a trial request through."""
+
+    @classmethod
+    def from_env(cls) -> Optional[PoolConfig]:
+        """Read the pool configuration from `$PR_AGENT_LLM_BACKENDS`, if set."""
+        value = os.getenv(BACKENDS_ENV)
+        if not value:
+            return None
+        data = json.loads(value)
+        # A bare list of backends is accepted too.
+        return cls.model_validate({"backends": data} if isinstance(data, list) else data)
+
+
+class LLMBackend:
+    """A chat model with a concurrency limit, a timeout and a circuit breaker."""
+
+    def __init__(
+        self,
+        model: BaseChatModel,
+        config: BackendConfig,
+        failure_threshold: int = 3,
+        reset_after: float = 30.0,
+    ):
+        self.model = model
+        self.config = config
+        self._failure_threshold = failure_threshold
+        self._reset_after = reset_after
+        self._semaphore = asyncio.Semaphore(config.max_concurrency)
+        self._thread_semaphore = threading.BoundedSemaphore(config.max_concurrency)
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self.stats = {"requests": 0, "failures": 0, "timeouts": 0}
+
+    @property
+    def name(self) -> str:
+        return f"{self.config.model}@{self.config.base_url or 'openai'}"
+
+    @property
+    def available(self) -> bool:
+        """Whether the circuit is closed, or open long enough to try again."""
+        return (
+            self._opened_at is None
+            or time.monotonic() - self._opened_at >= self._reset_after
+        )
+
+    def _record(self, success: bool) -> None:
+        if success:
+            self._failures = 0
+            self._opened_at = None
+            return
+        self.stats["failures"] += 1
+        self._failures += 1
+        if self._failures >= self._failure_threshold:
+            # Also restarts the wait after a failed trial request.
+            self._opened_at = time.monotonic()
+
+    def _record_usage(self, request_span: Span, result: ChatResult) -> None:
+        """Add the token counts the model reported to the span and the counters."""
+        input_tokens = output_tokens = 0
+        for generation in result.generations:
+            usage = getattr(generation.message, "usage_metadata", None) or {}
+            input_tokens += usage.get("input_tokens", 0)
+            output_tokens += usage.get("output_tokens", 0)
+        request_span.set("input_tokens", input_tokens)
+        request_span.set("output_tokens", output_tokens)
+        count("llm_tokens", input_tokens, backend=self.name, kind="input")
+        count("llm_tokens", output_tokens, backend=self.name, kind="output")
+
+    def _bound_kwargs(self, tools: Optional[list[dict]], kwargs: dict) -> dict:
+        """Format bound tools the way this backend's model expects them."""
+        if not tools:
+            return kwargs
+        tool_choice = kwargs.pop("tool_choice", None)
+        binding = self.model.bind_tools(tools, tool_choice=tool_choice)
+        return {**kwargs, **binding.kwargs}
+
+    async def agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        tools: Optional[list[dict]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        kwargs = self._bound_kwargs(tools, kwargs)
+        async with self._semaphore:
+            self.stats["requests"] += 1
+            count("llm_requests", backend=self.name)
+            with span("llm.request", backend=self.name) as request_span:
+                try:
+                    result = await asyncio.wait_for(
+                        self.model._agenerate(messages, stop, **kwargs), self.config.timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.stats["timeouts"] += 1
+                    self._record(False)
+                    raise
+                except asyncio.CancelledError:
+                    # Lost a hedge race, which says nothing about the backend.
+                    raise
+                except Exception:
+                    self._record(False)
+                    raise
+                self._record_usage(request_span, result)
+        self._record(True)
+        return result
+
+    def generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        tools: Optional[list[dict]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        kwargs = self._bound_kwargs(tools, kwargs)
+        with self._thread_semaphore:
+            self.stats["requests"] += 1
+            count("llm_requests", backend=self.name)
+            with span("llm.request", backend=self.name) as request_span:
+                try:
+                    result = self.model._generate(messages, stop, **kwargs)
+                except Exception:
+                    self._record(False)
+                    raise
+                self._record_usage(request_span, result)
+        self._record(True)
+        return result
+
+
+class LLMPool(BaseChatModel):
+    """Chat model spreading requests over several backends.
+
+    Requests go to the first backend whose circuit is closed. If no answer
+    arrives within `hedge_after` seconds, a duplicate request is sent to the
+    next backend (or the same one when it is alone) and the first answer
+    wins; the other request is cancelled. A failed or timed out request
+    falls back to the next backend. Backends failing `failure_threshold`
+    times in a row are skipped for `reset_after` seconds.
+
+    Being a chat model, the pool is used wherever one is, including
+    `with_structured_output`, PRSummaryChain and the response cache. Sync
+    calls fall back between backends but are not hedged.
+    """
+
+    backends: list[LLMBackend] = Field(default_factory=list)
+    hedge_after: Optional[float] = Field(default=DEFAULT_HEDGE_AFTER)
+
+    _stats: dict = PrivateAttr(
+        default_factory=lambda: {"requests": 0, "hedges": 0, "fallbacks": 0, "failures": 0}
+    )
+    _config: PoolConfig = PrivateAttr(default_factory=PoolConfig)
+    _build_model: Optional[Callable[[BackendConfig], BaseChatModel]] = PrivateAttr(default=None)
+    _model_pools: dict[str, LLMPool] = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def from_config(
+        cls,
+        config: PoolConfig,
+        build_model: Callable[[BackendConfig], BaseChatModel],
+        **kwargs: Any,
+    ) -> LLMPool:
+        """Build a pool, creating each backend's chat model with `build_model`."""
+        return cls._from_backends(
+            [
+                LLMBackend(
+                    build_model(backend), backend, config.failure_threshold, config.reset_after
+                )
+                for backend in config.backends
+            ],
+            config,
+            build_model,
+            **kwargs,
+        )
+
+    @classmethod
+    def _from_backends(
+        cls,
+        backends: list[LLMBackend],
+        config: PoolConfig,
+        build_model: Callable[[BackendConfig], BaseChatModel],
+        **kwargs: Any,
+    ) -> LLMPool:
+        pool = cls(backends=backends, hedge_after=config.hedge_after, **kwargs)
+        pool._config = config
+        pool._build_model = build_model
+        return pool
+
+    def with_model(self, model: str) -> LLMPool:
+        """A pool answering with `model`, built once per model and sharing this pool's cache.
+
+        The backends of this pool serving `model` are shared, with their
+        concurrency limits and circuits, so workers asking for the same
+        model share them too. Without any, the pool has one backend of
+        `model`. Hedging and circuit settings are this pool's.
+        """
+        if all(backend.config.model == model for backend in self.backends):
+            return self
+        if model not in self._model_pools:
+            if self._build_model is None:
+                raise ValueError("Only pools built by from_config can switch models.")
+            backends = [backend for backend in self.backends if backend.config.model == model]
+            if not backends:
+                config = BackendConfig(model=model)
+                backends = [LLMBackend(
+                    self._build_model(config),
+                    config,
+                    self._config.failure_threshold,
+                    self._config.reset_after,
+                )]
+            self._model_pools[model] = LLMPool._from_backends(
+                backends, self._config, self._build_model, cache=self.cache
+            )
+        return self._model_pools[model]
+
+    @property
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "backends": {backend.name: backend.stats for backend in self.backends},
+        }
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-pool"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        # Identifies cached responses, so only what shapes the answer.
+        return {"backends": [backend.model.dict() for backend in self.backends]}
+
+    def bind_tools(
+        self, tools: Sequence[dict | type | Callable], **kwargs: Any
+    ) -> Runnable:
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _candidates(self) -> list[LLMBackend]:
+        if not self.backends:
+            raise ValueError("LLMPool has no backends.")
+        # With every circuit open, trying anyway beats failing outright.
+        return [backend for backend in self.backends if backend.available] or list(self.backends)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self._stats["requests"] += 1
+        candidates = self._candidates()
+        fallbacks = candidates[1:]
+        pending: dict[asyncio.Future, LLMBackend] = {}
+
+        def start(backend: LLMBackend) -> None:
+            task = asyncio.ensure_future(backend.agenerate(messages, stop, **kwargs))
+            pending[task] = backend
+
+        start(candidates[0])
+        hedged = False
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                timeout = None if hedged else self.hedge_after
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    self._stats["hedges"] += 1
+                    start(fallbacks.pop(0) if fallbacks else candidates[0])
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if not pending and fallbacks:
+                    self._stats["fallbacks"] += 1
+                    hedged = False
+                    start(fallbacks.pop(0))
+        finally:
+            for task in pending:
+                task.cancel()
+            # Collected here, so they do not outlive the call.
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._stats["failures"] += 1
+        raise error
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self._stats["requests"] += 1
+        error: Optional[BaseException] = None
+        for index, backend in enumerate(self._candidates()):
+            if index:
+                self._stats["fallbacks"] += 1
+            try:
+                return backend.generate(messages, stop, **kwargs)
+            except Exception as e:
+                error = e
+        self._stats["failures"] += 1
+        raise error
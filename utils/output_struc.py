@@ -2,6 +2,21 @@ from typing import Optional, List
 from pydantic import BaseModel, Field
 
 
+class Finding(BaseModel):
+    """A potential bug or error located on lines of a changed file."""
+
+    path: str
+    """Full name of the changed file."""
+    line: int
+    """Line number in the new version of the file where the problem is."""
+    end_line: Optional[int] = None
+    """Last line number, when the problem spans several lines."""
+    kind: str
+    """bug for a potential bug, error for code that will fail."""
+    body: str
+    """What is wrong and how to fix it."""
+
+
 class Comment(BaseModel):
     """
     Structure to summarize the details of a Pull Request (PR)
@@ -19,11 +34,3 @@ class Comment(BaseModel):
         description="A list of important files containing major logical changes, applicable for Feature/Refactor PRs.",
     )
     objective: str = Field(description="The objective of the PR.")
-    bugs: Optional[str] = Field(
-        default=None,
-        description="Potential bugs or issues that the reviewer should pay attention to.",
-    )
-    errors: Optional[str] = Field(
-        default=None,
-        description="Discovered errors that will cause code to fail",
-    )
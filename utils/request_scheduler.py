@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Mapping, Optional
+
+PRIORITY_HIGH = 0
+"""Requests a user is waiting on, such as comment writes."""
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+"""Background work, such as batch backfills."""
+
+
+class RequestScheduler:
+    """Token bucket pacing of Github requests, aware of the rate limit headers.
+
+    Requests are released in priority order, then arrival order, at no more
+    than `rate` per second with bursts of up to `burst`. Once less than
+    `low_water` of the rate limit window is left, the rate is lowered so the
+    remaining requests, minus `reserve`, last until the window resets. When
+    Github asks to back off or the reserve is reached, nothing is released
+    until the given time.
+    """
+
+    def __init__(
+        self,
+        rate: float = 10.0,
+        burst: int = 20,
+        reserve: int = 50,
+        low_water: float = 0.2,
+    ):
+        self._rate = rate
+        self._burst = burst
+        self._reserve = reserve
+        self._low_water = low_water
+        self._window_rate = rate
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._condition = asyncio.Condition()
+        self.remaining: Optional[int] = None
+        """Requests remaining in the current rate limit window, as last reported."""
+
+    @property
+    def _effective_rate(self) -> float:
+        return min(self._rate, self._window_rate)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self._burst, self._tokens + (now - self._updated) * self._effective_rate
+        )
+        self._updated = now
+
+    def _wait_time(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self._effective_rate
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL) -> None:
+        """Wait until a request of this priority may be sent."""
+        entry = (priority, next(self._sequence))
+        async with self._condition:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    if self._waiting[0] != entry:
+                        await self._condition.wait()
+                        continue
+                    wait = self._wait_time()
+                    if wait <= 0:
+                        heapq.heappop(self._waiting)
+                        self._tokens -= 1
+                        return
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                raise
+            finally:
+                self._condition.notify_all()
+
+    async def record(self, headers: Mapping[str, str]) -> None:
+        """Update the limits from a response's rate limit headers."""
+        remaining = headers.get("X-RateLimit-Remaining")
+        limit = headers.get("X-RateLimit-Limit")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or limit is None or reset is None:
+            return
+        self.remaining = int(remaining)
+        window = max(1.0, float(reset) - time.time())
+        if self.remaining <= self._reserve:
+            await self.pause(window)
+        elif self.remaining < int(limit) * self._low_water:
+            self._window_rate = (self.remaining - self._reserve) / window
+        else:
+            self._window_rate = self._rate
+
+    async def pause(self, seconds: float) -> None:
+        """Hold back every request for `seconds`."""
+        async with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
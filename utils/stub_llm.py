@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, Optional, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+STUB_MODEL = "stub"
+"""Model name selecting StubChatModel instead of an OpenAI model."""
+
+
+def _stub_value(schema: dict, text: str) -> Any:
+    if "anyOf" in schema:
+        return None
+    kind = schema.get("type")
+    if kind == "string":
+        return text
+    if kind == "array":
+        return []
+    if kind == "object":
+        return _stub_arguments(schema, text)
+    if kind == "boolean":
+        return False
+    if kind in ("integer", "number"):
+        return 0
+    return None
+
+
+def _stub_arguments(parameters: dict, text: str) -> dict:
+    """Arguments filling every required property of a JSON schema."""
+    properties = parameters.get("properties", {})
+    return {
+        name: _stub_value(properties[name], text)
+        for name in parameters.get("required", properties)
+    }
+
+
+class StubChatModel(BaseChatModel):
+    """Offline chat model answering every prompt with a fixed text, for tests.
+
+    Tools bound with `bind_tools`, including the schema of
+    `with_structured_output`, are answered with a call to the first tool
+    whose required string fields hold `response`. `latency` seconds are
+    awaited per async call to stand in for a real model.
+    """
+
+    response: str = "Stub summary."
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return STUB_MODEL
+
+    def bind_tools(
+        self, tools: Sequence[dict | type | Callable], **kwargs: Any
+    ) -> Runnable:
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        tools: Optional[list[dict]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if tools:
+            function = tools[0]["function"]
+            message = AIMessage(
+                content="",
+                tool_calls=[{
+                    "name": function["name"],
+                    "args": _stub_arguments(function.get("parameters", {}), self.response),
+                    "id": "stub",
+                }],
+            )
+        else:
+            message = AIMessage(content=self.response)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._generate(messages, stop, **kwargs)
@@ -0,0 +1,287 @@
+"""Spans and counters describing where a review spends its time.
+
+Code reports through the module functions `span` and `count`, which feed
+the process-wide `telemetry` registry. The registry aggregates span
+durations into histograms and counters by label, which server mode
+exposes in Prometheus text format, and forwards every finished span and
+counter increment to its exporters: a JSON lines file, and OpenTelemetry
+when it is installed. Exporters are configured with `$PR_AGENT_TELEMETRY`,
+a comma separated list such as `jsonl=/tmp/spans.jsonl,otel`.
+"""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_ENV = "PR_AGENT_TELEMETRY"
+
+F = TypeVar("F", bound=Callable)
+
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+"""Upper bounds in seconds of the span duration histograms."""
+
+_ids = itertools.count(1)
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """A timed operation, nested under the span active when it started."""
+
+    __slots__ = ("name", "attributes", "span_id", "parent_id", "trace_id", "start", "duration", "error")
+
+    def __init__(self, name: str, attributes: dict[str, Any], parent: Optional[Span]):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.start = time.time()
+        self.duration = 0.0
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            "type": "span",
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Exporter:
+    """Receives finished spans and counter increments."""
+
+    def export_span(self, span: Span) -> None:
+        pass
+
+    def export_count(self, name: str, value: float, labels: dict[str, str]) -> None:
+        pass
+
+    def close(self, telemetry: Telemetry) -> None:
+        pass
+
+
+class JsonLinesExporter(Exporter):
+    """Appends one json line per span, and the counter totals on close."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def _write(self, data: dict) -> None:
+        line = json.dumps(data, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def export_span(self, span: Span) -> None:
+        self._write(span.to_dict())
+
+    def close(self, telemetry: Telemetry) -> None:
+        for (name, labels), value in telemetry.counters.items():
+            self._write({"type": "counter", "name": name, "labels": dict(labels), "value": value})
+        self._file.close()
+
+
+class OpenTelemetryExporter(Exporter):
+    """Re-emits spans and counters through the OpenTelemetry API.
+
+    The application configures the OpenTelemetry SDK and its exporters;
+    without an SDK the API calls are no-ops.
+    """
+
+    def __init__(self):
+        from opentelemetry import metrics, trace
+
+        self._trace = trace
+        self._tracer = trace.get_tracer("pr-review-agent")
+        self._meter = metrics.get_meter("pr-review-agent")
+        self._counters: dict[str, Any] = {}
+
+    def export_span(self, span: Span) -> None:
+        # Children end before their parents, so parents are not known yet;
+        # the ids are kept as attributes to rebuild the tree.
+        otel_span = self._tracer.start_span(
+            span.name,
+            start_time=int(span.start * 1e9),
+            attributes={
+                **{key: value for key, value in span.attributes.items() if value is not None},
+                "pr_agent.span_id": span.span_id,
+                "pr_agent.parent_id": span.parent_id or 0,
+                "pr_agent.trace_id": span.trace_id,
+            },
+        )
+        if span.error:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int((span.start + span.duration) * 1e9))
+
+    def export_count(self, name: str, value: float, labels: dict[str, str]) -> None:
+        counter = self._counters.get(name)
+        if counter is None:
+            counter = self._counters[name] = self._meter.create_counter(name)
+        counter.add(value, labels)
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Telemetry:
+    """Registry of span duration histograms and counters, with exporters."""
+
+    def __init__(self):
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self.histograms: dict[str, _Histogram] = {}
+        self.exporters: list[Exporter] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time the enclosed block as a span nested under the current one."""
+        span = Span(name, attributes, _current.get())
+        token = _current.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            _current.reset(token)
+            with self._lock:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = _Histogram()
+                histogram.observe(span.duration)
+            for exporter in self.exporters:
+                exporter.export_span(span)
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        for exporter in self.exporters:
+            exporter.export_count(name, value, labels)
+
+    def configure(self, spec: Optional[str] = None) -> None:
+        """Add the exporters listed in `spec`, default `$PR_AGENT_TELEMETRY`."""
+        spec = spec if spec is not None else os.getenv(TELEMETRY_ENV, "")
+        for entry in filter(None, (part.strip() for part in spec.split(","))):
+            kind, _, argument = entry.partition("=")
+            if kind == "jsonl":
+                self.exporters.append(JsonLinesExporter(argument or "telemetry.jsonl"))
+            elif kind == "otel":
+                try:
+                    self.exporters.append(OpenTelemetryExporter())
+                except ImportError:
+                    logger.warning("opentelemetry is not installed, otel telemetry is disabled")
+            else:
+                raise ValueError(f"Unknown telemetry exporter {kind!r}.")
+
+    def close(self) -> None:
+        for exporter in self.exporters:
+            exporter.close(self)
+        self.exporters = []
+
+    def render_prometheus(self, prefix: str = "pr_agent") -> str:
+        """Counters and span duration histograms in Prometheus text format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for (counter_name, labels), value in counters:
+                if counter_name == name:
+                    lines.append(f"{prefix}_{name}_total{_labels(labels)} {value:g}")
+
+        metric = f"{prefix}_span_duration_seconds"
+        if histograms:
+            lines.append(f"# TYPE {metric} histogram")
+        for name, histogram in histograms:
+            cumulative = 0
+            for bound, bucket_count in zip((*BUCKETS, "+Inf"), histogram.counts):
+                cumulative += bucket_count
+                labels = _labels((("span", name), ("le", str(bound))))
+                lines.append(f"{metric}_bucket{labels} {cumulative}")
+            lines.append(f"{metric}_sum{_labels((('span', name),))} {histogram.total:g}")
+            lines.append(f"{metric}_count{_labels((('span', name),))} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+telemetry = Telemetry()
+"""The process-wide registry."""
+
+
+def span(name: str, **attributes: Any):
+    """Time the enclosed block as a span of the process-wide registry."""
+    return telemetry.span(name, **attributes)
+
+
+def count(name: str, value: float = 1, **labels: str) -> None:
+    """Add to a counter of the process-wide registry."""
+    telemetry.count(name, value, **labels)
+
+
+def traced(name: str, **attributes: Any) -> Callable[[F], F]:
+    """Decorate a function or coroutine function to run each call in a span."""
+
+    def decorate(function: F) -> F:
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with telemetry.span(name, **attributes):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with telemetry.span(name, **attributes):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
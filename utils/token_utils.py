@@ -0,0 +1,42 @@
+import math
+import re
+
+# Words, numbers, single punctuation and runs of whitespace containing a newline.
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]|\s*\n\s*")
+
+CHARS_PER_WORD_TOKEN = 4
+"""BPE tokenizers split long identifiers into roughly 4 character pieces."""
+
+
+def _piece_tokens(piece: str) -> int:
+    if piece[0].isalnum():
+        return math.ceil(len(piece) / CHARS_PER_WORD_TOKEN)
+    return 1
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the llm token count of a text without a network-backed tokenizer.
+
+    Counts like a BPE vocabulary would: one token per punctuation character
+    or line break, and one token per 4 characters of a word or number. This
+    is an estimate, so budgets should keep some headroom below the model's
+    context size. tiktoken is not used because it downloads its encodings.
+    """
+    return sum(_piece_tokens(match.group()) for match in _TOKEN_PATTERN.finditer(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, line_boundary: bool = False) -> str:
+    """Cut a text to at most `max_tokens` estimated tokens.
+
+    With `line_boundary`, the cut is moved back to the last complete line
+    when the text has one.
+    """
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        count += _piece_tokens(match.group())
+        if count > max_tokens:
+            truncated = text[: match.start()]
+            if line_boundary and "\n" in truncated:
+                truncated = truncated[: truncated.rindex("\n")]
+            return truncated
+    return text